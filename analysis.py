@@ -1,26 +1,12 @@
-import os
+import argparse
 import mysql.connector
 from datetime import datetime
-from config import DAYS_RECENT, SUCCESS_RATE_THRESHOLD, MIN_ANALYSTS
-
-# Retrieve MySQL password from environment variables
-mdp = os.getenv("MYSQL_MDP")
-if not mdp:
-    raise ValueError("No MySQL password found in environment variables")
-host = os.getenv("MYSQL_HOST")
-if not host:
-    raise ValueError("No Host found in environment variables")
-    
-# Database connection configuration
-db_config = {
-    'user': 'doadmin',
-    'password': mdp,
-    'host': host,
-    'database': 'defaultdb',
-    'port': 25060
-}
+from db import get_connection
+from config import DAYS_RECENT, get_success_rate_threshold
+from price_target_stats import compare_statistics, compute_price_target_statistics, load_analysts_frame, load_ratings_frame
 
 def calculate_price_target_statistics(cursor):
+    success_rate_threshold = get_success_rate_threshold()
     query = f"""
         SELECT 
             r.ticker,
@@ -32,12 +18,12 @@ def calculate_price_target_statistics(cursor):
             COUNT(DISTINCT CASE WHEN r.date >= DATE_SUB(NOW(), INTERVAL {DAYS_RECENT} DAY) THEN r.analyst_name END) AS num_recent_analysts,
             STDDEV(CASE WHEN r.date >= DATE_SUB(NOW(), INTERVAL {DAYS_RECENT} DAY) THEN r.adjusted_pt_current END) AS stddev_price_target_recent,
             AVG(CASE WHEN r.date >= DATE_SUB(NOW(), INTERVAL {DAYS_RECENT} DAY) THEN r.adjusted_pt_current END) AS average_price_target_recent,
-            COUNT(DISTINCT CASE WHEN a.overall_success_rate > {SUCCESS_RATE_THRESHOLD} THEN r.analyst_name END) AS num_high_success_analysts,
-            STDDEV(CASE WHEN a.overall_success_rate > {SUCCESS_RATE_THRESHOLD} THEN r.adjusted_pt_current END) AS stddev_high_success_analysts,
-            AVG(CASE WHEN a.overall_success_rate > {SUCCESS_RATE_THRESHOLD} THEN r.adjusted_pt_current END) AS avg_high_success_analysts,
-            COUNT(DISTINCT CASE WHEN r.date >= DATE_SUB(NOW(), INTERVAL {DAYS_RECENT} DAY) AND a.overall_success_rate > {SUCCESS_RATE_THRESHOLD} THEN r.analyst_name END) AS num_combined_criteria,
-            STDDEV(CASE WHEN r.date >= DATE_SUB(NOW(), INTERVAL {DAYS_RECENT} DAY) AND a.overall_success_rate > {SUCCESS_RATE_THRESHOLD} THEN r.adjusted_pt_current END) AS stddev_combined_criteria,
-            AVG(CASE WHEN r.date >= DATE_SUB(NOW(), INTERVAL {DAYS_RECENT} DAY) AND a.overall_success_rate > {SUCCESS_RATE_THRESHOLD} THEN r.adjusted_pt_current END) AS avg_combined_criteria
+            COUNT(DISTINCT CASE WHEN a.overall_success_rate > {success_rate_threshold} THEN r.analyst_name END) AS num_high_success_analysts,
+            STDDEV(CASE WHEN a.overall_success_rate > {success_rate_threshold} THEN r.adjusted_pt_current END) AS stddev_high_success_analysts,
+            AVG(CASE WHEN a.overall_success_rate > {success_rate_threshold} THEN r.adjusted_pt_current END) AS avg_high_success_analysts,
+            COUNT(DISTINCT CASE WHEN r.date >= DATE_SUB(NOW(), INTERVAL {DAYS_RECENT} DAY) AND a.overall_success_rate > {success_rate_threshold} THEN r.analyst_name END) AS num_combined_criteria,
+            STDDEV(CASE WHEN r.date >= DATE_SUB(NOW(), INTERVAL {DAYS_RECENT} DAY) AND a.overall_success_rate > {success_rate_threshold} THEN r.adjusted_pt_current END) AS stddev_combined_criteria,
+            AVG(CASE WHEN r.date >= DATE_SUB(NOW(), INTERVAL {DAYS_RECENT} DAY) AND a.overall_success_rate > {success_rate_threshold} THEN r.adjusted_pt_current END) AS avg_combined_criteria
         FROM (
             SELECT 
                 ticker,
@@ -143,12 +129,35 @@ def calculate_and_insert_analysis(cursor, target_statistics, closing_prices):
     cursor.executemany(insert_query, analysis_data)
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Refresh the analysis table from ratings and prices.")
+    parser.add_argument("--engine", choices=["pandas", "sql"], default="pandas",
+                        help="Compute price target statistics in-process (pandas) or in MySQL (sql)")
+    parser.add_argument("--validate", action="store_true",
+                        help="Also run the SQL aggregation and report any difference with the pandas engine")
+    return parser.parse_args()
+
+def calculate_price_target_statistics_in_process(cursor, analysis_time):
+    ratings = load_ratings_frame(cursor)
+    analysts = load_analysts_frame(cursor)
+    return compute_price_target_statistics(ratings, analysts, analysis_time, DAYS_RECENT,
+                                           get_success_rate_threshold())
+
 # Script execution
 try:
-    conn = mysql.connector.connect(**db_config)
+    args = parse_args()
+    conn = get_connection()
     cursor = conn.cursor()
 
-    target_statistics = calculate_price_target_statistics(cursor)
+    if args.engine == "sql":
+        target_statistics = calculate_price_target_statistics(cursor)
+    else:
+        target_statistics = calculate_price_target_statistics_in_process(cursor, datetime.now())
+        if args.validate:
+            differences = compare_statistics(calculate_price_target_statistics(cursor), target_statistics)
+            print(f"Validation against SQL: {len(differences)} differences")
+            for difference in differences:
+                print(difference)
     closing_prices = get_last_closing_price(cursor)
 
     calculate_and_insert_analysis(cursor, target_statistics, closing_prices)
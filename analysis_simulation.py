@@ -1,24 +1,12 @@
-import os
+import argparse
 import mysql.connector
 from datetime import datetime, timedelta
-from config import DAYS_RECENT, SUCCESS_RATE_THRESHOLD, MIN_ANALYSTS
-
-# Retrieve MySQL password from environment variables
-mdp = os.getenv("MYSQL_MDP")
-if not mdp:
-    raise ValueError("No MySQL password found in environment variables")
-host = os.getenv("MYSQL_HOST")
-if not host:
-    raise ValueError("No Host found in environment variables")
-
-# Database connection configuration
-db_config = {
-    'user': 'doadmin',
-    'password': mdp,
-    'host': host,
-    'database': 'defaultdb',
-    'port': 25060
-}
+from db import get_connection
+from config import DAYS_RECENT, get_success_rate_threshold
+from analyst_success import PointInTimeAnalystRates
+from price_store import AsOfPriceIndex
+from price_target_stats import (IncrementalPriceTargetStats, compare_statistics, compute_price_target_statistics,
+                                load_analysts_frame, load_ratings_frame, point_in_time_analysts_frame)
 
 def get_latest_simulation_date(cursor):
     """Fetch the latest simulation date from the analysis_simulation table."""
@@ -33,11 +21,25 @@ def get_latest_simulation_date(cursor):
     else:
         return latest_date  # Already a date object, so return as is
 
-def calculate_price_target_statistics(cursor, analysis_date):
+def calculate_price_target_statistics(cursor, analysis_date, point_in_time_rates=None):
     # Ensure analysis_date is passed as a date object
     if isinstance(analysis_date, datetime):
         analysis_date = analysis_date.date()
 
+    if point_in_time_rates is None:
+        success_rate_threshold = get_success_rate_threshold()
+        analysts_join = "JOIN analysts AS a ON r.analyst_name = a.name_full"
+        rates_week = None
+    else:
+        # Success rates known at analysis_date, left-joined like the in-process engines do
+        success_rate_threshold = point_in_time_rates.rates_as_of(analysis_date)[1]
+        if success_rate_threshold is None:
+            # Every high success column would silently be NULL; simulate_portfolio_performance skips these weeks
+            raise ValueError(f"No analyst success rates known as of {analysis_date}")
+        analysts_join = ("LEFT JOIN (SELECT analyst_name AS name_full, success_rate AS overall_success_rate "
+                         "FROM analyst_success_history WHERE date = %(rates_week)s) AS a ON r.analyst_name = a.name_full")
+        rates_week = point_in_time_rates.week_as_of(analysis_date)
+
     # Adjust query to use the specific date for historical simulation
     query = f"""
         SELECT 
@@ -50,12 +52,12 @@ def calculate_price_target_statistics(cursor, analysis_date):
             COUNT(DISTINCT CASE WHEN r.date >= DATE_SUB(%(analysis_date)s, INTERVAL {DAYS_RECENT} DAY) THEN r.analyst_name END) AS num_recent_analysts,
             STDDEV(CASE WHEN r.date >= DATE_SUB(%(analysis_date)s, INTERVAL {DAYS_RECENT} DAY) THEN r.adjusted_pt_current END) AS stddev_price_target_recent,
             AVG(CASE WHEN r.date >= DATE_SUB(%(analysis_date)s, INTERVAL {DAYS_RECENT} DAY) THEN r.adjusted_pt_current END) AS average_price_target_recent,
-            COUNT(DISTINCT CASE WHEN a.overall_success_rate > {SUCCESS_RATE_THRESHOLD} THEN r.analyst_name END) AS num_high_success_analysts,
-            STDDEV(CASE WHEN a.overall_success_rate > {SUCCESS_RATE_THRESHOLD} THEN r.adjusted_pt_current END) AS stddev_high_success_analysts,
-            AVG(CASE WHEN a.overall_success_rate > {SUCCESS_RATE_THRESHOLD} THEN r.adjusted_pt_current END) AS avg_high_success_analysts,
-            COUNT(DISTINCT CASE WHEN r.date >= DATE_SUB(%(analysis_date)s, INTERVAL {DAYS_RECENT} DAY) AND a.overall_success_rate > {SUCCESS_RATE_THRESHOLD} THEN r.analyst_name END) AS num_combined_criteria,
-            STDDEV(CASE WHEN r.date >= DATE_SUB(%(analysis_date)s, INTERVAL {DAYS_RECENT} DAY) AND a.overall_success_rate > {SUCCESS_RATE_THRESHOLD} THEN r.adjusted_pt_current END) AS stddev_combined_criteria,
-            AVG(CASE WHEN r.date >= DATE_SUB(%(analysis_date)s, INTERVAL {DAYS_RECENT} DAY) AND a.overall_success_rate > {SUCCESS_RATE_THRESHOLD} THEN r.adjusted_pt_current END) AS avg_combined_criteria
+            COUNT(DISTINCT CASE WHEN a.overall_success_rate > {success_rate_threshold} THEN r.analyst_name END) AS num_high_success_analysts,
+            STDDEV(CASE WHEN a.overall_success_rate > {success_rate_threshold} THEN r.adjusted_pt_current END) AS stddev_high_success_analysts,
+            AVG(CASE WHEN a.overall_success_rate > {success_rate_threshold} THEN r.adjusted_pt_current END) AS avg_high_success_analysts,
+            COUNT(DISTINCT CASE WHEN r.date >= DATE_SUB(%(analysis_date)s, INTERVAL {DAYS_RECENT} DAY) AND a.overall_success_rate > {success_rate_threshold} THEN r.analyst_name END) AS num_combined_criteria,
+            STDDEV(CASE WHEN r.date >= DATE_SUB(%(analysis_date)s, INTERVAL {DAYS_RECENT} DAY) AND a.overall_success_rate > {success_rate_threshold} THEN r.adjusted_pt_current END) AS stddev_combined_criteria,
+            AVG(CASE WHEN r.date >= DATE_SUB(%(analysis_date)s, INTERVAL {DAYS_RECENT} DAY) AND a.overall_success_rate > {success_rate_threshold} THEN r.adjusted_pt_current END) AS avg_combined_criteria
         FROM (
             SELECT 
                 ticker,
@@ -69,31 +71,10 @@ def calculate_price_target_statistics(cursor, analysis_date):
         ON latest_ratings.ticker = r.ticker 
         AND latest_ratings.analyst_name = r.analyst_name 
         AND latest_ratings.latest_date = r.date
-        JOIN analysts AS a 
-        ON r.analyst_name = a.name_full
+        {analysts_join}
         GROUP BY r.ticker
     """
-    cursor.execute(query, {'analysis_date': analysis_date})
-    return cursor.fetchall()
-
-def get_closing_price_as_of(cursor, analysis_date):
-    # Ensure analysis_date is passed as a date object
-    if isinstance(analysis_date, datetime):
-        analysis_date = analysis_date.date()
-
-    query = """
-        SELECT 
-            ticker,
-            close AS last_closing_price
-        FROM prices
-        WHERE (ticker, date) IN (
-            SELECT ticker, MAX(date) 
-            FROM prices 
-            WHERE date <= %(analysis_date)s
-            GROUP BY ticker
-        )
-    """
-    cursor.execute(query, {'analysis_date': analysis_date})
+    cursor.execute(query, {'analysis_date': analysis_date, 'rates_week': rates_week})
     return cursor.fetchall()
 
 def calculate_and_insert_simulated_analysis(cursor, target_statistics, closing_prices, analysis_date):
@@ -157,8 +138,18 @@ def calculate_and_insert_simulated_analysis(cursor, target_statistics, closing_p
     cursor.executemany(insert_query, analysis_data)
     
 
-def simulate_portfolio_performance():
-    conn = mysql.connector.connect(**db_config)
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Extend the weekly analysis_simulation history.")
+    parser.add_argument("--engine", choices=["incremental", "pandas", "sql"], default="incremental",
+                        help="How weekly price target statistics are computed")
+    parser.add_argument("--validate", action="store_true",
+                        help="Also run the SQL aggregation every week and report any difference")
+    parser.add_argument("--point-in-time", action="store_true",
+                        help="Use the weekly analyst_success_history rates and median instead of today's analysts table")
+    return parser.parse_args(argv)
+
+def simulate_portfolio_performance(engine="incremental", validate=False, point_in_time=False):
+    conn = get_connection()
     cursor = conn.cursor()
 
     # Get the latest date from the simulation table
@@ -170,12 +161,44 @@ def simulate_portfolio_performance():
     current_date = start_date
 
     try:
+        # Load the price history and the ratings once; every week is then computed in memory
+        price_index = AsOfPriceIndex.from_cursor(cursor, until=end_date)
+        point_in_time_rates = PointInTimeAnalystRates.from_cursor(cursor, until=end_date) if point_in_time else None
+        success_rate_threshold = None if point_in_time else get_success_rate_threshold()
+        if engine == "incremental":
+            stats_engine = IncrementalPriceTargetStats.from_cursor(cursor, end_date, DAYS_RECENT, success_rate_threshold,
+                                                                   point_in_time_rates)
+        elif engine == "pandas":
+            ratings = load_ratings_frame(cursor, until=end_date)
+            analysts = None if point_in_time else load_analysts_frame(cursor)
+
         while current_date <= end_date:
+            if point_in_time and point_in_time_rates.rates_as_of(current_date)[1] is None:
+                # No success rate is known yet, so no analyst could count as high success
+                print(f"Skipping {current_date}: no analyst success rates known yet (see analyst_success.py)")
+                current_date += timedelta(weeks=1)
+                continue
             print(f"Running simulation for {current_date}...")
             
             # Calculate statistics and prices as of the current date
-            target_statistics = calculate_price_target_statistics(cursor, current_date)
-            closing_prices = get_closing_price_as_of(cursor, current_date)
+            if engine == "incremental":
+                target_statistics = stats_engine.advance_to(current_date)
+            elif engine == "pandas":
+                if point_in_time:
+                    analysts, success_rate_threshold = point_in_time_analysts_frame(point_in_time_rates, current_date)
+                target_statistics = compute_price_target_statistics(
+                    ratings, analysts, current_date, DAYS_RECENT, success_rate_threshold, as_of=True,
+                    keep_unrated=point_in_time)
+            else:
+                target_statistics = calculate_price_target_statistics(cursor, current_date, point_in_time_rates)
+
+            if validate and engine != "sql":
+                differences = compare_statistics(calculate_price_target_statistics(cursor, current_date, point_in_time_rates),
+                                                 target_statistics)
+                print(f"Validation against SQL for {current_date}: {len(differences)} differences")
+                for difference in differences:
+                    print(difference)
+            closing_prices = price_index.closing_prices_as_of(current_date)
 
             # Insert the analysis results into the simulation table
             calculate_and_insert_simulated_analysis(cursor, target_statistics, closing_prices, current_date)
@@ -198,5 +221,11 @@ def simulate_portfolio_performance():
         cursor.close()
         conn.close()
 
+def main(argv=None):
+    """Script entry point, also called by main.py's pipeline."""
+    args = parse_args(argv)
+    simulate_portfolio_performance(engine=args.engine, validate=args.validate, point_in_time=args.point_in_time)
+
 # Run the simulation
-simulate_portfolio_performance()
+if __name__ == "__main__":
+    main()
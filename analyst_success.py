@@ -0,0 +1,212 @@
+import os
+import argparse
+from datetime import datetime, timedelta
+from statistics import median
+import numpy as np
+import pandas as pd
+from db import get_connection
+from price_store import STALE_PRICE_DAYS, LastValidPriceIndex
+
+# A rating is judged HORIZON_DAYS after it was published: it succeeded when the stock moved from
+# its close on the rating date towards the price target (up for a target above that close, down
+# for a target below it)
+HORIZON_DAYS = int(os.getenv("ANALYST_SUCCESS_HORIZON_DAYS", "365"))
+# Analysts with fewer judged ratings get a NULL success rate (never counted as high success)
+MIN_RESOLVED_RATINGS = int(os.getenv("ANALYST_SUCCESS_MIN_RATINGS", "5"))
+# First weekly snapshot, the first week of analysis_simulation
+HISTORY_START = datetime(2019, 9, 1).date()
+# Entry and exit closes older than this many days (e.g. a delisted ticker) leave the call unjudged
+MAX_PRICE_AGE_DAYS = int(os.getenv("ANALYST_SUCCESS_MAX_PRICE_AGE_DAYS", str(STALE_PRICE_DAYS)))
+
+HISTORY_TABLE = "analyst_success_history"
+
+def ensure_history_table(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {HISTORY_TABLE} (
+            date DATE NOT NULL,
+            analyst_name VARCHAR(255) NOT NULL,
+            resolved_ratings INT NOT NULL,
+            successful_ratings INT NOT NULL,
+            success_rate DECIMAL(7, 4),
+            PRIMARY KEY (date, analyst_name)
+        )
+    """)
+
+def to_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+def load_calls(cursor, rated_after, rated_until):
+    """Ratings with a price target published in (rated_after, rated_until]; rated_after=None means from the start."""
+    query = """
+        SELECT analyst_name, ticker, date, adjusted_pt_current
+        FROM ratings
+        WHERE analyst_name IS NOT NULL AND analyst_name <> '' AND adjusted_pt_current IS NOT NULL
+        AND date <= %s
+    """
+    params = [rated_until]
+    if rated_after is not None:
+        query += " AND date > %s"
+        params.append(rated_after)
+    cursor.execute(query, params)
+    calls = pd.DataFrame(cursor.fetchall(), columns=['analyst_name', 'ticker', 'date', 'price_target'])
+    calls['date'] = pd.to_datetime(calls['date']).dt.normalize()
+    calls['price_target'] = pd.to_numeric(calls['price_target'], errors='coerce').astype('float64')
+    return calls
+
+def judge_calls(calls, price_index):
+    """
+    Add resolved_on (date the outcome becomes known) and success columns, vectorized over all calls.
+
+    Calls whose entry or exit price is unknown or more than MAX_PRICE_AGE_DAYS old, or whose target
+    equals the entry price, are dropped.
+    """
+    rated_on = calls['date'].to_numpy(dtype='datetime64[D]')
+    resolved_on = rated_on + np.timedelta64(HORIZON_DAYS, 'D')
+    tickers = calls['ticker'].to_numpy(dtype=str)
+    entry = price_index.closes_at(tickers, rated_on, MAX_PRICE_AGE_DAYS)
+    exit_ = price_index.closes_at(tickers, resolved_on, MAX_PRICE_AGE_DAYS)
+    direction = np.sign(calls['price_target'].to_numpy() - entry)
+    judged = calls.assign(resolved_on=resolved_on, success=np.sign(exit_ - entry) == direction)
+    return judged[np.isfinite(entry) & np.isfinite(exit_) & (direction != 0)].sort_values('resolved_on')
+
+class RollingAnalystSuccess:
+    """
+    Cumulative per-analyst success counts, advanced week by week.
+
+    Only calls resolved on or before a week count towards that week, so each snapshot uses
+    outcomes known at the time. The state is two counters per analyst, which is what lets a nightly
+    refresh resume from the last stored week instead of recomputing the whole history.
+    """
+
+    def __init__(self, judged_calls, counts=None):
+        self.names = judged_calls['analyst_name'].to_numpy()
+        self.resolved_on = judged_calls['resolved_on'].to_numpy(dtype='datetime64[D]')
+        self.success = judged_calls['success'].to_numpy()
+        self.position = 0
+        self.counts = dict(counts or {})  # analyst_name -> [resolved, successful]
+
+    def advance_to(self, week):
+        """Absorb the calls resolved up to week."""
+        end = int(np.searchsorted(self.resolved_on, np.datetime64(week, 'D'), side='right'))
+        for name, success in zip(self.names[self.position:end].tolist(), self.success[self.position:end].tolist()):
+            entry = self.counts.setdefault(name, [0, 0])
+            entry[0] += 1
+            entry[1] += int(success)
+        self.position = end
+
+    def snapshot(self, week):
+        """(date, analyst_name, resolved, successful, success_rate) rows for every analyst judged so far."""
+        return [(week, name, resolved, successful,
+                 round(successful / resolved, 4) if resolved >= MIN_RESOLVED_RATINGS else None)
+                for name, (resolved, successful) in self.counts.items()]
+
+def load_last_snapshot(cursor):
+    """Last stored week and the counters stored for it, or (None, {}) for an empty table."""
+    cursor.execute(f"SELECT MAX(date) FROM {HISTORY_TABLE}")
+    last_week = cursor.fetchone()[0]
+    if last_week is None:
+        return None, {}
+    cursor.execute(f"SELECT analyst_name, resolved_ratings, successful_ratings FROM {HISTORY_TABLE} WHERE date = %s",
+                   (last_week,))
+    return to_date(last_week), {name: [resolved, successful] for name, resolved, successful in cursor.fetchall()}
+
+def refresh_history(cursor, conn, end_date, rebuild=False):
+    """
+    Extend the weekly history up to end_date, only reading the ratings resolved since the last stored week.
+
+    Ratings ingested after their horizon ended before the last stored week (e.g. by a
+    price_target_history backfill, or prices loaded late) are never picked up by this incremental
+    pass: run with rebuild=True (--rebuild) after such a backfill.
+    """
+    ensure_history_table(cursor)
+    if rebuild:
+        cursor.execute(f"DELETE FROM {HISTORY_TABLE}")
+        conn.commit()
+    last_week, counts = load_last_snapshot(cursor)
+
+    first_week = last_week + timedelta(weeks=1) if last_week else HISTORY_START
+    weeks = []
+    while first_week <= end_date:
+        weeks.append(first_week)
+        first_week += timedelta(weeks=1)
+    if not weeks:
+        print(f"Analyst success history already up to date ({last_week})")
+        return
+
+    horizon = timedelta(days=HORIZON_DAYS)
+    rated_after = last_week - horizon if last_week else None
+    calls = load_calls(cursor, rated_after, weeks[-1] - horizon)
+    price_index = LastValidPriceIndex.from_cursor(cursor, until=weeks[-1]).index
+    judged = judge_calls(calls, price_index)
+    print(f"Judged {len(judged)} of {len(calls)} ratings for {len(weeks)} new weeks from {weeks[0]}")
+
+    rolling = RollingAnalystSuccess(judged, counts)
+    insert_query = f"""
+        INSERT INTO {HISTORY_TABLE} (date, analyst_name, resolved_ratings, successful_ratings, success_rate)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE resolved_ratings = VALUES(resolved_ratings),
+                                successful_ratings = VALUES(successful_ratings),
+                                success_rate = VALUES(success_rate)
+    """
+    for week in weeks:
+        rolling.advance_to(week)
+        rows = rolling.snapshot(week)
+        if rows:
+            cursor.executemany(insert_query, rows)
+        conn.commit()
+    print(f"Stored {len(weeks)} weekly snapshots up to {weeks[-1]} ({len(rolling.counts)} analysts)")
+
+class PointInTimeAnalystRates:
+    """
+    Weekly analyst success rates read from analyst_success_history, for backtests.
+
+    rates_as_of(date) returns the snapshot of the last stored week <= date: {analyst_name: rate}
+    and the median rate of that week, the point-in-time counterpart of config's threshold.
+    """
+
+    def __init__(self, weeks, rates):
+        self.weeks = np.asarray(weeks, dtype='datetime64[D]')
+        self.rates = rates  # one {analyst_name: rate} dict per week
+        self.medians = [median(week_rates.values()) if week_rates else None for week_rates in rates]
+
+    @classmethod
+    def from_cursor(cls, cursor, until=None):
+        query = f"SELECT date, analyst_name, success_rate FROM {HISTORY_TABLE} WHERE success_rate IS NOT NULL"
+        params = ()
+        if until is not None:
+            query += " AND date <= %s"
+            params = (until,)
+        cursor.execute(query + " ORDER BY date", params)
+        weeks, rates = [], []
+        for week, analyst_name, success_rate in cursor.fetchall():
+            week = to_date(week)
+            if not weeks or weeks[-1] != week:
+                weeks.append(week)
+                rates.append({})
+            rates[-1][analyst_name] = float(success_rate)
+        return cls(weeks, rates)
+
+    def week_as_of(self, date):
+        """Last stored week <= date, or None when the history starts later."""
+        i = int(np.searchsorted(self.weeks, np.datetime64(date, 'D'), side='right')) - 1
+        return self.weeks[i].astype(object) if i >= 0 else None
+
+    def rates_as_of(self, date):
+        i = int(np.searchsorted(self.weeks, np.datetime64(date, 'D'), side='right')) - 1
+        if i < 0:
+            return {}, None
+        return self.rates[i], self.medians[i]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the point-in-time analyst success history.")
+    parser.add_argument("--end-date", default=datetime.now().strftime('%Y-%m-%d'), help="Last week to compute (YYYY-MM-DD)")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute the whole history instead of extending it")
+    args = parser.parse_args()
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        refresh_history(cursor, conn, datetime.strptime(args.end_date, '%Y-%m-%d').date(), rebuild=args.rebuild)
+    finally:
+        cursor.close()
+        conn.close()
@@ -1,103 +1,275 @@
 import os
-import requests
+import sys
+import argparse
 import mysql.connector
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from db import get_connection
+from api_replay import REPLAYING
+from http_client import get_json
+from rate_limiter import RateLimiter
 
 # Benzinga API token
 token = os.getenv("BENZINGA_API_KEY")
-if not token:
+# Replay mode serves recorded or generated responses and needs no key
+if not token and not REPLAYING:
     raise ValueError("No API token found in environment variables")
 
-# Retrieve MySQL password from environment variables
-mdp = os.getenv("MYSQL_MDP")
-if not mdp:
-    raise ValueError("No MySQL password found in environment variables")
-host = os.getenv("MYSQL_HOST")
-if not host:
-    raise ValueError("No Host found in environment variables")
-    
-# Database connection configuration
-db_config = {
-    'user': 'doadmin',
-    'password': mdp,
-    'host': host,
-    'database': 'defaultdb',
-    'port': 25060
-}
-
-def fetch_analysts_data(analyst_names):
+ANALYSTS_URL = "https://api.benzinga.com/api/v2.1/calendar/ratings/analysts"
+# Analyst names per Benzinga request, concurrent requests and request rate shared by the workers
+FETCH_BATCH_SIZE = int(os.getenv("ANALYSTS_FETCH_BATCH_SIZE", "50"))
+MAX_WORKERS = int(os.getenv("ANALYSTS_FETCH_WORKERS", "4"))
+REQUESTS_PER_SECOND = float(os.getenv("BENZINGA_REQUESTS_PER_SECOND", "10"))
+# Analysts sent per multi-row INSERT
+WRITE_BATCH_SIZE = int(os.getenv("ANALYSTS_WRITE_BATCH_SIZE", "500"))
+
+# ingest_watermarks row holding the MAX(ratings.updated) covered by the last successful refresh
+WATERMARK_NAME = "analysts.ratings_updated"
+# Rated analyst names Benzinga returned no profile for, with the time of the last attempt
+MISSES_TABLE = "analyst_lookup_misses"
+# An unresolved name is only requested again after this many days (or when it gets a new rating)
+MISS_RETRY_DAYS = int(os.getenv("ANALYSTS_MISS_RETRY_DAYS", "30"))
+
+rate_limiter = RateLimiter(REQUESTS_PER_SECOND)
+
+# Columns of the analysts table, in insert order
+ANALYST_COLUMNS = [
+    'firm_id', 'firm_name', 'id', 'name_first', 'name_full', 'name_last', 'one_month_average_return',
+    'one_year_success_rate', 'two_year_success_rate', 'overall_success_rate', 'smart_score', 'total_ratings_percentile'
+]
+UPDATE_COLUMNS = [column for column in ANALYST_COLUMNS if column not in ('firm_id', 'id')]
+
+def fetch_analysts_batch(batch):
+    """Fetch the profiles of one batch of analyst names. Runs on a worker thread and never touches the DB."""
+    querystring = {"token": token, "analyst_name": ",".join(batch)}
+    return get_json(ANALYSTS_URL, params=querystring, throttle=rate_limiter.wait).get('analyst_ratings_analyst', [])
+
+def fetch_analysts_data(analyst_names, max_workers=MAX_WORKERS, batch_size=FETCH_BATCH_SIZE):
+    """
+    Fetch analyst profiles in concurrent batches, at most REQUESTS_PER_SECOND requests per second.
+
+    Returns (analysts_data, names of the failed batches).
+    """
+    batches = [analyst_names[start:start + batch_size] for start in range(0, len(analyst_names), batch_size)]
     analysts_data = []
-    for start in range(0, len(analyst_names), 50):
-        batch = analyst_names[start:start+50]
-        url = "https://api.benzinga.com/api/v2.1/calendar/ratings/analysts"
-        querystring = {"token": token, "analyst_name": ",".join(batch)}
-        response = requests.get(url, params=querystring)
-        if response.status_code == 200:
-            analysts_data.extend(response.json().get('analyst_ratings_analyst', []))
-        else:
-            print(f"Error fetching data: {response.status_code}")
-    return analysts_data
+    failed_names = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(fetch_analysts_batch, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            try:
+                analysts_data.extend(future.result())
+            except Exception as e:
+                failed_names.extend(futures[future])
+                print(f"Error fetching data for {len(futures[future])} analysts: {e}")
+    return analysts_data, failed_names
+
+def unresolved_names(analyst_names, analysts_data, failed_names):
+    """Requested names no profile came back for, leaving out the ones whose request failed."""
+    # Compared case-insensitively, like MySQL's default collation joins them
+    returned = {clean_data(analyst.get('name_full')).casefold() for analyst in analysts_data}
+    skipped = {name.casefold() for name in failed_names}
+    return [name for name in analyst_names if name.casefold() not in returned and name.casefold() not in skipped]
 
 def clean_data(value, default=''):
-    return value.strip() if value else default
-
-def insert_analysts_data(cursor, analysts_data):
-    add_analyst = ("INSERT INTO analysts (firm_id, firm_name, id, name_first, name_full, name_last, "
-                   "one_month_average_return, one_year_success_rate, two_year_success_rate, overall_success_rate, smart_score, total_ratings_percentile) "
-                   "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) "
-                   "ON DUPLICATE KEY UPDATE "
-                   "firm_name = VALUES(firm_name), "
-                   "name_first = VALUES(name_first), "
-                   "name_full = VALUES(name_full), "
-                   "name_last = VALUES(name_last), "
-                   "one_month_average_return = VALUES(one_month_average_return), "
-                   "one_year_success_rate = VALUES(one_year_success_rate), "
-                   "two_year_success_rate = VALUES(two_year_success_rate), "
-                   "overall_success_rate = VALUES(overall_success_rate), "
-                   "smart_score = VALUES(smart_score), "
-                   "total_ratings_percentile = VALUES(total_ratings_percentile)")
+    return str(value).strip() if value is not None and value != '' else default
+
+def to_float(value):
+    """Accuracy figures may be missing or null; both are stored as 0."""
+    return float(value) if value is not None else 0.0
 
+def analyst_row(analyst):
+    """Turn a Benzinga analyst dict into a row tuple ordered like ANALYST_COLUMNS."""
+    ratings_accuracy = analyst.get('ratings_accuracy') or {}
+    return (
+        clean_data(analyst.get('firm_id')),
+        clean_data(analyst.get('firm_name')),
+        clean_data(analyst.get('id')),
+        clean_data(analyst.get('name_first')),
+        clean_data(analyst.get('name_full')),
+        clean_data(analyst.get('name_last')),
+        to_float(ratings_accuracy.get('1m_average_return')),
+        to_float(ratings_accuracy.get('1y_success_rate')),
+        to_float(ratings_accuracy.get('2y_success_rate')),
+        to_float(ratings_accuracy.get('overall_success_rate')),
+        to_float(ratings_accuracy.get('smart_score')),
+        to_float(ratings_accuracy.get('total_ratings_percentile'))
+    )
+
+def build_upsert_query(num_rows):
+    """Build a multi-row INSERT ... ON DUPLICATE KEY UPDATE statement for num_rows analysts."""
+    row_placeholder = "(" + ", ".join(["%s"] * len(ANALYST_COLUMNS)) + ")"
+    updates = ", ".join(f"{column} = VALUES({column})" for column in UPDATE_COLUMNS)
+    return (f"INSERT INTO analysts ({', '.join(ANALYST_COLUMNS)}) "
+            f"VALUES {', '.join([row_placeholder] * num_rows)} "
+            f"ON DUPLICATE KEY UPDATE {updates}")
+
+def insert_analysts_data(cursor, analysts_data, batch_size=WRITE_BATCH_SIZE):
+    """
+    Upsert analyst profiles in multi-row batches.
+
+    A failed batch is retried one row at a time so a bad profile only skips itself.
+    Returns (stored, failed) analyst counts.
+    """
+    # Keep the last copy of each analyst so a batch never holds the same key twice
+    rows_by_key = {}
+    failed = 0
     for analyst in analysts_data:
-        ratings_accuracy = analyst.get('ratings_accuracy', {})
-        data_tuple = (
-            clean_data(analyst.get('firm_id')),
-            clean_data(analyst.get('firm_name')),
-            clean_data(analyst.get('id')),
-            clean_data(analyst.get('name_first')),
-            clean_data(analyst.get('name_full')),
-            clean_data(analyst.get('name_last')),
-            float(ratings_accuracy.get('1m_average_return', 0)),
-            float(ratings_accuracy.get('1y_success_rate', 0)),
-            float(ratings_accuracy.get('2y_success_rate', 0)),
-            float(ratings_accuracy.get('overall_success_rate', 0)),
-            float(ratings_accuracy.get('smart_score', 0)),
-            float(ratings_accuracy.get('total_ratings_percentile', 0))
-        )
-        
         try:
-            print(f"Inserting data tuple: {data_tuple}")  # Print data tuple before inserting
-            cursor.execute(add_analyst, data_tuple)
+            row = analyst_row(analyst)
+        except (ValueError, TypeError, AttributeError) as e:
+            failed += 1
+            print(f"Skipping malformed analyst {analyst.get('name_full')!r}: {e}")
+            continue
+        rows_by_key[(row[0], row[2])] = row
+    rows = list(rows_by_key.values())
+
+    stored = 0
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        try:
+            cursor.execute(build_upsert_query(len(batch)), [value for row in batch for value in row])
+            stored += len(batch)
+            continue
         except mysql.connector.Error as err:
-            print(f"Error: {err}")
-            print(f"SQL Query: {cursor.statement}")
-            print(f"Data tuple: {data_tuple}")
-
-def get_unique_analyst_names(cursor):
-    cursor.execute("SELECT DISTINCT analyst_name FROM ratings")
-    analyst_names = [row[0] for row in cursor.fetchall()]
-    print(f"Unique analysts found: {len(analyst_names)}")
-    print("Analyst names:", analyst_names)
-    return analyst_names
-
-# Script execution
-conn = mysql.connector.connect(**db_config)
-cursor = conn.cursor()
-
-analyst_names = get_unique_analyst_names(cursor)
-if analyst_names:
-    analysts_data = fetch_analysts_data(analyst_names)
-    insert_analysts_data(cursor, analysts_data)
-
-conn.commit()
-cursor.close()
-conn.close()
+            print(f"Batch of {len(batch)} analysts failed ({err}), retrying one by one")
+        query = build_upsert_query(1)
+        for row in batch:
+            try:
+                cursor.execute(query, row)
+                stored += 1
+            except mysql.connector.Error as err:
+                failed += 1
+                print(f"Error inserting analyst {row[4]!r} ({row[2]}): {err}")
+    return stored, failed
+
+def ensure_watermark_table(cursor):
+    """Create the table recording how far each incremental ingest has read its source."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_watermarks (
+            name VARCHAR(64) PRIMARY KEY,
+            watermark VARCHAR(64),
+            updated_at DATETIME
+        )
+    """)
+
+def ensure_misses_table(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {MISSES_TABLE} (
+            analyst_name VARCHAR(255) PRIMARY KEY,
+            attempts INT,
+            attempted_at DATETIME
+        )
+    """)
+
+def record_misses(cursor, analyst_names):
+    """Remember names Benzinga did not resolve so get_changed_analyst_names waits before asking again."""
+    if not analyst_names:
+        return
+    cursor.execute(
+        f"INSERT INTO {MISSES_TABLE} (analyst_name, attempts, attempted_at) VALUES "
+        + ", ".join(["(%s, 1, NOW())"] * len(analyst_names))
+        + " ON DUPLICATE KEY UPDATE attempts = attempts + 1, attempted_at = VALUES(attempted_at)",
+        list(analyst_names))
+
+def load_watermark(cursor, name):
+    cursor.execute("SELECT watermark FROM ingest_watermarks WHERE name = %s", (name,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def save_watermark(cursor, name, watermark):
+    cursor.execute("""
+        INSERT INTO ingest_watermarks (name, watermark, updated_at)
+        VALUES (%s, %s, NOW())
+        ON DUPLICATE KEY UPDATE watermark = VALUES(watermark), updated_at = VALUES(updated_at)
+    """, (name, str(watermark)))
+
+def get_changed_analyst_names(cursor, since, until):
+    """
+    Analysts with a rating updated in (since, until], plus every rated analyst without an analysts
+    row yet; since=None means every analyst.
+
+    The second part picks up analysts only seen in backfilled ratings, whose updated values are
+    older than the watermark, and analysts whose profile could not be stored by an earlier run.
+    Names Benzinga did not resolve (see record_misses) are left out of it for MISS_RETRY_DAYS.
+    """
+    query = """
+        SELECT DISTINCT analyst_name
+        FROM ratings
+        WHERE analyst_name IS NOT NULL AND analyst_name <> '' AND updated <= %s
+    """
+    params = [until]
+    if since is not None:
+        query += f""" AND updated > %s
+            UNION
+            SELECT DISTINCT r.analyst_name
+            FROM ratings r
+            LEFT JOIN analysts a ON a.name_full = r.analyst_name
+            LEFT JOIN {MISSES_TABLE} m ON m.analyst_name = r.analyst_name
+            WHERE r.analyst_name IS NOT NULL AND r.analyst_name <> '' AND a.name_full IS NULL
+            AND (m.attempted_at IS NULL OR m.attempted_at < NOW() - INTERVAL %s DAY)
+        """
+        params.extend([since, MISS_RETRY_DAYS])
+    cursor.execute(query, params)
+    return [row[0] for row in cursor.fetchall()]
+
+def refresh_analysts(full=False, max_workers=MAX_WORKERS):
+    """
+    Refresh the profiles of the analysts whose ratings changed since the last run.
+
+    The watermark does not move when a request failed, so those analysts are fetched again by the
+    next run. Profiles that cannot be parsed or stored are logged and do not hold the watermark
+    back (a bad profile would otherwise be refetched forever); analysts left without an analysts
+    row are retried anyway by get_changed_analyst_names, names Benzinga returned nothing for only
+    every MISS_RETRY_DAYS.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        ensure_watermark_table(cursor)
+        ensure_misses_table(cursor)
+        conn.commit()
+
+        # Read the upper bound first: ratings updated while this run fetches are left to the next one
+        cursor.execute("SELECT MAX(updated) FROM ratings")
+        until = cursor.fetchone()[0]
+        if until is None:
+            print("No ratings stored yet.")
+            return
+        since = None if full else load_watermark(cursor, WATERMARK_NAME)
+
+        analyst_names = get_changed_analyst_names(cursor, since, until)
+        print(f"Analysts with ratings updated since {since or 'the start'}: {len(analyst_names)}")
+        if analyst_names:
+            analysts_data, failed_names = fetch_analysts_data(analyst_names, max_workers)
+            stored, failed_rows = insert_analysts_data(cursor, analysts_data)
+            misses = unresolved_names(analyst_names, analysts_data, failed_names)
+            record_misses(cursor, misses)
+            print(f"Stored {stored} analyst profiles ({len(failed_names)} analysts in failed requests, "
+                  f"{failed_rows} failed analysts, {len(misses)} not found)")
+            if failed_names:
+                print(f"Watermark kept at {since}: the next run refreshes these analysts again")
+                conn.commit()
+                return
+
+        save_watermark(cursor, WATERMARK_NAME, until)
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Refresh the Benzinga profiles of analysts with updated ratings.")
+    parser.add_argument("--full", action="store_true", help="Refresh every analyst instead of the changed ones")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="Number of concurrent Benzinga requests")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Script entry point, also called by main.py's pipeline."""
+    args = parse_args(argv)
+    try:
+        refresh_analysts(full=args.full, max_workers=args.workers)
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        sys.exit(1)
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from datetime import datetime, timedelta
+import requests
+
+# API_MODE=live (default) calls the APIs. API_MODE=record also saves every response as a cassette.
+# API_MODE=replay never touches the network: it serves the recorded cassette of a request, or a
+# generated response for requests that were never recorded, so ingestion runs offline.
+API_MODE = os.getenv("API_MODE", "live")
+CASSETTE_DIR = os.getenv("API_CASSETTE_DIR", "cache/cassettes")
+# Simulated API behaviour in replay mode: mean latency (ms, uniformly spread over 0.5x-1.5x) and
+# the share of requests failing with a 503
+REPLAY_LATENCY_MS = float(os.getenv("API_REPLAY_LATENCY_MS", "0"))
+REPLAY_ERROR_RATE = float(os.getenv("API_REPLAY_ERROR_RATE", "0"))
+# Seed of the simulated latency and errors (generated payloads only depend on the request)
+REPLAY_SEED = os.getenv("API_REPLAY_SEED")
+
+# Number of synthetic analysts behind the generated ratings
+FAKE_ANALYSTS = 200
+
+if API_MODE not in ("live", "record", "replay"):
+    raise ValueError(f"Unknown API_MODE {API_MODE!r}: expected live, record or replay")
+
+REPLAYING = API_MODE == "replay"
+
+_random = random.Random(REPLAY_SEED)
+_random_lock = threading.Lock()
+
+def cassette_path(key_path):
+    """Cassette file of a request, named like its http_client cache file."""
+    return os.path.join(CASSETTE_DIR, os.path.basename(key_path))
+
+def record(key_path, endpoint, params, body):
+    os.makedirs(CASSETTE_DIR, exist_ok=True)
+    path = cassette_path(key_path)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({'endpoint': endpoint, 'params': params, 'body': body}, f, default=str)
+    os.replace(tmp_path, path)
+
+def replay(key_path, endpoint, params):
+    """Recorded or generated body for a request, after the simulated latency; may raise a simulated 503."""
+    with _random_lock:
+        delay = REPLAY_LATENCY_MS * _random.uniform(0.5, 1.5) / 1000
+        failed = _random.random() < REPLAY_ERROR_RATE
+    if delay:
+        time.sleep(delay)
+    if failed:
+        raise requests.exceptions.HTTPError(f"503 Server Error: simulated failure for {endpoint}")
+
+    try:
+        with open(cassette_path(key_path)) as f:
+            return json.load(f)['body']
+    except (OSError, ValueError, KeyError):
+        return generate(endpoint, params, key_path)
+
+def request_random(key_path):
+    """Random generator seeded by the request, so a replayed request always gets the same payload."""
+    return random.Random(os.path.basename(key_path))
+
+def fake_price(symbol, rng):
+    base = 20 + int(hashlib.sha256(symbol.encode()).hexdigest(), 16) % 480
+    return round(base * rng.uniform(0.97, 1.03), 2)
+
+def fake_analyst_name(i):
+    return f"Analyst {i:03d}"
+
+def generate_bulkquotes(params, rng):
+    symbols = params['symbols'].split(',')
+    now = int(time.time())
+    return {'s': 'ok', 'symbol': symbols, 'last': [fake_price(symbol, rng) for symbol in symbols],
+            'updated': [now] * len(symbols)}
+
+def generate_index_quote(endpoint, rng):
+    symbol = endpoint.rstrip('/').rsplit('/', 1)[-1]
+    return {'s': 'ok', 'symbol': [symbol], 'last': [round(5000 * rng.uniform(0.97, 1.03), 2)],
+            'updated': [int(time.time())]}
+
+def generate_analysts(params, rng):
+    analysts = []
+    for name in params['analyst_name'].split(','):
+        firm = rng.randrange(40)
+        analysts.append({
+            'id': hashlib.sha256(name.encode()).hexdigest()[:24],
+            'firm_id': f"firm{firm:02d}",
+            'firm_name': f"Firm {firm:02d}",
+            'name_first': name.split(' ')[0],
+            'name_last': name.split(' ')[-1],
+            'name_full': name,
+            'ratings_accuracy': {
+                '1m_average_return': round(rng.uniform(-5, 5), 2),
+                '1y_success_rate': round(rng.uniform(20, 80), 2),
+                '2y_success_rate': round(rng.uniform(20, 80), 2),
+                'overall_success_rate': round(rng.uniform(20, 80), 2),
+                'smart_score': round(rng.uniform(0, 100), 2),
+                'total_ratings_percentile': round(rng.uniform(0, 100), 2),
+            },
+        })
+    return {'analyst_ratings_analyst': analysts}
+
+def generate_ratings(params, rng):
+    """About one rating per ticker every ten days of the requested window."""
+    date_from = datetime.strptime(params['date_from'], '%Y-%m-%d')
+    date_to = datetime.strptime(params['date_to'], '%Y-%m-%d')
+    ratings = []
+    for ticker in params['company_tickers'].split(','):
+        day = date_from + timedelta(days=rng.randrange(10))
+        while day <= date_to:
+            analyst = rng.randrange(FAKE_ANALYSTS)
+            price = fake_price(ticker, rng)
+            pt_prior = round(price * rng.uniform(0.8, 1.3), 2)
+            pt_current = round(pt_prior * rng.uniform(0.85, 1.2), 2)
+            rating_id = hashlib.sha256(f"{ticker}{day:%Y%m%d}{analyst}".encode()).hexdigest()[:24]
+            ratings.append({
+                'id': rating_id, 'action_company': rng.choice(['Maintains', 'Upgrades', 'Downgrades']),
+                'action_pt': 'Raises' if pt_current >= pt_prior else 'Lowers',
+                'adjusted_pt_current': pt_current, 'adjusted_pt_prior': pt_prior,
+                'analyst': f"Firm {analyst % 40:02d}", 'analyst_name': fake_analyst_name(analyst),
+                'currency': 'USD', 'date': day.strftime('%Y-%m-%d'), 'exchange': 'NYSE', 'importance': 0,
+                'name': ticker, 'notes': '', 'pt_current': pt_current, 'pt_prior': pt_prior,
+                'rating_current': 'Buy', 'rating_prior': 'Buy', 'ticker': ticker, 'time': '08:00:00',
+                'updated': int(day.timestamp()), 'url': '', 'url_calendar': '', 'url_news': '',
+            })
+            day += timedelta(days=rng.randrange(5, 16))
+    return {'ratings': ratings}
+
+def generate(endpoint, params, key_path):
+    """Synthetic response shaped like the real one for each endpoint the ingestion scripts call."""
+    rng = request_random(key_path)
+    if endpoint.endswith('/stocks/bulkquotes/'):
+        return generate_bulkquotes(params, rng)
+    if '/indices/quotes/' in endpoint:
+        return generate_index_quote(endpoint, rng)
+    if endpoint.endswith('/calendar/ratings/analysts'):
+        return generate_analysts(params, rng)
+    if endpoint == 'benzinga:ratings':
+        return generate_ratings(params, rng)
+    raise ValueError(f"No recording and no generator for {endpoint} in replay mode")
@@ -0,0 +1,237 @@
+import argparse
+import mysql.connector
+from datetime import datetime, timedelta
+import numpy as np
+from db import get_connection
+from config import MIN_ANALYSTS, MAX_STDDEV
+from portfolio_tables import update_sell_fields
+from price_store import LastValidPriceIndex
+from valuation import (PRICE_PLACES, QUANTITY_PLACES, VALUE_PLACES, buy_basket, sell_basket,
+                       to_array, to_decimals)
+
+# First rebalancing date of every simulated portfolio, then one rebalance per week
+START_DATE = datetime(2021, 1, 17).date()
+INITIAL_VALUE = 100.0
+
+# Strategy specs, keyed by the table each one is written to.
+#   top_n: number of stocks bought each week (highest expected_return_combined_criteria first)
+#   min_expected_return: optional floor on expected_return_combined_criteria (in %)
+#   weighting: 'fixed' splits the value in top_n slots even when fewer stocks qualify and keeps
+#              the unfilled slots in cash, 'equal' splits it between the stocks actually selected
+STRATEGIES = {
+    'portfolio_simulation': {'top_n': 10, 'min_expected_return': None, 'weighting': 'fixed'},
+    'portfolio_simulation_bullish': {'top_n': 5, 'min_expected_return': None, 'weighting': 'fixed'},
+    'portfolio_simulation_super_bullish': {'top_n': 1, 'min_expected_return': None, 'weighting': 'fixed'},
+    'portfolio_min': {'top_n': 10, 'min_expected_return': 20, 'weighting': 'equal'},
+}
+
+def weekly_dates(start_date, end_date):
+    dates = []
+    current_date = start_date
+    while current_date <= end_date:
+        dates.append(current_date)
+        current_date += timedelta(weeks=1)
+    return dates
+
+def load_analysis_snapshots(cursor, start_date, end_date):
+    """Load every weekly analysis_simulation candidate in one query: {date: [rows, best first]}."""
+    cursor.execute("""
+        SELECT date, ticker, expected_return_combined_criteria, last_closing_price,
+               num_combined_criteria, stddev_combined_criteria
+        FROM analysis_simulation
+        WHERE date BETWEEN %s AND %s
+        AND num_combined_criteria >= %s
+        AND stddev_combined_criteria <= %s
+    """, (start_date, end_date, MIN_ANALYSTS, MAX_STDDEV))
+    snapshots = {}
+    for date, ticker, expected_return, last_closing_price, num_analysts, stddev in cursor.fetchall():
+        date = date.date() if isinstance(date, datetime) else date
+        snapshots.setdefault(date, []).append((ticker, expected_return, last_closing_price))
+    # Same order as ORDER BY expected_return_combined_criteria DESC (NULLs last)
+    for rows in snapshots.values():
+        rows.sort(key=lambda row: (row[1] is None, -(row[1] or 0)))
+    return snapshots
+
+def select_portfolio(candidates, strategy):
+    """Pick the stocks a strategy buys from one week's ranked candidates: (tickers, float64 prices)."""
+    floor = strategy['min_expected_return']
+    tickers, prices = [], []
+    for ticker, expected_return, last_closing_price in candidates:
+        if floor is not None and (expected_return is None or expected_return < floor):
+            continue
+        if not last_closing_price:
+            continue
+        tickers.append(ticker)
+        prices.append(float(last_closing_price))
+        if len(tickers) == strategy['top_n']:
+            break
+    return tickers, np.array(prices, dtype='float64')
+
+def sell_prices(tickers, date, last_valid):
+    """Last non-zero close known at date for each holding (the as-of close unless it is missing or zero)."""
+    closes, _, _ = last_valid.lookup(date, tickers)
+    last_valid.report_stale(date, tickers)
+    return np.nan_to_num(closes, nan=0.0)
+
+def basket_rows(basket):
+    """Turn a float64 basket into portfolio table rows, converting to Decimal only here."""
+    count = len(basket['tickers'])
+    sold = basket.get('sell_values')
+    date_sell = basket.get('date_sell')
+    columns = [
+        [basket['date']] * count,
+        list(range(1, count + 1)),
+        basket['tickers'],
+        to_decimals(basket['prices'], PRICE_PLACES),
+        to_decimals(basket['quantities'], QUANTITY_PLACES),
+        to_decimals(basket['values'], VALUE_PLACES),
+        [date_sell] * count,
+        to_decimals(basket['sell_prices'], PRICE_PLACES) if sold is not None else [None] * count,
+        to_decimals(sold, VALUE_PLACES) if sold is not None else [None] * count,
+        to_decimals(basket['evolution'], VALUE_PLACES) if sold is not None else [None] * count,
+    ]
+    return [list(row) for row in zip(*columns)]
+
+def sell_rows(basket):
+    """(date, ticker, date_sell, stock_price_sell, total_value_sell, evolution) rows of a sold basket."""
+    count = len(basket['tickers'])
+    return list(zip([basket['date']] * count, basket['tickers'], [basket['date_sell']] * count,
+                    to_decimals(basket['sell_prices'], PRICE_PLACES),
+                    to_decimals(basket['sell_values'], VALUE_PLACES),
+                    to_decimals(basket['evolution'], VALUE_PLACES)))
+
+def load_last_basket(cursor, table):
+    """The basket bought on a table's last simulated date, marked as already stored (None for an empty table)."""
+    cursor.execute(f"SELECT MAX(date) FROM {table}")
+    last_date = cursor.fetchone()[0]
+    if last_date is None:
+        return None
+    cursor.execute(f"SELECT ticker, stock_price, quantity, total_value FROM {table} WHERE date = %s ORDER BY ranking",
+                   (last_date,))
+    rows = cursor.fetchall()
+    return {
+        'date': last_date.date() if isinstance(last_date, datetime) else last_date,
+        'tickers': [row[0] for row in rows],
+        'prices': to_array(row[1] for row in rows),
+        'quantities': to_array(row[2] for row in rows),
+        'values': to_array(row[3] for row in rows),
+        'stored': True,
+    }
+
+def uninvested_cash(basket, strategy):
+    """Cash a basket left aside: the unfilled slots of a 'fixed' basket, each worth one stock's value."""
+    if 'cash' in basket:
+        return basket['cash']
+    if strategy['weighting'] != 'fixed' or not len(basket['values']):
+        return 0.0
+    return float(np.nanmean(basket['values'])) * (strategy['top_n'] - len(basket['tickers']))
+
+def simulate_strategies(strategies, dates, snapshots, last_valid, held=None):
+    """
+    Run every strategy over the same weeks, sharing one price lookup per week.
+
+    Baskets are valued with float64 arrays (valuation.py). held optionally maps a table to the
+    basket it holds already (see load_last_basket): that table then resumes after the basket's
+    date instead of starting with INITIAL_VALUE. Value not invested in a basket (see
+    uninvested_cash) is carried to the next week as cash. Returns {table: [basket, ...]}, oldest
+    first.
+    """
+    held = held or {}
+    baskets = {table: [held[table]] if held.get(table) else [] for table in strategies}
+    resume_after = {table: held[table]['date'] for table in strategies if held.get(table)}
+    values = {table: INITIAL_VALUE for table in strategies}
+    cash = {table: uninvested_cash(held[table], strategy) if held.get(table) else 0.0
+            for table, strategy in strategies.items()}
+
+    for date in dates:
+        candidates = snapshots.get(date, [])
+
+        for table, strategy in strategies.items():
+            if table in resume_after and date <= resume_after[table]:
+                continue  # already simulated
+
+            current = baskets[table][-1] if baskets[table] else None
+            if current is not None:
+                # Sell the basket bought last time at this week's prices
+                prices = sell_prices(current['tickers'], date, last_valid)
+                current['sell_values'], current['evolution'] = sell_basket(current['quantities'], current['values'], prices)
+                current['sell_prices'], current['date_sell'] = prices, date
+                values[table] = current['sell_values'].sum() + cash[table]
+
+            tickers, prices = select_portfolio(candidates, strategy)
+            if not tickers:
+                continue  # keep holding the previous basket
+
+            slots = strategy['top_n'] if strategy['weighting'] == 'fixed' else None
+            quantities, allocated = buy_basket(values[table], prices, slots)
+            cash[table] = values[table] - allocated.sum()
+            baskets[table].append({'date': date, 'tickers': tickers, 'prices': prices,
+                                   'quantities': quantities, 'values': allocated, 'cash': cash[table]})
+
+    return baskets
+
+def write_baskets(cursor, table, baskets, rebuild_from=None):
+    """
+    Store simulated baskets: sell fields of the already stored basket are updated in place, new
+    baskets are inserted. With rebuild_from the table's history from that date is replaced.
+    """
+    if rebuild_from is not None:
+        cursor.execute(f"DELETE FROM {table} WHERE date >= %s", (rebuild_from,))
+    for basket in baskets:
+        if basket.get('stored') and 'date_sell' in basket:
+            update_sell_fields(cursor, table, sell_rows(basket))
+    rows = [tuple(row) for basket in baskets if not basket.get('stored') for row in basket_rows(basket)]
+    cursor.executemany(f"""
+        INSERT INTO {table} (date, ranking, ticker, stock_price, quantity, total_value,
+                             date_sell, stock_price_sell, total_value_sell, evolution)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, rows)
+    return len(rows)
+
+def run_backtests(tables=None, start_date=START_DATE, end_date=None, rebuild=False):
+    """
+    Simulate the requested strategies (all of them by default) in a single pass and store them.
+
+    By default each table resumes from its last simulated date and holdings, so a scheduled run
+    only simulates the new weeks; rebuild=True recomputes everything from start_date.
+    """
+    strategies = {table: STRATEGIES[table] for table in (tables or STRATEGIES)}
+    end_date = end_date or datetime.now().date()
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        held = {} if rebuild else {table: load_last_basket(cursor, table) for table in strategies}
+        first_date = min((basket['date'] + timedelta(weeks=1) if basket else start_date)
+                         for basket in (held.get(table) for table in strategies))
+        dates = [date for date in weekly_dates(start_date, end_date) if date >= first_date]
+        if not dates:
+            print(f"Strategies already simulated up to {end_date}")
+            return
+
+        # Load prices and analysis snapshots once for every strategy and every week
+        last_valid = LastValidPriceIndex.from_cursor(cursor, until=end_date)
+        snapshots = load_analysis_snapshots(cursor, dates[0], end_date)
+        print(f"Simulating {len(strategies)} strategies over {len(dates)} weeks from {dates[0]}")
+
+        baskets = simulate_strategies(strategies, dates, snapshots, last_valid, held)
+        for table, table_baskets in baskets.items():
+            inserted = write_baskets(cursor, table, table_baskets, rebuild_from=start_date if rebuild else None)
+            conn.commit()
+            print(f"Stored {inserted} new rows in {table}")
+    except mysql.connector.Error as err:
+        print(f"Database error: {err}")
+        conn.rollback()
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        conn.rollback()
+    finally:
+        cursor.close()
+        conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest portfolio strategies over analysis_simulation.")
+    parser.add_argument("--strategies", help=f"Comma-separated strategy tables (default: all of {', '.join(STRATEGIES)})")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute the whole history instead of resuming")
+    args = parser.parse_args()
+    run_backtests(args.strategies.split(",") if args.strategies else None, rebuild=args.rebuild)
@@ -3,34 +3,20 @@ import sys
 import mysql.connector
 from openai import OpenAI
 from datetime import datetime, timedelta
+from db import get_connection
 
-# Retrieve API keys and MySQL credentials
+# Retrieve API keys
 chatgpt_key = os.getenv("CHATGPT_KEY")
-mdp = os.getenv("MYSQL_MDP")
-host = os.getenv("MYSQL_HOST")
 
 if not chatgpt_key:
     raise ValueError("No ChatGPT key found in environment variables")
-if not mdp:
-    raise ValueError("No MySQL password found in environment variables")
-if not host:
-    raise ValueError("No Host found in environment variables")
-
-# Database connection configuration
-db_config = {
-    'user': 'doadmin',
-    'password': mdp,
-    'host': host,
-    'database': 'defaultdb',
-    'port': 25060
-}
 
 # Initialize OpenAI client
 openai_client = OpenAI(api_key=chatgpt_key)
 
 # Establish MySQL connection
 try:
-    conn = mysql.connector.connect(**db_config)
+    conn = get_connection()
     cursor = conn.cursor()
 except mysql.connector.Error as err:
     print(f"Error: {err}")
@@ -148,8 +134,8 @@ def create_chatgpt_table():
     cursor.execute(query)
     conn.commit()
 
-# Script execution
-if __name__ == "__main__":
+def main(argv=None):
+    """Script entry point, also called by main.py's pipeline."""
     try:
         create_chatgpt_table()
         process_stocks()
@@ -158,3 +144,7 @@ if __name__ == "__main__":
     finally:
         cursor.close()
         conn.close()
+
+# Script execution
+if __name__ == "__main__":
+    main()
@@ -4,28 +4,11 @@ import mysql.connector
 from datetime import datetime
 import json
 import shutil
-
-# Retrieve MySQL credentials
-mdp = os.getenv("MYSQL_MDP")
-host = os.getenv("MYSQL_HOST")
-
-if not mdp:
-    raise ValueError("No MySQL password found in environment variables")
-if not host:
-    raise ValueError("No Host found in environment variables")
-
-# Database connection configuration
-db_config = {
-    'user': 'doadmin',
-    'password': mdp,
-    'host': host,
-    'database': 'defaultdb',
-    'port': 25060
-}
+from db import get_connection
 
 # Establish MySQL connection
 try:
-    conn = mysql.connector.connect(**db_config)
+    conn = get_connection()
     cursor = conn.cursor(dictionary=True)
     print("Successfully connected to the database")
 except mysql.connector.Error as err:
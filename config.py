@@ -1,18 +1,11 @@
-import mysql.connector
 import os
+import time
+import threading
 from decimal import Decimal
-
-# Database connection configuration
-db_config = {
-    'user': 'doadmin',
-    'password': os.getenv("MYSQL_MDP"),
-    'host': os.getenv("MYSQL_HOST"),
-    'database': 'defaultdb',
-    'port': 25060
-}
+from db import get_connection
 
 def calculate_median_success_rate():
-    conn = mysql.connector.connect(**db_config)
+    conn = get_connection()
     cursor = conn.cursor()
 
     # Calculate median overall_success_rate using ROW_NUMBER() and CTEs (Common Table Expressions)
@@ -34,7 +27,35 @@ def calculate_median_success_rate():
     return Decimal(median_success_rate) if median_success_rate is not None else Decimal(0)
 
 DAYS_RECENT = 30  # Number of days to define "recent"
-SUCCESS_RATE_THRESHOLD = calculate_median_success_rate()  # Dynamically calculated
 MIN_ANALYSTS = 3  # Minimum number of analysts covering a stock
 MAX_STDDEV = 100
 
+# The median success rate is only queried when first needed, then reused for this many seconds
+SUCCESS_RATE_TTL = float(os.getenv("SUCCESS_RATE_TTL", "3600"))
+
+_threshold_cache = {'value': None, 'computed_at': 0.0}
+_threshold_lock = threading.Lock()
+
+def get_success_rate_threshold(refresh=False):
+    """
+    Median analyst success rate, computed lazily and cached for SUCCESS_RATE_TTL seconds.
+
+    Setting the SUCCESS_RATE_THRESHOLD environment variable pins the value without touching the
+    database (offline runs, benchmarks).
+    """
+    override = os.getenv("SUCCESS_RATE_THRESHOLD")
+    if override:
+        return Decimal(override)
+    with _threshold_lock:
+        expired = time.monotonic() - _threshold_cache['computed_at'] > SUCCESS_RATE_TTL
+        if refresh or _threshold_cache['value'] is None or expired:
+            _threshold_cache['value'] = calculate_median_success_rate()
+            _threshold_cache['computed_at'] = time.monotonic()
+        return _threshold_cache['value']
+
+def __getattr__(name):
+    # Backwards compatibility: config.SUCCESS_RATE_THRESHOLD still works, but is only evaluated on access
+    if name == "SUCCESS_RATE_THRESHOLD":
+        return get_success_rate_threshold()
+    raise AttributeError(f"module 'config' has no attribute {name!r}")
+
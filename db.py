@@ -0,0 +1,90 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from mysql.connector import pooling
+
+# Process-wide pool of warm connections to the managed MySQL; the pool cannot exceed mysql-connector's 32
+POOL_SIZE = min(int(os.getenv("MYSQL_POOL_SIZE", "5")), pooling.CNX_POOL_MAXSIZE)
+# Seconds to wait for a free pooled connection before giving up
+POOL_TIMEOUT = float(os.getenv("MYSQL_POOL_TIMEOUT", "30"))
+# Server-side prepared statements kept open per connection by PreparedStatements
+PREPARED_CACHE_SIZE = int(os.getenv("MYSQL_PREPARED_CACHE_SIZE", "8"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_db_config():
+    """Connection settings shared by every script, read from the environment."""
+    mdp = os.getenv("MYSQL_MDP")
+    if not mdp:
+        raise ValueError("No MySQL password found in environment variables")
+    host = os.getenv("MYSQL_HOST")
+    if not host:
+        raise ValueError("No Host found in environment variables")
+    return {
+        'user': 'doadmin',
+        'password': mdp,
+        'host': host,
+        'database': 'defaultdb',
+        'port': 25060
+    }
+
+def get_pool():
+    """Create the connection pool on first use; later calls (from any thread) reuse it."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pooling.MySQLConnectionPool(pool_name="investments", pool_size=POOL_SIZE, **get_db_config())
+    return _pool
+
+def get_connection(timeout=POOL_TIMEOUT):
+    """
+    Borrow a connection from the pool, waiting up to `timeout` seconds when all are in use.
+
+    conn.close() hands the connection back to the pool instead of closing the socket, so the
+    TLS and auth handshake is only paid once per pooled connection per process.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return get_pool().get_connection()
+        except pooling.PoolError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.05)
+
+class PreparedStatements:
+    """
+    Server-side prepared statements of one borrowed connection, keyed by SQL text.
+
+    Each distinct statement keeps its own prepared cursor, so a statement executed again with new
+    parameters (e.g. every full batch of a multi-row upsert) is parsed by the server once per
+    connection instead of once per call. The least recently used statement is closed beyond
+    max_size. Close them before conn.close(): the pool resets the session, which drops them.
+    """
+
+    def __init__(self, conn, max_size=PREPARED_CACHE_SIZE):
+        self.conn = conn
+        self.max_size = max_size
+        self.statements = OrderedDict()
+
+    def execute(self, query, params=()):
+        """Execute query with params on its prepared cursor and return that cursor (for rowcount)."""
+        statement = self.statements.pop(query, None)
+        if statement is None:
+            if len(self.statements) >= self.max_size:
+                _, (_, oldest) = self.statements.popitem(last=False)
+                oldest.close()
+            statement = (query, self.conn.cursor(prepared=True))
+        self.statements[query] = statement
+        # The prepared cursor only skips the prepare step when it is given the same string object
+        prepared_query, cursor = statement
+        cursor.execute(prepared_query, params)
+        return cursor
+
+    def close(self):
+        for _, cursor in self.statements.values():
+            cursor.close()
+        self.statements.clear()
@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from benzinga import financial_data
+from api_replay import API_MODE, REPLAYING, record, replay
+
+# Per-request timeout (seconds) and retries with exponential backoff on timeouts, 429 and 5xx
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+# Keep-alive connections kept per host; at least as many as the concurrent fetch workers
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+# On-disk response cache. Responses younger than HTTP_CACHE_TTL seconds are served from disk;
+# 0 (the default) disables the cache, so production runs always hit the APIs
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR", "cache/http")
+HTTP_CACHE_TTL = float(os.getenv("HTTP_CACHE_TTL", "0"))
+
+# Query parameters carrying credentials: never part of a cache key and never written to disk
+SECRET_PARAMS = {"token", "apikey", "api_key"}
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Process-wide requests session, so every script reuses pooled keep-alive (TLS) connections."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                retry = Retry(total=HTTP_RETRIES, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504),
+                              allowed_methods=("GET",))
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+def public_params(params):
+    return {key: value for key, value in (params or {}).items() if key not in SECRET_PARAMS}
+
+def cache_path(endpoint, params):
+    """Cache file for an endpoint and its parameters (credentials excluded)."""
+    key = json.dumps([endpoint, public_params(params)], sort_keys=True, default=str)
+    return os.path.join(HTTP_CACHE_DIR, hashlib.sha256(key.encode()).hexdigest() + ".json")
+
+def cache_read(path, ttl):
+    """Cached body, or None when missing, older than ttl seconds or unreadable."""
+    try:
+        if time.time() - os.path.getmtime(path) > ttl:
+            return None
+        with open(path) as f:
+            return json.load(f)['body']
+    except (OSError, ValueError, KeyError):
+        return None
+
+def cache_write(path, endpoint, params, body):
+    os.makedirs(HTTP_CACHE_DIR, exist_ok=True)
+    # Written under a unique name then renamed, so concurrent readers never see a partial file
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({'endpoint': endpoint, 'params': public_params(params), 'body': body}, f, default=str)
+    os.replace(tmp_path, path)
+
+def cached_call(endpoint, params, fetch, ttl=None, throttle=None):
+    """
+    Return fetch() through the disk cache, keyed by endpoint and params, when ttl (or HTTP_CACHE_TTL) > 0.
+
+    throttle() runs before every request that misses the cache. With API_MODE=replay the cache is
+    bypassed and the request is served by api_replay instead of fetch(); with API_MODE=record
+    each fetched body is also saved as a cassette.
+    """
+    ttl = HTTP_CACHE_TTL if ttl is None else ttl
+    path = cache_path(endpoint, params)
+    if ttl > 0 and not REPLAYING:
+        body = cache_read(path, ttl)
+        if body is not None:
+            return body
+
+    if throttle:
+        throttle()
+    if REPLAYING:
+        return replay(path, endpoint, public_params(params))
+    body = fetch()
+    if API_MODE == "record":
+        record(path, endpoint, public_params(params), body)
+    if ttl > 0:
+        cache_write(path, endpoint, params, body)
+    return body
+
+def get_json(url, params=None, headers=None, ttl=None, throttle=None):
+    """GET url on the shared session and return the decoded JSON; raises requests.HTTPError on error statuses."""
+    def fetch():
+        response = get_session().get(url, params=params, headers=headers, timeout=HTTP_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+    return cached_call(url, params, fetch, ttl, throttle)
+
+class CachedBenzinga:
+    """
+    Benzinga SDK client with the disk cache in front of it, shareable across worker threads.
+
+    The SDK opens its own HTTP connections and offers no way to hand it our session, so only the
+    cache (and record/replay) applies here. Each thread gets its own SDK client, and the rate
+    limiter (if any) is only waited on for requests that miss the cache.
+    """
+
+    def __init__(self, token, rate_limiter=None, ttl=None):
+        self.token = token
+        self.rate_limiter = rate_limiter
+        self.ttl = ttl
+        self.local = threading.local()
+
+    def client(self):
+        if not hasattr(self.local, "bz"):
+            self.local.bz = financial_data.Benzinga(self.token)
+        return self.local.bz
+
+    def call(self, method, **params):
+        throttle = self.rate_limiter.wait if self.rate_limiter else None
+        return cached_call(f"benzinga:{method}", params, lambda: getattr(self.client(), method)(**params),
+                           self.ttl, throttle)
+
+    def ratings(self, **params):
+        return self.call("ratings", **params)
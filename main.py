@@ -1,36 +1,100 @@
-import subprocess
+import sys
+import time
+import argparse
+import importlib
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
-def run_script(script_name):
-    print(f"Running {script_name}...")
+# Pipeline stages and the stages each one needs first. Stages run in this process, so they share
+# imported modules, the db.py connection pool and config.py's success rate threshold. Each stage
+# is a script module whose main(argv) is called directly, so concurrent stages never touch the
+# process-wide __main__ module or sys.argv.
+STAGES = {
+    'prices': {'module': 'stock_price', 'after': []},
+    'ratings': {'module': 'price_target_history', 'after': []},
+    'analysts': {'module': 'analysts', 'after': ['ratings']},
+    'analysis': {'module': 'analysis_simulation', 'after': ['prices', 'ratings', 'analysts']},
+    'portfolios': {'module': 'portfolio', 'after': ['analysis']},
+    'llm': {'module': 'chatgpt', 'after': ['portfolios']},
+}
+
+# Stages run when none are given on the command line (the latest version runs the ratings ingest only)
+DEFAULT_STAGES = ['ratings']
+
+def run_module(module_name):
+    """Import a stage script and call its main([]); returns True when it finished or exited with status 0."""
+    print(f"Running {module_name}...")
     try:
-        subprocess.run(["python", script_name], check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"Error running {script_name}: {e}")
-        exit(1)
+        importlib.import_module(module_name).main([])
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            print(f"Error running {module_name}: exit status {e.code}")
+            return False
+    except Exception as e:
+        print(f"Error running {module_name}: {e}")
+        return False
+    return True
 
+def run_stage(name):
+    start = time.perf_counter()
+    ok = run_module(STAGES[name]['module'])
+    return ok, time.perf_counter() - start
 
-# Execute the scripts in the specified order
-# run_script("price_target.py")
-# run_script("analysis.py")
-# run_script("portfolio.py")
+def run_pipeline(stages, max_workers=2):
+    """
+    Run the selected stages in dependency order, starting independent ones concurrently.
 
+    Dependencies outside the selection are assumed to be satisfied. A failed stage skips every
+    stage that depends on it. Returns {stage: (status, seconds)}.
+    """
+    selected = [name for name in STAGES if name in stages]
+    pending = {name: {dep for dep in STAGES[name]['after'] if dep in selected} for name in selected}
+    results = {}
 
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        while pending or running:
+            for name in list(pending):
+                deps = pending[name]
+                if any(results[dep][0] != 'ok' for dep in deps if dep in results):
+                    print(f"Skipping {name}: a stage it depends on did not succeed")
+                    results[name] = ('skipped', 0.0)
+                    del pending[name]
+                elif all(dep in results for dep in deps):
+                    running[executor.submit(run_stage, name)] = name
+                    del pending[name]
 
-# run_script("price_history.py")
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                ok, elapsed = future.result()
+                results[name] = ('ok' if ok else 'failed', elapsed)
+                print(f"Stage {name} {'finished' if ok else 'failed'} in {elapsed:.1f}s")
 
-# run_script("portfolio_simulation.py")
+    return results
 
-# Latest version
-run_script("price_target_history.py")
-# run_script("analysts.py")
-# run_script("stock_price.py")
-# run_script("analysis_simulation.py")
-# run_script("portfolio.py")
-# run_script("chatgpt.py")
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the pipeline stages in one process.")
+    parser.add_argument("--stages", help=f"Comma-separated stages among {', '.join(STAGES)} "
+                                         f"(default: {', '.join(DEFAULT_STAGES)})")
+    parser.add_argument("--all", action="store_true", help="Run every stage")
+    parser.add_argument("--workers", type=int, default=2, help="Maximum number of stages running at once")
+    return parser.parse_args()
 
-# run_script("portfolio_bullish.py")
-# run_script("portfolio_super_bullish.py")
+if __name__ == "__main__":
+    args = parse_args()
+    stages = list(STAGES) if args.all else (args.stages.split(",") if args.stages else DEFAULT_STAGES)
+    unknown = [name for name in stages if name not in STAGES]
+    if unknown:
+        raise ValueError(f"Unknown stages: {', '.join(unknown)}")
 
-# run_script("chatgpt_report.py")
+    pipeline_start = time.perf_counter()
+    results = run_pipeline(stages, args.workers)
 
-# run_script("portfolio_min.py")
+    print("Stage timings:")
+    for name, (status, elapsed) in results.items():
+        print(f"  {name:<12} {status:<8} {elapsed:8.1f}s")
+    print(f"Pipeline finished in {time.perf_counter() - pipeline_start:.1f}s")
+    if any(status != 'ok' for status, _ in results.values()):
+        sys.exit(1)
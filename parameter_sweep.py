@@ -0,0 +1,218 @@
+import argparse
+import itertools
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from db import get_connection
+from config import DAYS_RECENT, get_success_rate_threshold
+from price_store import AsOfPriceIndex
+from price_target_stats import IncrementalPriceTargetStats, load_ratings, load_analyst_rates
+
+WEEKS_PER_YEAR = 52
+
+# Default grid around config.MIN_ANALYSTS / MAX_STDDEV, the backtest top-N values and portfolio_min's floor
+DEFAULT_GRID = {
+    'min_analysts': [1, 2, 3, 4, 5],
+    'max_stddev': [25, 50, 100, 200],
+    'min_expected_return': [None, 0, 10, 20],
+    'top_n': [1, 5, 10, 20],
+    # As in backtest.STRATEGIES: 'fixed' splits the value over top_n slots and keeps the unfilled
+    # slots in cash, 'equal' splits it over the stocks actually selected
+    'weighting': ['fixed', 'equal'],
+}
+
+def load_snapshot_matrices(cursor, start_date, end_date):
+    """Pivot the weekly analysis_simulation snapshots into week x ticker matrices, in one query."""
+    cursor.execute("""
+        SELECT date, ticker, expected_return_combined_criteria, num_combined_criteria, stddev_combined_criteria
+        FROM analysis_simulation
+        WHERE date BETWEEN %s AND %s
+    """, (start_date, end_date))
+    snapshots = pd.DataFrame(cursor.fetchall(), columns=['date', 'ticker', 'expected_return', 'num_analysts', 'stddev'])
+    for column in ('expected_return', 'num_analysts', 'stddev'):
+        snapshots[column] = pd.to_numeric(snapshots[column], errors='coerce').astype('float64')
+
+    expected_return = snapshots.pivot_table(index='date', columns='ticker', values='expected_return', aggfunc='last')
+    dates, tickers = expected_return.index, expected_return.columns
+    num_analysts = snapshots.pivot_table(index='date', columns='ticker', values='num_analysts', aggfunc='last')
+    stddev = snapshots.pivot_table(index='date', columns='ticker', values='stddev', aggfunc='last')
+    return (dates, tickers, expected_return.to_numpy(),
+            num_analysts.reindex(index=dates, columns=tickers).to_numpy(),
+            stddev.reindex(index=dates, columns=tickers).to_numpy())
+
+def compute_snapshot_matrices(cursor, dates, tickers, closes, days_recent_values):
+    """
+    Rebuild the snapshot matrices in memory for other DAYS_RECENT values.
+
+    analysis_simulation is stored for config.DAYS_RECENT only, so the combined criteria are
+    recomputed with one IncrementalPriceTargetStats pass per value over ratings read once.
+    """
+    ratings = load_ratings(cursor, dates[-1])
+    analyst_rates = load_analyst_rates(cursor)
+    column = {ticker: i for i, ticker in enumerate(tickers)}
+    threshold = get_success_rate_threshold()
+    matrices = {}
+    for days_recent in days_recent_values:
+        stats_engine = IncrementalPriceTargetStats(ratings, analyst_rates, days_recent, threshold)
+        expected_return, num_analysts, stddev = (np.full((len(dates), len(tickers)), np.nan) for _ in range(3))
+        for week, date in enumerate(dates):
+            for row in stats_engine.advance_to(date):
+                c = column.get(row[0])
+                if c is None:
+                    continue
+                num_analysts[week, c] = row[12]
+                stddev[week, c] = np.nan if row[13] is None else row[13]
+                price = closes[week, c]
+                if row[14] is not None and price > 0:
+                    expected_return[week, c] = (float(row[14]) - price) / price * 100
+        matrices[days_recent] = (expected_return, num_analysts, stddev)
+    return matrices
+
+def weekly_price_matrix(price_index, dates, tickers):
+    """Latest close on or before each week, as a week x ticker matrix (NaN when unknown)."""
+    column = {ticker: i for i, ticker in enumerate(tickers)}
+    prices = np.full((len(dates), len(tickers)), np.nan)
+    for week, date in enumerate(dates):
+        week_tickers, closes, _ = price_index.lookup(date)
+        for ticker, close in zip(week_tickers.tolist(), closes.tolist()):
+            if ticker in column:
+                prices[week, column[ticker]] = close
+    return prices
+
+def hold_weights(weights, weekly_returns):
+    """
+    Weeks where nothing qualifies keep the previous basket (as the backtest engine does): its
+    quantities are held, so its weights drift with the prices instead of being rebalanced.
+    """
+    held = weights.copy()
+    has_basket = weights.sum(axis=2) > 0
+    for week in range(1, weights.shape[1]):
+        previous = held[:, week - 1]
+        drifted = previous * (1.0 + weekly_returns[week - 1])[None]
+        total = 1.0 - previous.sum(axis=1) + drifted.sum(axis=1)  # cash + stocks, per unit of last week's value
+        drifted = np.where(total[:, None] > 0, drifted / np.where(total > 0, total, 1.0)[:, None], 0.0)
+        held[:, week] = np.where(has_basket[:, week, None], weights[:, week], drifted)
+    return held
+
+def simulate_grid(grid, expected_return, num_analysts, stddev, prices):
+    """
+    Simulate every grid combination at once, yielding (filters, top_n, weighting, weights, returns, equity).
+
+    Filters are broadcast into a (combination x week x ticker) mask, candidates are ranked with a
+    single argsort per combination batch, and each top-N basket is weighted like the backtest
+    engine's strategies (see DEFAULT_GRID['weighting']) and held for one week. equity[c, w] is the
+    value after week w + 1 per unit invested in week 0.
+    """
+    filters = list(itertools.product(grid['min_analysts'], grid['max_stddev'], grid['min_expected_return']))
+    min_analysts = np.array([f[0] for f in filters], dtype='float64')[:, None, None]
+    max_stddev = np.array([f[1] for f in filters], dtype='float64')[:, None, None]
+    floor = np.array([-np.inf if f[2] is None else f[2] for f in filters], dtype='float64')[:, None, None]
+
+    with np.errstate(invalid='ignore'):
+        eligible = ((num_analysts[None] >= min_analysts) & (stddev[None] <= max_stddev)
+                    & (expected_return[None] >= floor) & np.isfinite(prices)[None])
+        weekly_returns = np.nan_to_num(prices[1:] / prices[:-1] - 1.0, nan=0.0, posinf=0.0, neginf=0.0)
+
+    scores = np.where(eligible, expected_return[None], -np.inf)
+    # rank[c, w, t] = position of ticker t in week w's ranking for combination c (0 = best)
+    rank = np.argsort(np.argsort(-scores, axis=2, kind='stable'), axis=2)
+
+    for top_n, weighting in itertools.product(grid['top_n'], grid['weighting']):
+        selected = eligible & (rank < top_n)
+        if weighting == 'fixed':
+            weights = selected / top_n
+        else:
+            counts = selected.sum(axis=2, keepdims=True)
+            weights = np.where(counts > 0, selected / np.maximum(counts, 1), 0.0)
+        weights = hold_weights(weights, weekly_returns)
+
+        returns = (weights[:, :-1] * weekly_returns[None]).sum(axis=2)
+        equity = np.cumprod(1.0 + returns, axis=1)
+        yield filters, top_n, weighting, weights, returns, equity
+
+def sweep(grid, expected_return, num_analysts, stddev, prices):
+    """Evaluate every grid combination (see simulate_grid) into one row of metrics each."""
+    results = []
+    for filters, top_n, weighting, weights, returns, equity in simulate_grid(grid, expected_return, num_analysts,
+                                                                             stddev, prices):
+        peaks = np.maximum.accumulate(np.concatenate([np.ones((len(filters), 1)), equity], axis=1), axis=1)[:, 1:]
+        periods = returns.shape[1]
+        turnover = 0.5 * np.abs(np.diff(weights, axis=1)).sum(axis=2)
+
+        for c, (min_analyst_count, max_std, min_return) in enumerate(filters):
+            results.append({
+                'min_analysts': min_analyst_count,
+                'max_stddev': max_std,
+                'min_expected_return': min_return,
+                'top_n': top_n,
+                'weighting': weighting,
+                'cagr': equity[c, -1] ** (WEEKS_PER_YEAR / periods) - 1 if periods else np.nan,
+                'volatility': returns[c].std() * np.sqrt(WEEKS_PER_YEAR) if periods else np.nan,
+                'max_drawdown': (equity[c] / peaks[c] - 1).min() if periods else np.nan,
+                'turnover': turnover[c].mean() if periods > 1 else np.nan,
+                'avg_holdings': (weights[c] > 0).sum(axis=1).mean(),
+            })
+
+    return pd.DataFrame(results)
+
+def parse_list(value, cast):
+    return [None if item.strip().lower() == 'none' else cast(item) for item in value.split(",")]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sweep backtest parameters over the analysis_simulation snapshots.")
+    parser.add_argument("--start-date", default="2021-01-17", help="First week (YYYY-MM-DD)")
+    parser.add_argument("--end-date", default=datetime.now().strftime('%Y-%m-%d'), help="Last week (YYYY-MM-DD)")
+    parser.add_argument("--min-analysts", help="Comma-separated MIN_ANALYSTS values")
+    parser.add_argument("--max-stddev", help="Comma-separated MAX_STDDEV values")
+    parser.add_argument("--min-expected-return", help="Comma-separated expected return floors ('none' for no floor)")
+    parser.add_argument("--top-n", help="Comma-separated portfolio sizes")
+    parser.add_argument("--weighting", help="Comma-separated weightings among fixed, equal")
+    parser.add_argument("--days-recent", help="Comma-separated DAYS_RECENT values; recomputes the snapshots from ratings "
+                                              f"instead of reading analysis_simulation (stored with {DAYS_RECENT})")
+    parser.add_argument("--output", help="Write the results table to this CSV file")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    grid = dict(DEFAULT_GRID)
+    if args.min_analysts:
+        grid['min_analysts'] = parse_list(args.min_analysts, int)
+    if args.max_stddev:
+        grid['max_stddev'] = parse_list(args.max_stddev, float)
+    if args.min_expected_return:
+        grid['min_expected_return'] = parse_list(args.min_expected_return, float)
+    if args.top_n:
+        grid['top_n'] = parse_list(args.top_n, int)
+    if args.weighting:
+        grid['weighting'] = parse_list(args.weighting, str)
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    # Expected returns and weekly returns both use the last non-zero close, like the backtest's
+    # sell-side fallback
+    price_index = AsOfPriceIndex.from_cursor(cursor, until=args.end_date).positive_only()
+    if args.days_recent:
+        start = datetime.strptime(args.start_date, '%Y-%m-%d').date()
+        end = datetime.strptime(args.end_date, '%Y-%m-%d').date()
+        dates = [start + timedelta(weeks=i) for i in range((end - start).days // 7 + 1)]
+        tickers = price_index.tickers
+        closes = weekly_price_matrix(price_index, dates, tickers)
+        matrices = compute_snapshot_matrices(cursor, dates, tickers, closes, parse_list(args.days_recent, int))
+    else:
+        dates, tickers, expected_return, num_analysts, stddev = load_snapshot_matrices(cursor, args.start_date, args.end_date)
+        matrices = {DAYS_RECENT: (expected_return, num_analysts, stddev)}
+    cursor.close()
+    conn.close()
+
+    prices = weekly_price_matrix(price_index, dates, tickers)
+    frames = []
+    for days_recent, (expected_return, num_analysts, stddev) in matrices.items():
+        frame = sweep(grid, expected_return, num_analysts, stddev, prices)
+        frame.insert(0, 'days_recent', days_recent)
+        frames.append(frame)
+    results = pd.concat(frames, ignore_index=True).sort_values('cagr', ascending=False)
+
+    print(f"Evaluated {len(results)} configurations over {len(dates)} weeks")
+    print(results.to_string(index=False))
+    if args.output:
+        results.to_csv(args.output, index=False)
@@ -0,0 +1,41 @@
+# Shared writes for the portfolio simulation tables (portfolio_simulation, portfolio_min, ...)
+
+SELL_UPDATES_TABLE = "portfolio_sell_updates"
+
+def update_sell_fields(cursor, table, rows):
+    """
+    Apply the sell side of many holdings with one set-based UPDATE.
+
+    rows are (date, ticker, date_sell, stock_price_sell, total_value_sell, evolution) where date
+    is the purchase date identifying the holding. They are staged in a session-private temporary
+    table with one multi-row insert, then joined into `table`, instead of one UPDATE per holding.
+    Returns the number of holdings updated.
+    """
+    if not rows:
+        return 0
+
+    cursor.execute(f"""
+        CREATE TEMPORARY TABLE IF NOT EXISTS {SELL_UPDATES_TABLE} (
+            date DATE NOT NULL,
+            ticker VARCHAR(16) NOT NULL,
+            date_sell DATE,
+            stock_price_sell DECIMAL(20, 6),
+            total_value_sell DECIMAL(24, 6),
+            evolution DECIMAL(24, 6),
+            PRIMARY KEY (date, ticker)
+        )
+    """)
+    cursor.execute(f"DELETE FROM {SELL_UPDATES_TABLE}")
+    cursor.executemany(f"""
+        INSERT INTO {SELL_UPDATES_TABLE} (date, ticker, date_sell, stock_price_sell, total_value_sell, evolution)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """, rows)
+    cursor.execute(f"""
+        UPDATE {table} t
+        JOIN {SELL_UPDATES_TABLE} u ON t.date = u.date AND t.ticker = u.ticker
+        SET t.date_sell = u.date_sell,
+            t.stock_price_sell = u.stock_price_sell,
+            t.total_value_sell = u.total_value_sell,
+            t.evolution = u.evolution
+    """)
+    return cursor.rowcount
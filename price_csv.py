@@ -0,0 +1,48 @@
+import os
+from collections import defaultdict
+from glob import glob
+import pandas as pd
+
+# Every column is read as text first; prices carry a '$' prefix that is stripped below
+CSV_DTYPES = {'Date': str, 'Close/Last': str, 'Volume': str, 'Open': str, 'High': str, 'Low': str}
+PRICE_COLUMNS = {'Close/Last': 'close', 'Open': 'open', 'High': 'high', 'Low': 'low'}
+DB_COLUMNS = ['ticker', 'date', 'open', 'high', 'low', 'close', 'volume']
+
+def ticker_from_filename(csv_file):
+    """Map a CSV file name to its ticker: 'Br.csv' -> 'BR', 'aapl.csv' -> 'AAPL', 'brk.b.csv' -> 'BRK.B'."""
+    return os.path.splitext(os.path.basename(csv_file))[0].strip().upper()
+
+def group_csv_files(csv_folder):
+    """Return {ticker: [csv files]}, merging files whose names only differ by case."""
+    files_by_ticker = defaultdict(list)
+    for csv_file in sorted(glob(os.path.join(csv_folder, "*.csv"))):
+        files_by_ticker[ticker_from_filename(csv_file)].append(csv_file)
+    return dict(files_by_ticker)
+
+def parse_price_csv(csv_file, ticker):
+    """Parse one Nasdaq-style CSV into a DataFrame ordered like DB_COLUMNS, using vectorized ops only."""
+    df = pd.read_csv(csv_file, dtype=CSV_DTYPES)
+
+    prices = pd.DataFrame({
+        'ticker': ticker,
+        'date': pd.to_datetime(df['Date'], format='%m/%d/%Y').dt.date,
+    })
+    for csv_column, db_column in PRICE_COLUMNS.items():
+        prices[db_column] = pd.to_numeric(
+            df[csv_column].str.lstrip(' $'), errors='coerce'
+        ).astype('float64')
+    # Index files such as spx.csv have no Volume column
+    volume = df['Volume'] if 'Volume' in df else pd.Series(pd.NA, index=df.index)
+    prices['volume'] = pd.to_numeric(volume, errors='coerce').astype('Int64')
+
+    return prices[DB_COLUMNS].dropna(subset=['date', 'close'])
+
+def parse_ticker_files(ticker, csv_files):
+    """Parse every file of a ticker into one frame; the first file wins when dates overlap."""
+    frames = [parse_price_csv(csv_file, ticker) for csv_file in csv_files]
+    prices = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+    return prices.drop_duplicates(subset=['date'], keep='first')
+
+def to_rows(prices):
+    """Convert a parsed price frame into DB-ready tuples, mapping NaN/NA to NULL."""
+    return list(prices.astype(object).where(prices.notna(), None).itertuples(index=False, name=None))
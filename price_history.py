@@ -1,127 +1,191 @@
 import os
-import mysql.connector
-import pandas as pd
-from glob import glob
-
-# Retrieve MySQL password and host from environment variables
-mdp = os.getenv("MYSQL_MDP")
-host = os.getenv("MYSQL_HOST")
-
-if not mdp or not host:
-    raise ValueError("MySQL credentials missing in environment variables")
-
-# Database connection configuration
-db_config = {
-    'user': 'doadmin',
-    'password': mdp,
-    'host': host,
-    'database': 'defaultdb',
-    'port': 25060
-}
-
-# List of S&P 500 tickers
-sp500_tickers = [
-    
-    'SPX'
-
-
-]
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from db import POOL_SIZE, PreparedStatements, get_connection
+from price_csv import DB_COLUMNS, group_csv_files, parse_ticker_files, to_rows
 
 # Define the folder path containing the CSV files
 csv_folder = "csv"
 
-# Check if the CSV folder exists and contains files
-if not os.path.exists(csv_folder):
-    print(f"CSV folder {csv_folder} does not exist.")
-else:
-    print(f"CSV folder {csv_folder} found.")
-    csv_files = glob(os.path.join(csv_folder, "*.csv"))
-    if not csv_files:
-        print(f"No CSV files found in {csv_folder}.")
-    else:
-        print(f"Found {len(csv_files)} CSV files in {csv_folder}.")
+# Define batch size for bulk insertion (rows per multi-row INSERT)
+BATCH_SIZE = 5000
 
-conn = mysql.connector.connect(**db_config)
-cursor = conn.cursor()
+# Parallelism of a cold reload: parser processes and MySQL writer threads
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_WRITERS = int(os.getenv("PRICE_HISTORY_WRITERS", "2"))
 
-# Prepare MySQL table
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS prices (
-    ticker VARCHAR(10),
-    date DATE,
-    close DECIMAL(10, 2),
-    PRIMARY KEY (ticker, date)
-)
-""")
-conn.commit()
+# Columns added to the original (ticker, date, close) prices table
+OHLCV_COLUMNS = {
+    'open': 'DECIMAL(10, 2)',
+    'high': 'DECIMAL(10, 2)',
+    'low': 'DECIMAL(10, 2)',
+    'volume': 'BIGINT'
+}
 
-# Define batch size for bulk insertion
-BATCH_SIZE = 1000
+def ensure_prices_table(cursor):
+    """Create the prices table, or add the OHLCV columns to an existing close-only table."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS prices (
+        ticker VARCHAR(10),
+        date DATE,
+        close DECIMAL(10, 2),
+        open DECIMAL(10, 2),
+        high DECIMAL(10, 2),
+        low DECIMAL(10, 2),
+        volume BIGINT,
+        PRIMARY KEY (ticker, date)
+    )
+    """)
+    cursor.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = 'prices'
+    """)
+    existing_columns = {row[0].lower() for row in cursor.fetchall()}
+    for column, column_type in OHLCV_COLUMNS.items():
+        if column not in existing_columns:
+            print(f"Adding column {column} to prices")
+            cursor.execute(f"ALTER TABLE prices ADD COLUMN {column} {column_type}")
 
 # Function to insert data in batches
 def insert_data_in_batches(data, cursor):
-    placeholders = ', '.join(['(%s, %s, %s)'] * len(data))
-    query = f"INSERT INTO prices (ticker, date, close) VALUES {placeholders} ON DUPLICATE KEY UPDATE close = VALUES(close)"
+    placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(data))
+    query = (f"INSERT INTO prices ({', '.join(DB_COLUMNS)}) VALUES {placeholders} "
+             "ON DUPLICATE KEY UPDATE open = VALUES(open), high = VALUES(high), low = VALUES(low), "
+             "close = VALUES(close), volume = VALUES(volume)")
     flattened_data = [item for sublist in data for item in sublist]
     cursor.execute(query, flattened_data)
 
-# Loop through each CSV file
-for csv_file in csv_files:
-    # Extract the ticker from the filename
-    ticker = os.path.basename(csv_file).split('.')[0].upper()
-    print(f"Processing CSV for ticker: {ticker}")
+def write_prices(prices, ticker, conn, cursor):
+    """
+    Write a parsed price frame in multi-row batches and return the number of rows written.
 
-    # Check if the ticker is in the S&P 500 list
-    if ticker in sp500_tickers:
-        print(f"Ticker {ticker} is in the S&P 500 list.")
-        # Read the CSV file into a DataFrame
+    cursor may be a PreparedStatements: every full BATCH_SIZE batch then reuses one prepared statement.
+    """
+    rows = to_rows(prices)
+    written = 0
+    for start in range(0, len(rows), BATCH_SIZE):
+        batch = rows[start:start + BATCH_SIZE]
         try:
-            df = pd.read_csv(csv_file)
-            print(f"Read {len(df)} rows from {csv_file}.")
+            insert_data_in_batches(batch, cursor)
+            written += len(batch)
         except Exception as e:
-            print(f"Error reading {csv_file}: {e}")
-            continue
-
-        # Ensure the date column is in datetime format and remove dollar sign from 'Close/Last'
+            print(f"Error inserting data for {ticker}: {e}")
+    conn.commit()
+    return written
+
+def writer_loop(work_queue, totals, lock):
+    """
+    Drain parsed frames from the queue into MySQL over a dedicated connection.
+
+    Errors never end the loop: a ticker that could not be written in full is recorded in
+    totals['failed'] and the queue keeps being drained until the None sentinel, so the parsers
+    never block on a full queue.
+    """
+    conn = statements = None
+    while True:
+        item = work_queue.get()
+        if item is None:
+            break
+        ticker, prices = item
+        file_start = time.perf_counter()
         try:
-            df['Date'] = pd.to_datetime(df['Date'], format='%m/%d/%Y')
-            df['Close/Last'] = df['Close/Last'].replace({'\$': ''}, regex=True).astype(float)
+            if conn is None:
+                conn = get_connection()
+                statements = PreparedStatements(conn)
+            written = write_prices(prices, ticker, conn, statements)
         except Exception as e:
-            print(f"Error processing data in {csv_file}: {e}")
+            print(f"Error writing prices for {ticker}: {e}")
+            with lock:
+                totals['failed'].append(ticker)
+            # A broken connection is dropped so the next ticker borrows a fresh one
+            try:
+                conn.rollback()
+            except Exception:
+                conn = statements = None
             continue
-
-        # Add a column for the ticker
-        df['Ticker'] = ticker
-
-        # Prepare data for batch insertion
-        data_batch = []
-        for _, row in df.iterrows():
-            data_batch.append((ticker, row['Date'].date(), row['Close/Last']))
-
-            # Insert data in batches
-            if len(data_batch) >= BATCH_SIZE:
+        elapsed = time.perf_counter() - file_start
+        with lock:
+            totals['rows'] += written
+            if written < len(prices):
+                totals['failed'].append(ticker)
+        print(f"Inserted {written} rows for {ticker} ({written / elapsed if elapsed else 0:,.0f} rows/s)")
+    if conn is not None:
+        statements.close()
+        conn.close()
+
+def load_price_history(files_by_ticker, workers=DEFAULT_WORKERS, writers=DEFAULT_WRITERS):
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    # Prepare MySQL table
+    ensure_prices_table(cursor)
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    # Every writer holds a pooled connection for the whole run
+    if writers > POOL_SIZE:
+        print(f"Limiting writers to MYSQL_POOL_SIZE={POOL_SIZE}")
+        writers = POOL_SIZE
+
+    totals = {'rows': 0, 'failed': []}
+    lock = threading.Lock()
+    # Bounded so parsers cannot run arbitrarily far ahead of the writers
+    work_queue = queue.Queue(maxsize=writers * 4)
+    writer_threads = [threading.Thread(target=writer_loop, args=(work_queue, totals, lock)) for _ in range(writers)]
+    for thread in writer_threads:
+        thread.start()
+
+    run_start = time.perf_counter()
+    print(f"Parsing {len(files_by_ticker)} tickers with {workers} processes and {writers} writers")
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(parse_ticker_files, ticker, csv_files): ticker
+                       for ticker, csv_files in files_by_ticker.items()}
+            for future in as_completed(futures):
+                ticker = futures[future]
                 try:
-                    insert_data_in_batches(data_batch, cursor)
-                    conn.commit()
-                    print(f"Inserted {len(data_batch)} records for {ticker}")
-                    data_batch.clear()
+                    work_queue.put((ticker, future.result()))
                 except Exception as e:
-                    print(f"Error inserting data for {ticker}: {e}")
-                    data_batch.clear()
-
-        # Insert remaining data if any
-        if data_batch:
-            try:
-                insert_data_in_batches(data_batch, cursor)
-                conn.commit()
-                print(f"Inserted remaining {len(data_batch)} records for {ticker}")
-            except Exception as e:
-                print(f"Error inserting remaining data for {ticker}: {e}")
-
+                    print(f"Error reading CSV for {ticker}: {e}")
+                    with lock:
+                        totals['failed'].append(ticker)
+    finally:
+        for _ in writer_threads:
+            work_queue.put(None)
+        for thread in writer_threads:
+            thread.join()
+
+    elapsed = time.perf_counter() - run_start
+    total_rows = totals['rows']
+    print(f"Loaded {total_rows} rows in {elapsed:.1f}s ({total_rows / elapsed if elapsed else 0:,.0f} rows/s)")
+    if totals['failed']:
+        print(f"{len(totals['failed'])} tickers not fully written: {', '.join(sorted(totals['failed']))}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load the OHLCV history from csv/ into the prices table.")
+    parser.add_argument("--tickers", help="Comma-separated tickers to load (defaults to every CSV file)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Number of CSV parser processes")
+    parser.add_argument("--writers", type=int, default=DEFAULT_WRITERS, help="Number of MySQL writer connections")
+    return parser.parse_args()
+
+# Script execution (guarded so parser processes can import this module safely)
+if __name__ == "__main__":
+    args = parse_args()
+    # Check if the CSV folder exists and contains files
+    if not os.path.exists(csv_folder):
+        print(f"CSV folder {csv_folder} does not exist.")
     else:
-        print(f"Ticker {ticker} is NOT in the S&P 500 list, skipping.")
-
-# Close the connection
-cursor.close()
-conn.close()
-print("Database connection closed.")
+        print(f"CSV folder {csv_folder} found.")
+        files_by_ticker = group_csv_files(csv_folder)
+        if not files_by_ticker:
+            print(f"No CSV files found in {csv_folder}.")
+        else:
+            print(f"Found {sum(len(f) for f in files_by_ticker.values())} CSV files for {len(files_by_ticker)} tickers in {csv_folder}.")
+            if args.tickers:
+                selected = {t.strip().upper() for t in args.tickers.split(",")}
+                files_by_ticker = {t: f for t, f in files_by_ticker.items() if t in selected}
+            load_price_history(files_by_ticker, workers=args.workers, writers=args.writers)
@@ -0,0 +1,304 @@
+import os
+import argparse
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+
+# Local columnar copy of the prices table: one dense date x ticker matrix of closes
+STORE_DIR = os.getenv("PRICE_STORE_DIR", os.path.join("cache", "prices"))
+
+# Load the as-of indexes from the local store (refreshed incrementally from MySQL first) instead of
+# reading the whole prices table on every run. Off by default: rows rewritten before the store's last
+# date (e.g. a price_history reload) are only picked up by a --full rebuild
+USE_PRICE_STORE = os.getenv("USE_PRICE_STORE", "0") == "1"
+
+# A fallback price older than this many days is reported as stale
+STALE_PRICE_DAYS = int(os.getenv("STALE_PRICE_DAYS", "7"))
+
+class PriceStore:
+    """
+    Dense date x ticker close matrix kept on disk as .npy files and memory-mapped on load.
+
+    close holds the raw closes (NaN where the prices table has no row). As-of lookups are answered
+    by an AsOfPriceIndex built from the matrix, the same engine the simulations use.
+    """
+
+    def __init__(self, dates, tickers, close):
+        self.dates = np.asarray(dates, dtype='datetime64[D]')
+        self.tickers = np.asarray(tickers, dtype=str)
+        self.close = close
+        self._index = None
+
+    @classmethod
+    def empty(cls):
+        return cls(np.array([], dtype='datetime64[D]'), np.array([], dtype=str), np.empty((0, 0)))
+
+    @classmethod
+    def load(cls, path=STORE_DIR, mmap=True):
+        """Open a saved store; with mmap the matrices are read lazily straight from the page cache."""
+        if not os.path.exists(os.path.join(path, 'close.npy')):
+            return cls.empty()
+        mode = 'r' if mmap else None
+        return cls(
+            np.load(os.path.join(path, 'dates.npy')),
+            np.load(os.path.join(path, 'tickers.npy')),
+            np.load(os.path.join(path, 'close.npy'), mmap_mode=mode),
+        )
+
+    def save(self, path=STORE_DIR):
+        os.makedirs(path, exist_ok=True)
+        # Write to temporary names first so readers never map a half-written matrix
+        for name, array in (('dates', self.dates), ('tickers', self.tickers), ('close', self.close)):
+            tmp_file = os.path.join(path, f'{name}.{os.getpid()}.tmp.npy')
+            np.save(tmp_file, np.asarray(array))
+            os.replace(tmp_file, os.path.join(path, f'{name}.npy'))
+
+    @property
+    def last_date(self):
+        return self.dates[-1].astype(object) if len(self.dates) else None
+
+    def to_frame(self):
+        return pd.DataFrame(np.asarray(self.close), index=pd.DatetimeIndex(self.dates), columns=self.tickers)
+
+    def to_rows(self, until=None):
+        """(ticker, date, close) rows of the stored prices, only up to `until` when given."""
+        end = len(self.dates) if until is None else int(np.searchsorted(self.dates, np.datetime64(until, 'D'), side='right'))
+        close = np.asarray(self.close[:end], dtype='float64')
+        days, columns = np.nonzero(~np.isnan(close))
+        return pd.DataFrame({'ticker': self.tickers[columns], 'date': self.dates[days], 'close': close[days, columns]})
+
+    def merge(self, prices):
+        """Return a new store with (ticker, date, close) rows merged in; new rows win over stored ones."""
+        if prices.empty:
+            return self
+        new = prices.pivot_table(index='date', columns='ticker', values='close', aggfunc='last')
+        new.index = pd.DatetimeIndex(new.index)
+        merged = new.combine_first(self.to_frame()).sort_index()
+        merged = merged.reindex(columns=sorted(merged.columns))
+        return PriceStore(merged.index.values.astype('datetime64[D]'), merged.columns.values,
+                          merged.to_numpy(dtype='float64'))
+
+    def as_of_index(self):
+        """AsOfPriceIndex over the stored closes, built on first use."""
+        if self._index is None:
+            prices = self.to_rows()
+            self._index = AsOfPriceIndex(prices['ticker'].to_numpy(), prices['date'].to_numpy(), prices['close'].to_numpy())
+        return self._index
+
+    def close_as_of(self, date, tickers=None):
+        """Latest close <= date per ticker, as a pandas Series (NaN for tickers with no price yet)."""
+        tickers = self.tickers if tickers is None else np.asarray(tickers, dtype=str)
+        closes = self.as_of_index().closes_at(tickers, np.full(len(tickers), np.datetime64(date, 'D')))
+        return pd.Series(closes, index=tickers)
+
+    def closes_as_of(self, dates):
+        """As-of closes for many dates at once, as a (len(dates) x tickers) frame."""
+        dates = np.asarray(dates, dtype='datetime64[D]')
+        closes = self.as_of_index().closes_at(np.tile(self.tickers, len(dates)), np.repeat(dates, len(self.tickers)))
+        return pd.DataFrame(closes.reshape(len(dates), len(self.tickers)), index=pd.DatetimeIndex(dates),
+                            columns=self.tickers)
+
+    def closes_between(self, start, end):
+        """Raw closes for start <= date <= end; a slice of the memory-mapped matrix, not a copy."""
+        lo = int(np.searchsorted(self.dates, np.datetime64(start, 'D'), side='left'))
+        hi = int(np.searchsorted(self.dates, np.datetime64(end, 'D'), side='right'))
+        return pd.DataFrame(self.close[lo:hi], index=pd.DatetimeIndex(self.dates[lo:hi]),
+                            columns=self.tickers, copy=False)
+
+class AsOfPriceIndex:
+    """
+    Full price history held as (ticker, date)-sorted arrays.
+
+    Each row is keyed by ticker code * DAY_SPAN + day offset, so "latest close <= date" for every
+    ticker at once is one vectorized searchsorted over the keys instead of a GROUP BY over prices.
+    """
+
+    DAY_SPAN = 1 << 20  # more days than any price history can cover
+
+    def __init__(self, tickers, dates, closes):
+        tickers = np.asarray(tickers, dtype=str)
+        days = np.asarray(dates, dtype='datetime64[D]').astype('int64')
+        self.tickers, codes = np.unique(tickers, return_inverse=True)
+        self.first_day = days.min() if len(days) else 0
+        order = np.lexsort((days, codes))
+        self.codes = codes[order]
+        self.days = days[order]
+        self.closes = np.asarray(closes, dtype='float64')[order]
+        self.keys = self.codes.astype('int64') * self.DAY_SPAN + (self.days - self.first_day)
+        self.all_codes = np.arange(len(self.tickers))
+
+    @classmethod
+    def from_cursor(cls, cursor, until=None):
+        """Load the price history (optionally only up to `until`) in one read, see load_prices."""
+        prices = load_prices(cursor, until)
+        return cls(prices['ticker'].to_numpy(), prices['date'].to_numpy(dtype='datetime64[D]'),
+                   prices['close'].to_numpy())
+
+    def positions_as_of(self, date):
+        """Row position of each ticker's latest price <= date, or -1 when it has none yet."""
+        offset = np.datetime64(date, 'D').astype('int64') - self.first_day
+        offset = min(max(offset, -1), self.DAY_SPAN - 1)
+        positions = np.searchsorted(self.keys, self.all_codes * self.DAY_SPAN + offset, side='right') - 1
+        found = positions >= 0
+        found[found] = self.codes[positions[found]] == self.all_codes[found]
+        return np.where(found, positions, -1)
+
+    def lookup(self, date):
+        """Return (tickers, closes, dates) of the latest price <= date for every ticker that has one."""
+        positions = self.positions_as_of(date)
+        found = positions >= 0
+        rows = positions[found]
+        return self.tickers[found], self.closes[rows], self.days[rows].astype('datetime64[D]')
+
+    def rows_for(self, date, tickers):
+        """Row position of the latest price <= date for the given tickers, aligned with them (-1 when unknown)."""
+        tickers = np.asarray(tickers, dtype=str)
+        if not len(self.tickers):
+            return np.full(len(tickers), -1)
+        codes = np.minimum(np.searchsorted(self.tickers, tickers), len(self.tickers) - 1)
+        return np.where(self.tickers[codes] == tickers, self.positions_as_of(date)[codes], -1)
+
+    def closes_at(self, tickers, dates, max_age_days=None):
+        """
+        Pairwise as-of lookup: latest close <= dates[i] of tickers[i] for every i (NaN when unknown).
+
+        With max_age_days, a close older than that many days before dates[i] counts as unknown.
+        """
+        tickers = np.asarray(tickers, dtype=str)
+        if not len(self.tickers):
+            return np.full(len(tickers), np.nan)
+        codes = np.minimum(np.searchsorted(self.tickers, tickers), len(self.tickers) - 1)
+        offsets = np.asarray(dates, dtype='datetime64[D]').astype('int64') - self.first_day
+        offsets = np.clip(offsets, -1, self.DAY_SPAN - 1)
+        rows = np.searchsorted(self.keys, codes * self.DAY_SPAN + offsets, side='right') - 1
+        found = (self.tickers[codes] == tickers) & (rows >= 0)
+        found[found] = self.codes[rows[found]] == codes[found]
+        if max_age_days is not None:
+            found &= offsets - (self.days[np.maximum(rows, 0)] - self.first_day) <= max_age_days
+        return np.where(found, self.closes[np.maximum(rows, 0)], np.nan)
+
+    def positive_only(self):
+        """Index restricted to non-zero closes, for "last valid price" fallbacks."""
+        keep = self.closes > 0
+        return AsOfPriceIndex(self.tickers[self.codes[keep]], self.days[keep].astype('datetime64[D]'), self.closes[keep])
+
+    def closing_prices_as_of(self, date):
+        """Drop-in for the old per-week SQL: [(ticker, Decimal close), ...] as of date."""
+        tickers, closes, _ = self.lookup(date)
+        return [(ticker, Decimal(f"{close:.2f}")) for ticker, close in zip(tickers.tolist(), closes.tolist())]
+
+class LastValidPriceIndex:
+    """
+    Last non-zero close of every ticker, with the date it was observed.
+
+    Built from one bulk read of the prices table, it resolves every "close is missing or zero"
+    fallback in memory and tells how stale the price used is.
+    """
+
+    def __init__(self, positive_index):
+        self.index = positive_index
+
+    @classmethod
+    def from_cursor(cls, cursor, until=None):
+        """Every non-zero close (optionally only up to `until`), for as-of lookups at any date."""
+        prices = load_prices(cursor, until, positive_only=True)
+        return cls(AsOfPriceIndex(prices['ticker'].to_numpy(), prices['date'].to_numpy(dtype='datetime64[D]'),
+                                  prices['close'].to_numpy()))
+
+    @classmethod
+    def latest_from_cursor(cls, cursor):
+        """Only the latest non-zero close of each ticker, enough for lookups as of today."""
+        cursor.execute("""
+            SELECT p.ticker, p.date, p.close
+            FROM prices p
+            JOIN (SELECT ticker, MAX(date) AS date FROM prices WHERE close > 0 GROUP BY ticker) latest
+            ON p.ticker = latest.ticker AND p.date = latest.date
+        """)
+        prices = pd.DataFrame(cursor.fetchall(), columns=['ticker', 'date', 'close'])
+        return cls(AsOfPriceIndex(prices['ticker'].to_numpy(), prices['date'].to_numpy(dtype='datetime64[D]'),
+                                  prices['close'].to_numpy(dtype='float64')))
+
+    def lookup(self, date, tickers):
+        """Return (closes, price dates, days stale) aligned with tickers; NaN / NaT / -1 when no price is known."""
+        rows = self.index.rows_for(date, tickers)
+        found = rows >= 0
+        rows = np.maximum(rows, 0)
+        closes = np.where(found, self.index.closes[rows], np.nan)
+        days = np.where(found, self.index.days[rows].astype('datetime64[D]'), np.datetime64('NaT'))
+        stale_days = np.where(found, np.datetime64(date, 'D').astype('int64') - self.index.days[rows], -1)
+        return closes, days, stale_days
+
+    def report_stale(self, date, tickers, max_days=STALE_PRICE_DAYS):
+        """Print and return [(ticker, price date, days stale)] for tickers priced more than max_days ago or never."""
+        _, days, stale_days = self.lookup(date, tickers)
+        stale = []
+        for ticker, day, stale_for in zip(np.asarray(tickers).tolist(), days, stale_days.tolist()):
+            if stale_for < 0:
+                print(f"No non-zero price known for {ticker} as of {date}")
+                stale.append((ticker, None, None))
+            elif stale_for > max_days:
+                print(f"Stale price for {ticker}: last non-zero close on {day}, {stale_for} days before {date}")
+                stale.append((ticker, day.astype(object), stale_for))
+        return stale
+
+def fetch_prices(cursor, since=None, until=None, positive_only=False):
+    """Read (ticker, date, close) rows from MySQL, optionally only since <= date <= until and non-zero closes."""
+    query = "SELECT ticker, date, close FROM prices WHERE 1 = 1"
+    params = []
+    if since is not None:
+        query += " AND date >= %s"
+        params.append(since)
+    if until is not None:
+        query += " AND date <= %s"
+        params.append(until)
+    if positive_only:
+        query += " AND close > 0"
+    cursor.execute(query, params)
+    prices = pd.DataFrame(cursor.fetchall(), columns=['ticker', 'date', 'close'])
+    prices['close'] = prices['close'].astype('float64')
+    return prices
+
+def load_prices(cursor, until=None, positive_only=False, path=STORE_DIR):
+    """
+    Price rows for the as-of indexes: straight from MySQL, or with USE_PRICE_STORE from the local
+    store after pulling only the rows added since its last date.
+    """
+    if not USE_PRICE_STORE:
+        return fetch_prices(cursor, until=until, positive_only=positive_only)
+    store = refresh_from_db(PriceStore.load(path, mmap=False), cursor)
+    store.save(path)
+    prices = store.to_rows(until)
+    return prices[prices['close'] > 0] if positive_only else prices
+
+def refresh_from_db(store, cursor):
+    """Pull rows newer than the store's last date (that date included, it may have been rewritten)."""
+    return store.merge(fetch_prices(cursor, since=store.last_date))
+
+def refresh_from_csv(store, csv_folder="csv"):
+    from price_csv import group_csv_files, parse_ticker_files
+
+    frames = [parse_ticker_files(ticker, files)[['ticker', 'date', 'close']]
+              for ticker, files in group_csv_files(csv_folder).items()]
+    return store.merge(pd.concat(frames, ignore_index=True)) if frames else store
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the local columnar price store.")
+    parser.add_argument("--source", choices=["db", "csv"], default="db", help="Where new prices are read from")
+    parser.add_argument("--path", default=STORE_DIR, help="Directory holding the .npy files")
+    parser.add_argument("--full", action="store_true", help="Rebuild from scratch instead of appending")
+    args = parser.parse_args()
+
+    store = PriceStore.empty() if args.full else PriceStore.load(args.path, mmap=False)
+    if args.source == "csv":
+        store = refresh_from_csv(store)
+    else:
+        from db import get_connection
+
+        conn = get_connection()
+        cursor = conn.cursor()
+        store = refresh_from_db(store, cursor)
+        cursor.close()
+        conn.close()
+
+    store.save(args.path)
+    print(f"Price store at {args.path}: {len(store.dates)} dates x {len(store.tickers)} tickers, last date {store.last_date}")
@@ -1,15 +1,26 @@
 import os
 import sys
+import time
 import mysql.connector
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
-from benzinga import financial_data
+from db import get_connection
+from api_replay import REPLAYING
+from http_client import CachedBenzinga
+from rate_limiter import RateLimiter
+from ratings_writer import upsert_ratings
 
 # Retrieve API key from environment variables
 token = os.getenv("BENZINGA_API_KEY")
-if not token:
+# Replay mode serves recorded or generated responses and needs no key
+if not token and not REPLAYING:
     raise ValueError("No API key found in environment variables")
 
-bz = financial_data.Benzinga(token)
+# Concurrency settings for the Benzinga fetch (one SDK client per worker thread)
+MAX_WORKERS = int(os.getenv("RATINGS_FETCH_WORKERS", "8"))
+REQUESTS_PER_SECOND = float(os.getenv("BENZINGA_REQUESTS_PER_SECOND", "10"))
+
+bz = CachedBenzinga(token, rate_limiter=RateLimiter(REQUESTS_PER_SECOND))
 
 # List of S&P 500 tickers (as provided)
 sp500_tickers = [
@@ -44,68 +55,24 @@ sp500_tickers = [
     'WM', 'WAT', 'WEC', 'WFC', 'WELL', 'WST', 'WDC', 'WY', 'WMB', 'WTW', 'WYNN', 'XEL', 'XYL', 'YUM', 'ZBRA', 'ZBH', 'ZTS'
 ]
 
-# Retrieve MySQL password from environment variables
-mdp = os.getenv("MYSQL_MDP")
-if not mdp:
-    raise ValueError("No MySQL password found in environment variables")
-host = os.getenv("MYSQL_HOST")
-if not host:
-    raise ValueError("No Host found in environment variables")
-
-# Database connection configuration
-db_config = {
-    'user': 'doadmin',
-    'password': mdp,
-    'host': host,
-    'database': 'defaultdb',
-    'port': 25060
-}
-
-def get_oldest_and_newest_rating_dates(cursor, ticker):
+def load_rating_watermarks(cursor):
+    """Load the oldest and newest stored rating date of every ticker in a single grouped query."""
     query = """
-        SELECT MIN(date) AS oldest_date, MAX(date) AS newest_date
+        SELECT ticker, MIN(date) AS oldest_date, MAX(date) AS newest_date
         FROM ratings
-        WHERE ticker = %s
+        GROUP BY ticker
     """
-    cursor.execute(query, (ticker,))
-    result = cursor.fetchone()
-    return result['oldest_date'], result['newest_date']
+    cursor.execute(query)
+    return {row['ticker']: (row['oldest_date'], row['newest_date']) for row in cursor.fetchall()}
 
 def insert_rating_data(rating_data, cursor):
     added_ratings = 0
     try:
-        add_rating = ("INSERT INTO ratings "
-                      "(id, action_company, action_pt, adjusted_pt_current, adjusted_pt_prior, analyst, analyst_name, "
-                      "currency, date, exchange, importance, name, notes, pt_current, pt_prior, rating_current, "
-                      "rating_prior, ticker, time, updated, url, url_calendar, url_news) "
-                      "VALUES (%(id)s, %(action_company)s, %(action_pt)s, %(adjusted_pt_current)s, %(adjusted_pt_prior)s, "
-                      "%(analyst)s, %(analyst_name)s, %(currency)s, %(date)s, %(exchange)s, %(importance)s, %(name)s, "
-                      "%(notes)s, %(pt_current)s, %(pt_prior)s, %(rating_current)s, %(rating_prior)s, %(ticker)s, "
-                      "%(time)s, %(updated)s, %(url)s, %(url_calendar)s, %(url_news)s) "
-                      "ON DUPLICATE KEY UPDATE "
-                      "action_company = VALUES(action_company), action_pt = VALUES(action_pt), "
-                      "adjusted_pt_current = VALUES(adjusted_pt_current), adjusted_pt_prior = VALUES(adjusted_pt_prior), "
-                      "analyst = VALUES(analyst), analyst_name = VALUES(analyst_name), currency = VALUES(currency), "
-                      "date = VALUES(date), exchange = VALUES(exchange), importance = VALUES(importance), "
-                      "name = VALUES(name), notes = VALUES(notes), pt_current = VALUES(pt_current), "
-                      "pt_prior = VALUES(pt_prior), rating_current = VALUES(rating_current), "
-                      "rating_prior = VALUES(rating_prior), ticker = VALUES(ticker), time = VALUES(time), "
-                      "updated = VALUES(updated), url = VALUES(url), url_calendar = VALUES(url_calendar), "
-                      "url_news = VALUES(url_news)")
-
         if isinstance(rating_data, list) and rating_data:  # Check if the list is not empty
-            for rating in rating_data:
-                # Ensure correct data types
-                rating["adjusted_pt_current"] = float(rating["adjusted_pt_current"]) if rating["adjusted_pt_current"] else None
-                rating["adjusted_pt_prior"] = float(rating["adjusted_pt_prior"]) if rating["adjusted_pt_prior"] else None
-                rating["pt_current"] = float(rating["pt_current"]) if rating["pt_current"] else None
-                rating["pt_prior"] = float(rating["pt_prior"]) if rating["pt_prior"] else None
-
-                try:
-                    cursor.execute(add_rating, rating)
-                    added_ratings += 1
-                except mysql.connector.IntegrityError as dup_err:
-                    print(f"Duplicate entry found: {dup_err}. Continuing to next rating.")
+            stats = upsert_ratings(cursor, rating_data)
+            added_ratings = stats['inserted'] + stats['updated'] + stats['unchanged']
+            print(f"Ratings upserted: {stats['inserted']} inserted, {stats['updated']} updated, "
+                  f"{stats['unchanged']} unchanged, {stats['failed']} failed")
         else:
             print("No ratings data returned.")
 
@@ -117,52 +84,93 @@ def insert_rating_data(rating_data, cursor):
         print(f"An unexpected error occurred: {e}")
     return added_ratings
 
-def fetch_and_store_ratings_for_ticker(ticker, cursor):
+def plan_rating_windows(ticker, watermarks):
+    """Return the Benzinga request parameters needed to bring a ticker's ratings up to date."""
     today = datetime.today().date()
     five_years_ago = today - timedelta(days=5*365)
 
-    oldest_date, newest_date = get_oldest_and_newest_rating_dates(cursor, ticker)
+    oldest_date, newest_date = watermarks.get(ticker, (None, None))
+    windows = []
 
     if oldest_date and oldest_date >= five_years_ago:
         date_from = max(oldest_date - timedelta(days=1), five_years_ago)
         date_to = five_years_ago
         if date_from < date_to:
             # Request all ratings between oldest_date and 5 years ago
-            params = {
+            windows.append({
                 'company_tickers': ticker,
                 'date_from': date_from.strftime('%Y-%m-%d'),
                 'date_to': date_to.strftime('%Y-%m-%d')
-            }
-            print(f"Fetching data for {ticker} from {params['date_from']} to {params['date_to']}")
-            rating_data = bz.ratings(**params)
-            insert_rating_data(rating_data, cursor)
+            })
 
     if newest_date and newest_date < today:
         date_from = newest_date + timedelta(days=1)
         date_to = today
         if date_from <= date_to:
             # Request all ratings between newest_date and today
-            params = {
+            windows.append({
                 'company_tickers': ticker,
                 'date_from': date_from.strftime('%Y-%m-%d'),
                 'date_to': date_to.strftime('%Y-%m-%d')
-            }
-            print(f"Fetching data for {ticker} from {params['date_from']} to {params['date_to']}")
-            rating_data = bz.ratings(**params)
-            insert_rating_data(rating_data, cursor)
-
-def fetch_and_store_ratings(tickers):
+            })
+
+    return windows
+
+def fetch_ratings_for_ticker(ticker, windows):
+    """Fetch every planned window for a ticker. Runs on a worker thread and never touches the DB."""
+    start = time.perf_counter()
+    ratings = []
+    for params in windows:
+        print(f"Fetching data for {ticker} from {params['date_from']} to {params['date_to']}")
+        rating_data = bz.ratings(**params)
+        # The SDK returns {'ratings': [...]}, or an empty payload when nothing matched
+        if isinstance(rating_data, dict):
+            rating_data = rating_data.get('ratings', [])
+        if rating_data:
+            ratings.extend(rating_data)
+    return ratings, time.perf_counter() - start
+
+def fetch_and_store_ratings(tickers, max_workers=MAX_WORKERS):
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = get_connection()
         cursor = conn.cursor(dictionary=True)
+        run_start = time.perf_counter()
+
+        watermarks = load_rating_watermarks(cursor)
+        plans = {ticker: plan_rating_windows(ticker, watermarks) for ticker in tickers}
+        plans = {ticker: windows for ticker, windows in plans.items() if windows}
+        print(f"Planned {sum(len(w) for w in plans.values())} requests for {len(plans)} tickers "
+              f"with {max_workers} workers at {REQUESTS_PER_SECOND} requests/s")
+
+        timings = {}
+        total_added = 0
+        # Workers only talk to Benzinga; this thread is the single DB writer
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(fetch_ratings_for_ticker, ticker, windows): ticker
+                       for ticker, windows in plans.items()}
+            for future in as_completed(futures):
+                ticker = futures[future]
+                try:
+                    ratings, elapsed = future.result()
+                except Exception as e:
+                    print(f"Error fetching data for {ticker}: {e}")
+                    continue
+
+                write_start = time.perf_counter()
+                added = insert_rating_data(ratings, cursor) if ratings else 0
+                conn.commit()
+                timings[ticker] = elapsed
+                total_added += added
+                print(f"{ticker}: {added} ratings stored, fetch {elapsed:.2f}s, "
+                      f"write {time.perf_counter() - write_start:.2f}s")
 
-        for ticker in tickers:
-            fetch_and_store_ratings_for_ticker(ticker, cursor)
-
-        conn.commit()
         cursor.close()
         conn.close()
 
+        slowest = sorted(timings.items(), key=lambda item: item[1], reverse=True)[:5]
+        print(f"Stored {total_added} ratings for {len(timings)} tickers in {time.perf_counter() - run_start:.1f}s")
+        print("Slowest tickers: " + ", ".join(f"{t} ({s:.2f}s)" for t, s in slowest))
+
     except Exception as e:
         print(f"An error occurred: {e}")
 
@@ -1,154 +1,188 @@
 import os
 import sys
+import argparse
 import mysql.connector
-from datetime import datetime, timedelta
-from benzinga import financial_data
-
-# Retrieve API key and MySQL credentials from environment variables
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from db import get_connection
+from api_replay import REPLAYING
+from http_client import CachedBenzinga
+from rate_limiter import RateLimiter
+from ratings_writer import upsert_ratings
+
+# Retrieve API key from environment variables
 token = os.getenv("BENZINGA_API_KEY")
-mdp = os.getenv("MYSQL_MDP")
-host = os.getenv("MYSQL_HOST")
 
-if not token or not mdp or not host:
-    raise ValueError("API key or MySQL credentials missing in environment variables")
+# Replay mode serves recorded or generated responses and needs no key
+if not token and not REPLAYING:
+    raise ValueError("API key missing in environment variables")
 
-# Initialize Benzinga API client
-bz = financial_data.Benzinga(token)
+# Concurrency settings for the Benzinga fetch (one SDK client per worker thread)
+MAX_WORKERS = int(os.getenv("RATINGS_FETCH_WORKERS", "8"))
+REQUESTS_PER_SECOND = float(os.getenv("BENZINGA_REQUESTS_PER_SECOND", "10"))
 
-# Database connection configuration
-db_config = {
-    'user': 'doadmin',
-    'password': mdp,
-    'host': host,
-    'database': 'defaultdb',
-    'port': 25060
-}
+bz = CachedBenzinga(token, rate_limiter=RateLimiter(REQUESTS_PER_SECOND))
 
-# List of tickers to fetch ratings for
-tickers = [
+# Months covered by one backfill job
+CHUNK_MONTHS = {'month': 1, 'quarter': 3}
 
+# Window backfilled when no dates are given: the 2016 window the deployed stage (main.py's
+# 'ratings') has always run. A full backfill is an explicit one-off run, e.g.
+#   python price_target_history.py --date-from 2016-01-01 --date-to 2024-12-31 --tickers all
+DEFAULT_DATE_FROM = "2016-01-01"
+DEFAULT_DATE_TO = "2016-12-31"
 
-#    'MMM', 'AOS', 'ABT', 'ABBV', 'ACN', 'ADBE', 'AMD', 'AES', 'AFL', 'A', 'APD', 'ABNB', 'AKAM', 'ALB', 'ARE', 'ALGN', 'ALLE', 
-#    'LNT', 'ALL', 'GOOGL', 'GOOG', 'MO', 'AMZN', 'AMCR', 'AEE', 'AAL', 'AEP', 'AXP', 'AIG', 'AMT', 'AWK', 'AMP', 'AME', 'AMGN', 
-#    'APH', 'ADI', 'ANSS', 'AON', 'APA', 'AAPL', 'AMAT', 'APTV', 'ACGL', 'ADM', 'ANET', 'AJG', 'AIZ', 'T', 'ATO', 'ADSK', 'ADP', 
-#    'AZO', 'AVB', 'AVY', 'AXON', 'BKR', 'BALL', 'BAC', 'BK', 'BBWI', 'BAX', 'BDX', 'BRK.B', 'BBY', 'BIO', 'TECH', 'BIIB', 'BLK', 
-#    'BX', 'BA', 'BKNG', 'BWA', 'BSX', 'BMY', 'AVGO', 'BR', 'BRO', 'BF.B', 'BLDR', 'BG', 'BXP', 'CDNS', 'CZR', 'CPT', 'CPB', 'COF', 
-#    'CAH', 'KMX', 'CCL', 'CARR', 'CTLT', 'CAT', 'CBOE', 'CBRE', 'CDW', 'CE', 'COR', 'CNC', 'CNP', 'CF', 'CHRW', 'CRL', 'SCHW',
-#    'CHTR', 'CVX', 'CMG', 'CB', 'CHD', 'CI', 'CINF', 'CTAS', 'CSCO', 'C', 'CFG', 'CLX', 'CME', 'CMS', 'KO', 'CTSH', 'CL', 'CMCSA', 
-#    'CAG', 'COP', 'ED', 'STZ', 'CEG', 'COO', 'CPRT', 'GLW', 'CPAY', 'CTVA', 'CSGP', 'COST', 'CTRA', 'CRWD', 'CCI', 'CSX', 'CMI'
-#    'CVS', 'DHR', 'DRI', 'DVA', 'DAY', 'DECK', 'DE', 'DAL', 'DVN', 'DXCM', 'FANG', 'DLR', 'DFS', 'DG', 'DLTR', 'D', 'DPZ', 'DOV',
-#    'DOW', 'DHI', 'DTE', 'DUK', 'DD', 'EMN', 'ETN', 'EBAY', 'ECL', 'EIX', 'EW', 'EA', 'ELV', 'EMR', 'ENPH', 'ETR', 'EOG', 'EPAM',
-#    'EQT', 'EFX', 'EQIX', 'EQR', 'ESS', 'EL', 'ETSY', 'EG', 'EVRG', 'ES', 'EXC', 'EXPE', 'EXPD', 'EXR', 'XOM', 'FFIV', 'FDS',
-#    'FICO', 'FAST', 'FRT', 'FDX', 'FIS', 'FITB', 'FSLR', 'FE', 'FI', 'FMC', 'F', 'FTNT', 'FTV', 'FOXA', 'FOX', 'BEN', 'FCX', 'GRMN',
-#    'IT', 'GE', 'GEHC', 'GEV', 'GEN', 'GNRC', 'GD', 'GIS', 'GM', 'GPC', 'GILD', 'GPN', 'GL', 'GDDY', 'GS', 'HAL', 'HIG', 'HAS',
-#    'HCA', 'DOC', 'HSIC', 'HSY', 'HES', 'HPE', 'HLT', 'HOLX', 'HD', 'HON', 'HRL', 'HST', 'HWM', 'HPQ', 'HUBB', 'HUM', 'HBAN',
-#    'HII', 'IBM', 'IEX', 'IDXX', 'ITW', 'INCY', 'IR', 'PODD', 'INTC', 'ICE', 'IFF', 'IP', 'IPG', 'INTU', 'ISRG', 'IVZ', 'INVH',
-#    'IQV', 'IRM', 'JBHT', 'JBL', 'JKHY', 'J', 'JNJ', 'JCI', 'JPM', 'JNPR', 'K', 'KVUE', 'KDP', 'KEY', 'KEYS', 'KMB', 'KIM', 'KMI'
-#    'KKR', 'KLAC', 'KHC', 'KR', 'LHX', 'LH', 'LRCX', 'LW', 'LVS', 'LDOS', 'LEN', 'LLY', 'LIN', 'LYV', 'LKQ', 'LMT', 'L', 'LOW',
-#    'LULU', 'LYB', 'MTB', 'MRO', 'MPC', 'MKTX', 'MAR', 'MMC', 'MLM', 'MAS', 'MA', 'MTCH', 'MKC', 'MCD', 'MCK', 'MDT', 'MRK',
-#    'META', 'MET', 'MTD', 'MGM', 'MCHP', 'MU', 'MSFT', 'MAA', 'MRNA', 'MHK', 'MOH', 'TAP', 'MDLZ', 'MPWR', 'MNST', 'MCO', 'MS',
-#    'MOS', 'MSI', 'MSCI', 'NDAQ', 'NTAP', 'NFLX', 'NEM', 'NWSA', 'NWS', 'NEE', 'NKE', 'NI', 'NDSN', 'NSC', 'NTRS', 'NOC', 'NCLH',
-#    'NRG', 'NUE', 'NVDA', 'NVR', 'NXPI', 'ORLY', 'OXY', 'ODFL', 'OMC', 'ON', 'OKE', 'ORCL', 'OTIS', 'PCAR', 'PKG', 'PANW', 'PARA'
-#    'PH', 'PAYX', 'PAYC', 'PYPL', 'PNR', 'PEP', 'PFE', 'PCG', 'PM', 'PSX', 'PNW', 'PNC', 'POOL', 'PPG', 'PPL', 'PFG', 'PG', 'PGR',
-#    'PLD', 'PRU', 'PEG', 'PTC', 'PSA', 'PHM', 'QRVO', 'PWR', 'QCOM', 'DGX', 'RL', 'RJF', 'RTX', 'O', 'REG', 'REGN', 'RF', 'RSG',
-#    'RMD', 'RVTY', 'ROK', 'ROL', 'ROP', 'ROST', 'RCL', 'SPGI', 'CRM', 'SBAC', 'SLB', 'STX', 'SRE', 'NOW', 'SHW', 'SPG', 'SWKS'
-    'SJM', 'SW', 'SNA', 'SOLV', 'SO', 'LUV', 'SWK', 'SBUX', 'STT', 'STLD', 'STE', 'SYK', 'SMCI', 'SYF', 'SNPS', 'SYY', 'TMUS',
-    'TROW', 'TTWO', 'TPR', 'TRGP', 'TGT', 'TEL', 'TDY', 'TFX', 'TER', 'TSLA', 'TXN', 'TXT', 'TMO', 'TJX', 'TSCO', 'TT', 'TDG',
-    'TRV', 'TRMB', 'TFC', 'TYL', 'TSN', 'USB', 'UBER', 'UDR', 'ULTA', 'UNP', 'UAL', 'UPS', 'URI', 'UNH', 'UHS', 'VLO', 'VTR',
-    'VLTO', 'VRSN', 'VRSK', 'VZ', 'VRTX', 'VTRS', 'VICI', 'V', 'VST', 'VMC', 'WRB', 'GWW', 'WAB', 'WBA', 'WMT', 'DIS', 'WBD',
+# List of tickers to fetch ratings for
+tickers = [
+    'MMM', 'AOS', 'ABT', 'ABBV', 'ACN', 'ADBE', 'AMD', 'AES', 'AFL', 'A', 'APD', 'ABNB', 'AKAM', 'ALB', 'ARE', 'ALGN', 'ALLE', 
+    'LNT', 'ALL', 'GOOGL', 'GOOG', 'MO', 'AMZN', 'AMCR', 'AEE', 'AAL', 'AEP', 'AXP', 'AIG', 'AMT', 'AWK', 'AMP', 'AME', 'AMGN', 
+    'APH', 'ADI', 'ANSS', 'AON', 'APA', 'AAPL', 'AMAT', 'APTV', 'ACGL', 'ADM', 'ANET', 'AJG', 'AIZ', 'T', 'ATO', 'ADSK', 'ADP', 
+    'AZO', 'AVB', 'AVY', 'AXON', 'BKR', 'BALL', 'BAC', 'BK', 'BBWI', 'BAX', 'BDX', 'BRK.B', 'BBY', 'BIO', 'TECH', 'BIIB', 'BLK', 
+    'BX', 'BA', 'BKNG', 'BWA', 'BSX', 'BMY', 'AVGO', 'BR', 'BRO', 'BF.B', 'BLDR', 'BG', 'BXP', 'CDNS', 'CZR', 'CPT', 'CPB', 'COF', 
+    'CAH', 'KMX', 'CCL', 'CARR', 'CTLT', 'CAT', 'CBOE', 'CBRE', 'CDW', 'CE', 'COR', 'CNC', 'CNP', 'CF', 'CHRW', 'CRL', 'SCHW', 
+    'CHTR', 'CVX', 'CMG', 'CB', 'CHD', 'CI', 'CINF', 'CTAS', 'CSCO', 'C', 'CFG', 'CLX', 'CME', 'CMS', 'KO', 'CTSH', 'CL', 'CMCSA', 
+    'CAG', 'COP', 'ED', 'STZ', 'CEG', 'COO', 'CPRT', 'GLW', 'CPAY', 'CTVA', 'CSGP', 'COST', 'CTRA', 'CRWD', 'CCI', 'CSX', 'CMI', 
+    'CVS', 'DHR', 'DRI', 'DVA', 'DAY', 'DECK', 'DE', 'DAL', 'DVN', 'DXCM', 'FANG', 'DLR', 'DFS', 'DG', 'DLTR', 'D', 'DPZ', 'DOV', 
+    'DOW', 'DHI', 'DTE', 'DUK', 'DD', 'EMN', 'ETN', 'EBAY', 'ECL', 'EIX', 'EW', 'EA', 'ELV', 'EMR', 'ENPH', 'ETR', 'EOG', 'EPAM', 
+    'EQT', 'EFX', 'EQIX', 'EQR', 'ESS', 'EL', 'ETSY', 'EG', 'EVRG', 'ES', 'EXC', 'EXPE', 'EXPD', 'EXR', 'XOM', 'FFIV', 'FDS', 
+    'FICO', 'FAST', 'FRT', 'FDX', 'FIS', 'FITB', 'FSLR', 'FE', 'FI', 'FMC', 'F', 'FTNT', 'FTV', 'FOXA', 'FOX', 'BEN', 'FCX', 'GRMN', 
+    'IT', 'GE', 'GEHC', 'GEV', 'GEN', 'GNRC', 'GD', 'GIS', 'GM', 'GPC', 'GILD', 'GPN', 'GL', 'GDDY', 'GS', 'HAL', 'HIG', 'HAS', 
+    'HCA', 'DOC', 'HSIC', 'HSY', 'HES', 'HPE', 'HLT', 'HOLX', 'HD', 'HON', 'HRL', 'HST', 'HWM', 'HPQ', 'HUBB', 'HUM', 'HBAN', 
+    'HII', 'IBM', 'IEX', 'IDXX', 'ITW', 'INCY', 'IR', 'PODD', 'INTC', 'ICE', 'IFF', 'IP', 'IPG', 'INTU', 'ISRG', 'IVZ', 'INVH', 
+    'IQV', 'IRM', 'JBHT', 'JBL', 'JKHY', 'J', 'JNJ', 'JCI', 'JPM', 'JNPR', 'K', 'KVUE', 'KDP', 'KEY', 'KEYS', 'KMB', 'KIM', 'KMI', 
+    'KKR', 'KLAC', 'KHC', 'KR', 'LHX', 'LH', 'LRCX', 'LW', 'LVS', 'LDOS', 'LEN', 'LLY', 'LIN', 'LYV', 'LKQ', 'LMT', 'L', 'LOW', 
+    'LULU', 'LYB', 'MTB', 'MRO', 'MPC', 'MKTX', 'MAR', 'MMC', 'MLM', 'MAS', 'MA', 'MTCH', 'MKC', 'MCD', 'MCK', 'MDT', 'MRK', 
+    'META', 'MET', 'MTD', 'MGM', 'MCHP', 'MU', 'MSFT', 'MAA', 'MRNA', 'MHK', 'MOH', 'TAP', 'MDLZ', 'MPWR', 'MNST', 'MCO', 'MS', 
+    'MOS', 'MSI', 'MSCI', 'NDAQ', 'NTAP', 'NFLX', 'NEM', 'NWSA', 'NWS', 'NEE', 'NKE', 'NI', 'NDSN', 'NSC', 'NTRS', 'NOC', 'NCLH', 
+    'NRG', 'NUE', 'NVDA', 'NVR', 'NXPI', 'ORLY', 'OXY', 'ODFL', 'OMC', 'ON', 'OKE', 'ORCL', 'OTIS', 'PCAR', 'PKG', 'PANW', 'PARA', 
+    'PH', 'PAYX', 'PAYC', 'PYPL', 'PNR', 'PEP', 'PFE', 'PCG', 'PM', 'PSX', 'PNW', 'PNC', 'POOL', 'PPG', 'PPL', 'PFG', 'PG', 'PGR', 
+    'PLD', 'PRU', 'PEG', 'PTC', 'PSA', 'PHM', 'QRVO', 'PWR', 'QCOM', 'DGX', 'RL', 'RJF', 'RTX', 'O', 'REG', 'REGN', 'RF', 'RSG', 
+    'RMD', 'RVTY', 'ROK', 'ROL', 'ROP', 'ROST', 'RCL', 'SPGI', 'CRM', 'SBAC', 'SLB', 'STX', 'SRE', 'NOW', 'SHW', 'SPG', 'SWKS', 
+    'SJM', 'SW', 'SNA', 'SOLV', 'SO', 'LUV', 'SWK', 'SBUX', 'STT', 'STLD', 'STE', 'SYK', 'SMCI', 'SYF', 'SNPS', 'SYY', 'TMUS', 
+    'TROW', 'TTWO', 'TPR', 'TRGP', 'TGT', 'TEL', 'TDY', 'TFX', 'TER', 'TSLA', 'TXN', 'TXT', 'TMO', 'TJX', 'TSCO', 'TT', 'TDG', 
+    'TRV', 'TRMB', 'TFC', 'TYL', 'TSN', 'USB', 'UBER', 'UDR', 'ULTA', 'UNP', 'UAL', 'UPS', 'URI', 'UNH', 'UHS', 'VLO', 'VTR', 
+    'VLTO', 'VRSN', 'VRSK', 'VZ', 'VRTX', 'VTRS', 'VICI', 'V', 'VST', 'VMC', 'WRB', 'GWW', 'WAB', 'WBA', 'WMT', 'DIS', 'WBD', 
     'WM', 'WAT', 'WEC', 'WFC', 'WELL', 'WST', 'WDC', 'WY', 'WMB', 'WTW', 'WYNN', 'XEL', 'XYL', 'YUM', 'ZBRA', 'ZBH', 'ZTS'
+]
 
+# Tickers backfilled when none are given: the part of the list the deployed stage has always run
+DEFAULT_TICKERS = tickers[tickers.index('SJM'):]
 
+# Columns refreshed when a rating already exists
+UPDATE_COLUMNS = [
+    'adjusted_pt_current', 'adjusted_pt_prior', 'pt_current', 'pt_prior',
+    'rating_current', 'rating_prior', 'updated'
 ]
 
-def safe_cast(value, target_type, default=None):
-    """Safely cast values to the target type, with a fallback to a default value if casting fails."""
-    try:
-        return target_type(value)
-    except (ValueError, TypeError):
-        return default
-
 def insert_rating_data(rating_data, cursor):
-    """Insert rating data into the MySQL database."""
-    try:
-        add_rating = ("""
-            INSERT INTO ratings 
-            (id, action_company, action_pt, adjusted_pt_current, adjusted_pt_prior, analyst, analyst_name,
-             currency, date, exchange, importance, name, notes, pt_current, pt_prior, rating_current, 
-             rating_prior, ticker, time, updated, url, url_calendar, url_news) 
-            VALUES (%(id)s, %(action_company)s, %(action_pt)s, %(adjusted_pt_current)s, %(adjusted_pt_prior)s, 
-                    %(analyst)s, %(analyst_name)s, %(currency)s, %(date)s, %(exchange)s, %(importance)s, 
-                    %(name)s, %(notes)s, %(pt_current)s, %(pt_prior)s, %(rating_current)s, %(rating_prior)s, 
-                    %(ticker)s, %(time)s, %(updated)s, %(url)s, %(url_calendar)s, %(url_news)s)
-            ON DUPLICATE KEY UPDATE
-            adjusted_pt_current = VALUES(adjusted_pt_current), 
-            adjusted_pt_prior = VALUES(adjusted_pt_prior), 
-            pt_current = VALUES(pt_current), 
-            pt_prior = VALUES(pt_prior), 
-            rating_current = VALUES(rating_current),
-            rating_prior = VALUES(rating_prior), 
-            updated = VALUES(updated)
-        """)
-
-        added_ratings = 0
-        for rating in rating_data:
-            # Safely cast each value to the appropriate data type
-            rating['adjusted_pt_current'] = safe_cast(rating.get('adjusted_pt_current'), float, None)
-            rating['adjusted_pt_prior'] = safe_cast(rating.get('adjusted_pt_prior'), float, None)
-            rating['pt_current'] = safe_cast(rating.get('pt_current'), float, None)
-            rating['pt_prior'] = safe_cast(rating.get('pt_prior'), float, None)
-
-            # Ensure 'analyst_name' is present even if it's None or missing
-            rating['analyst_name'] = rating.get('analyst_name', '')
-
-            try:
-                cursor.execute(add_rating, rating)
-                added_ratings += 1
-            except mysql.connector.Error as err:
-                print(f"Error inserting rating data for {rating['ticker']} at {rating['date']}: {err}")
-                continue  # Skip to the next rating if there's an issue with the current one
-
-        return added_ratings
-
-    except mysql.connector.Error as err:
-        print(f"Error inserting rating data: {err}")
-        return 0
-
-def fetch_ratings_for_september(ticker, cursor):
-    """Fetch ratings for September 2024 for the given ticker."""
-    # Set the start and end date for September 2024
-    date_from = "2016-01-01"
-    date_to = "2016-12-31"
-
+    """Insert rating data into the MySQL database; returns upsert_ratings' counts and lets database errors raise."""
+    stats = upsert_ratings(cursor, rating_data, update_columns=UPDATE_COLUMNS)
+    print(f"Ratings upserted: {stats['inserted']} inserted, {stats['updated']} updated, "
+          f"{stats['unchanged']} unchanged, {stats['failed']} failed")
+    return stats
+
+def ensure_checkpoint_table(cursor):
+    """Create the table recording which (ticker, date window) backfill jobs are complete."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ratings_backfill_checkpoints (
+            ticker VARCHAR(10),
+            date_from DATE,
+            date_to DATE,
+            ratings_count INT,
+            completed_at DATETIME,
+            PRIMARY KEY (ticker, date_from, date_to)
+        )
+    """)
+
+def load_completed_jobs(cursor):
+    """Return the set of (ticker, date_from, date_to) jobs already stored by a previous run."""
+    cursor.execute("SELECT ticker, date_from, date_to FROM ratings_backfill_checkpoints")
+    return set(cursor.fetchall())
+
+def mark_job_completed(cursor, job, ratings_count):
+    ticker, date_from, date_to = job
+    cursor.execute("""
+        INSERT INTO ratings_backfill_checkpoints (ticker, date_from, date_to, ratings_count, completed_at)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE ratings_count = VALUES(ratings_count), completed_at = VALUES(completed_at)
+    """, (ticker, date_from, date_to, ratings_count, datetime.now()))
+
+def chunk_date_range(date_from, date_to, chunk):
+    """Split [date_from, date_to] into calendar-aligned month or quarter windows."""
+    months = CHUNK_MONTHS[chunk]
+    windows = []
+    start = date_from
+    while start <= date_to:
+        # First day of the next month/quarter boundary after start
+        month_index = start.year * 12 + start.month - 1
+        boundary_index = (month_index // months + 1) * months
+        boundary = date(boundary_index // 12, boundary_index % 12 + 1, 1)
+        end = min(boundary - timedelta(days=1), date_to)
+        windows.append((start, end))
+        start = boundary
+    return windows
+
+def plan_backfill_jobs(tickers, date_from, date_to, chunk, completed_jobs):
+    """Return the (ticker, date_from, date_to) jobs still missing from the checkpoint table."""
+    windows = chunk_date_range(date_from, date_to, chunk)
+    return [(ticker, start, end) for ticker in tickers for start, end in windows
+            if (ticker, start, end) not in completed_jobs]
+
+def fetch_ratings_for_job(job):
+    """Fetch the ratings of one backfill job. Runs on a worker thread and never touches the DB."""
+    ticker, date_from, date_to = job
     params = {
         'company_tickers': ticker,
-        'date_from': date_from,
-        'date_to': date_to
+        'date_from': date_from.strftime('%Y-%m-%d'),
+        'date_to': date_to.strftime('%Y-%m-%d')
     }
+    rating_data = bz.ratings(**params)
+    if rating_data and 'ratings' in rating_data and rating_data['ratings']:
+        return rating_data['ratings']
+    return []
 
-    print(f"Fetching ratings for {ticker} from {date_from} to {date_to}...")
-
-    try:
-        rating_data = bz.ratings(**params)
-        if rating_data and 'ratings' in rating_data and rating_data['ratings']:
-            added_ratings = insert_rating_data(rating_data['ratings'], cursor)
-            print(f"Successfully added {added_ratings} ratings for {ticker}")
-        else:
-            print(f"No ratings found for {ticker} in September 2024")
-    except Exception as e:
-        print(f"Error fetching data for {ticker}: {e}")
-
-def fetch_and_store_ratings(tickers):
-    """Fetch and store ratings for each ticker for September 2024."""
+def backfill_ratings(tickers, date_from, date_to, chunk='month', max_workers=MAX_WORKERS):
+    """Backfill ratings for every ticker over [date_from, date_to], resuming from the checkpoint table."""
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = get_connection()
         cursor = conn.cursor()
 
-        # Loop through each ticker and fetch ratings for September 2024
-        for ticker in tickers:
-            fetch_ratings_for_september(ticker, cursor)
-
+        ensure_checkpoint_table(cursor)
         conn.commit()
+        jobs = plan_backfill_jobs(tickers, date_from, date_to, chunk, load_completed_jobs(cursor))
+        print(f"{len(jobs)} {chunk} jobs left for {len(tickers)} tickers from {date_from} to {date_to}")
+
+        today = datetime.today().date()
+        done = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(fetch_ratings_for_job, job): job for job in jobs}
+            for future in as_completed(futures):
+                job = futures[future]
+                ticker, start, end = job
+                try:
+                    ratings = future.result()
+                except Exception as e:
+                    print(f"Error fetching data for {ticker} from {start} to {end}: {e}")
+                    continue
+
+                try:
+                    stats = insert_rating_data(ratings, cursor) if ratings else None
+                    added_ratings = stats['inserted'] + stats['updated'] + stats['unchanged'] if stats else 0
+                    # Only a chunk stored in full is checkpointed; a window reaching today may still
+                    # receive ratings, so it never is
+                    if stats and stats['failed']:
+                        print(f"{ticker} {start} to {end}: {stats['failed']} ratings failed, chunk left for the next run")
+                    elif end < today:
+                        mark_job_completed(cursor, job, added_ratings)
+                    # Ratings and checkpoint are committed together so a crash never skips a chunk
+                    conn.commit()
+                except mysql.connector.Error as err:
+                    conn.rollback()
+                    print(f"Error storing data for {ticker} from {start} to {end}: {err}")
+                    continue
+                done += 1
+                print(f"[{done}/{len(jobs)}] {ticker} {start} to {end}: {added_ratings} ratings")
+
         cursor.close()
         conn.close()
 
@@ -157,18 +191,43 @@ def fetch_and_store_ratings(tickers):
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Restartable historical backfill of Benzinga ratings.")
+    parser.add_argument("--date-from", default=DEFAULT_DATE_FROM, help=f"First day to backfill (YYYY-MM-DD, default {DEFAULT_DATE_FROM})")
+    parser.add_argument("--date-to", default=DEFAULT_DATE_TO, help=f"Last day to backfill (YYYY-MM-DD, default {DEFAULT_DATE_TO})")
+    parser.add_argument("--chunk", choices=sorted(CHUNK_MONTHS), default="month", help="Size of each backfill job")
+    parser.add_argument("--tickers", help=f"Comma-separated tickers, or 'all' for the S&P 500 list "
+                                          f"(default: the {len(DEFAULT_TICKERS)} tickers from {DEFAULT_TICKERS[0]} on)")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="Number of concurrent Benzinga requests")
+    return parser.parse_args(argv)
+
 def exit_program():
     """Exit the program."""
     print("Exiting the program...")
     sys.exit(0)
 
-# Script execution
-try:
-    fetch_and_store_ratings(tickers)
-    exit_program()
-except Exception as e:
-    print(f"An error occurred: {e}")
-    exit_program()
-except Exception as e:
-    print(f"An error occurred: {e}")
-    exit_program()
+def main(argv=None):
+    """Script entry point, also called by main.py's pipeline."""
+    try:
+        args = parse_args(argv)
+        if not args.tickers:
+            selected_tickers = DEFAULT_TICKERS
+        elif args.tickers.strip().lower() == 'all':
+            selected_tickers = tickers
+        else:
+            selected_tickers = [t.strip().upper() for t in args.tickers.split(",")]
+        backfill_ratings(
+            selected_tickers,
+            datetime.strptime(args.date_from, '%Y-%m-%d').date(),
+            datetime.strptime(args.date_to, '%Y-%m-%d').date(),
+            chunk=args.chunk,
+            max_workers=args.workers
+        )
+        exit_program()
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        exit_program()
+
+# Script execution (guarded so the planning helpers can be imported)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+
+# Column names of the 15-column statistics rows, in order
+STATISTICS_COLUMNS = [
+    'ticker', 'average_price_target', 'stddev_price_target', 'num_analysts', 'last_update_date',
+    'avg_days_since_last_update', 'num_recent_analysts', 'stddev_price_target_recent',
+    'average_price_target_recent', 'num_high_success_analysts', 'stddev_high_success_analysts',
+    'avg_high_success_analysts', 'num_combined_criteria', 'stddev_combined_criteria', 'avg_combined_criteria'
+]
+
+def load_ratings(cursor, until):
+    """Load every rating up to `until` in date order, the only ratings read for a whole simulation."""
+    cursor.execute("""
+        SELECT ticker, analyst_name, date, adjusted_pt_current
+        FROM ratings
+        WHERE date <= %s AND analyst_name IS NOT NULL
+        ORDER BY date
+    """, (until,))
+    return [(ticker, analyst_name, to_date(date), None if pt is None else float(pt))
+            for ticker, analyst_name, date, pt in cursor.fetchall()]
+
+def load_analyst_rates(cursor):
+    """Map analysts.name_full to its success rates (a list, since several analysts can share a name)."""
+    cursor.execute("SELECT name_full, overall_success_rate FROM analysts")
+    rates = defaultdict(list)
+    for name_full, overall_success_rate in cursor.fetchall():
+        rates[name_full].append(overall_success_rate)
+    return dict(rates)
+
+def to_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+def _mean(values):
+    return sum(values) / len(values) if values else None
+
+def _stddev(values):
+    """Population standard deviation, like MySQL's STDDEV."""
+    if not values:
+        return None
+    mean = sum(values) / len(values)
+    return math.sqrt(sum((v - mean) ** 2 for v in values) / len(values))
+
+def _avg_decimal(values):
+    mean = _mean(values)
+    return None if mean is None else Decimal(f"{mean:.6f}")
+
+class IncrementalPriceTargetStats:
+    """
+    Weekly price target statistics computed in one sweep over the ratings.
+
+    Ratings are consumed in date order while the latest rating date of every (ticker, analyst)
+    pair and the targets published on that date are kept in memory. advance_to(date) then yields
+    the same 15 columns as calculate_price_target_statistics' SQL for that date, so rebuilding the
+    whole weekly history reads the ratings once instead of re-joining them for every week.
+    """
+
+    def __init__(self, ratings, analyst_rates, days_recent, success_rate_threshold, point_in_time_rates=None):
+        self.ratings = ratings
+        self.analyst_rates = analyst_rates
+        self.days_recent = days_recent
+        self.success_rate_threshold = success_rate_threshold
+        # Optional analyst_success.PointInTimeAnalystRates replacing the live analysts snapshot
+        self.point_in_time_rates = point_in_time_rates
+        self.position = 0
+        # ticker -> analyst_name -> [latest date, [adjusted_pt_current published that day]]
+        self.latest = defaultdict(dict)
+
+    @classmethod
+    def from_cursor(cls, cursor, until, days_recent, success_rate_threshold, point_in_time_rates=None):
+        analyst_rates = {} if point_in_time_rates else load_analyst_rates(cursor)
+        return cls(load_ratings(cursor, until), analyst_rates, days_recent, success_rate_threshold, point_in_time_rates)
+
+    def advance_to(self, analysis_date):
+        """Absorb the ratings published up to analysis_date and return that date's statistics."""
+        analysis_date = to_date(analysis_date)
+        ratings = self.ratings
+        while self.position < len(ratings) and ratings[self.position][2] <= analysis_date:
+            ticker, analyst_name, date, pt = ratings[self.position]
+            entry = self.latest[ticker].get(analyst_name)
+            if entry is None or date > entry[0]:
+                self.latest[ticker][analyst_name] = [date, [pt]]
+            elif date == entry[0]:
+                entry[1].append(pt)
+            self.position += 1
+        if self.point_in_time_rates is not None:
+            rates, self.success_rate_threshold = self.point_in_time_rates.rates_as_of(analysis_date)
+            self.analyst_rates = {name: [rate] for name, rate in rates.items()}
+        return self.statistics(analysis_date)
+
+    def statistics(self, analysis_date):
+        """Aggregate the in-memory latest ratings per ticker, mirroring the SQL column order."""
+        recent_cutoff = analysis_date - timedelta(days=self.days_recent)
+        threshold = self.success_rate_threshold
+        # Point-in-time rates are left-joined: analysts not judged yet still count, never as high success
+        unrated = (None,) if self.point_in_time_rates is not None else ()
+        results = []
+
+        for ticker, analysts in self.latest.items():
+            all_pts, recent_pts, high_pts, combined_pts = [], [], [], []
+            names, recent_names, high_names, combined_names = set(), set(), set(), set()
+            last_update_date = None
+            days_total = 0
+            row_count = 0
+
+            for analyst_name, (date, pts) in analysts.items():
+                # Inner join with analysts: one joined row per matching analysts row
+                for rate in self.analyst_rates.get(analyst_name, unrated):
+                    is_recent = date >= recent_cutoff
+                    is_high = rate is not None and threshold is not None and rate > threshold
+                    names.add(analyst_name)
+                    if is_recent:
+                        recent_names.add(analyst_name)
+                    if is_high:
+                        high_names.add(analyst_name)
+                    if is_recent and is_high:
+                        combined_names.add(analyst_name)
+                    if last_update_date is None or date > last_update_date:
+                        last_update_date = date
+
+                    for pt in pts:
+                        row_count += 1
+                        days_total += (analysis_date - date).days
+                        if pt is None:
+                            continue
+                        all_pts.append(pt)
+                        if is_recent:
+                            recent_pts.append(pt)
+                        if is_high:
+                            high_pts.append(pt)
+                        if is_recent and is_high:
+                            combined_pts.append(pt)
+
+            if not row_count:
+                continue
+
+            results.append((
+                ticker,
+                _avg_decimal(all_pts), _stddev(all_pts), len(names),
+                last_update_date, Decimal(f"{days_total / row_count:.4f}"),
+                len(recent_names), _stddev(recent_pts), _avg_decimal(recent_pts),
+                len(high_names), _stddev(high_pts), _avg_decimal(high_pts),
+                len(combined_names), _stddev(combined_pts), _avg_decimal(combined_pts),
+            ))
+
+        return results
+
+def load_ratings_frame(cursor, until=None):
+    """Load the ratings needed by compute_price_target_statistics into a DataFrame, in one query."""
+    query = "SELECT ticker, analyst_name, date, adjusted_pt_current FROM ratings WHERE analyst_name IS NOT NULL"
+    params = ()
+    if until is not None:
+        query += " AND date <= %s"
+        params = (until,)
+    cursor.execute(query, params)
+    ratings = pd.DataFrame(cursor.fetchall(), columns=['ticker', 'analyst_name', 'date', 'adjusted_pt_current'])
+    ratings['date'] = pd.to_datetime(ratings['date'])
+    ratings['adjusted_pt_current'] = pd.to_numeric(ratings['adjusted_pt_current'], errors='coerce').astype('float64')
+    return ratings
+
+def point_in_time_analysts_frame(point_in_time_rates, analysis_date):
+    """analysts-like frame (name_full, overall_success_rate) and median threshold for one week."""
+    rates, threshold = point_in_time_rates.rates_as_of(analysis_date)
+    analysts = pd.DataFrame({'name_full': list(rates), 'overall_success_rate': list(rates.values())},
+                            columns=['name_full', 'overall_success_rate'])
+    analysts['overall_success_rate'] = analysts['overall_success_rate'].astype('float64')
+    return analysts, threshold
+
+def load_analysts_frame(cursor):
+    cursor.execute("SELECT name_full, overall_success_rate FROM analysts")
+    analysts = pd.DataFrame(cursor.fetchall(), columns=['name_full', 'overall_success_rate'])
+    analysts['overall_success_rate'] = pd.to_numeric(analysts['overall_success_rate'], errors='coerce').astype('float64')
+    return analysts
+
+def compute_price_target_statistics(ratings, analysts, analysis_time, days_recent, success_rate_threshold, as_of=False,
+                                    keep_unrated=False):
+    """
+    Vectorized equivalent of calculate_price_target_statistics' SQL.
+
+    analysis_time plays the role of NOW() (or of the simulated date); with as_of=True ratings
+    published after it are ignored, as in analysis_simulation. keep_unrated left-joins analysts
+    (used with point-in-time rates). Returns the same 15-column tuples.
+    """
+    now = pd.Timestamp(analysis_time)
+    today = now.normalize()
+    if as_of:
+        ratings = ratings[ratings['date'] <= now]
+
+    # Latest rating date per (ticker, analyst), then every rating published on that date
+    latest_date = ratings.groupby(['ticker', 'analyst_name'])['date'].transform('max')
+    latest = ratings[ratings['date'] == latest_date]
+    joined = latest.merge(analysts, left_on='analyst_name', right_on='name_full', how='left' if keep_unrated else 'inner')
+    if joined.empty:
+        return []
+
+    recent = joined['date'] >= now - pd.Timedelta(days=days_recent)
+    high = joined['overall_success_rate'] > (np.nan if success_rate_threshold is None else float(success_rate_threshold))
+    masks = {'all': None, 'recent': recent, 'high': high, 'combined': recent & high}
+
+    columns = pd.DataFrame({'ticker': joined['ticker']})
+    for name, mask in masks.items():
+        columns[f'pt_{name}'] = joined['adjusted_pt_current'] if mask is None else joined['adjusted_pt_current'].where(mask)
+        columns[f'analyst_{name}'] = joined['analyst_name'] if mask is None else joined['analyst_name'].where(mask)
+    columns['date'] = joined['date']
+    columns['days'] = (today - joined['date']).dt.days
+
+    grouped = columns.groupby('ticker', sort=False)
+    stats = pd.DataFrame({'last_update_date': grouped['date'].max(), 'avg_days': grouped['days'].mean()})
+    for name in masks:
+        stats[f'avg_{name}'] = grouped[f'pt_{name}'].mean()
+        stats[f'std_{name}'] = grouped[f'pt_{name}'].std(ddof=0)
+        stats[f'num_{name}'] = grouped[f'analyst_{name}'].nunique()
+
+    def avg(value):
+        return None if pd.isna(value) else Decimal(f"{value:.6f}")
+
+    def std(value):
+        return None if pd.isna(value) else float(value)
+
+    return [
+        (ticker,
+         avg(row.avg_all), std(row.std_all), int(row.num_all),
+         row.last_update_date.date(), Decimal(f"{row.avg_days:.4f}"),
+         int(row.num_recent), std(row.std_recent), avg(row.avg_recent),
+         int(row.num_high), std(row.std_high), avg(row.avg_high),
+         int(row.num_combined), std(row.std_combined), avg(row.avg_combined))
+        for ticker, row in stats.iterrows()
+    ]
+
+def compare_statistics(expected, actual, tolerance=1e-4):
+    """Return human-readable differences between two lists of 15-column statistics rows."""
+    expected_by_ticker = {row[0]: row for row in expected}
+    actual_by_ticker = {row[0]: row for row in actual}
+    differences = []
+    for ticker in sorted(set(expected_by_ticker) | set(actual_by_ticker)):
+        left, right = expected_by_ticker.get(ticker), actual_by_ticker.get(ticker)
+        if left is None or right is None:
+            differences.append(f"{ticker}: only in {'actual' if left is None else 'expected'}")
+            continue
+        for column, (a, b) in enumerate(zip(left[1:], right[1:]), start=1):
+            if a is None or b is None:
+                same = a is None and b is None
+            elif isinstance(a, (int, float, Decimal)):
+                same = abs(float(a) - float(b)) <= tolerance * max(1.0, abs(float(a)))
+            else:
+                same = to_date(a) == to_date(b)
+            if not same:
+                differences.append(f"{ticker}: column {STATISTICS_COLUMNS[column]} expected {a}, got {b}")
+    return differences
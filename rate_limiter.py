@@ -0,0 +1,23 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """Thread-safe limiter spacing calls to at most `rate` per second across all workers."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def wait(self):
+        """Block until the caller is allowed to issue its next request."""
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
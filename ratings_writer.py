@@ -0,0 +1,99 @@
+import os
+import mysql.connector
+
+# Columns of the ratings table, in insert order ('id' is the primary key)
+RATING_COLUMNS = [
+    'id', 'action_company', 'action_pt', 'adjusted_pt_current', 'adjusted_pt_prior', 'analyst', 'analyst_name',
+    'currency', 'date', 'exchange', 'importance', 'name', 'notes', 'pt_current', 'pt_prior', 'rating_current',
+    'rating_prior', 'ticker', 'time', 'updated', 'url', 'url_calendar', 'url_news'
+]
+PRICE_TARGET_COLUMNS = ['adjusted_pt_current', 'adjusted_pt_prior', 'pt_current', 'pt_prior']
+
+# Number of ratings sent per multi-row INSERT
+BATCH_SIZE = int(os.getenv("RATINGS_BATCH_SIZE", "500"))
+
+def safe_cast(value, target_type, default=None):
+    """Safely cast values to the target type, with a fallback to a default value if casting fails."""
+    try:
+        return target_type(value)
+    except (ValueError, TypeError):
+        return default
+
+def normalize_rating(rating):
+    """Turn a Benzinga rating dict into a row tuple ordered like RATING_COLUMNS."""
+    row = {column: rating.get(column) for column in RATING_COLUMNS}
+    for column in PRICE_TARGET_COLUMNS:
+        row[column] = safe_cast(row[column], float, None)
+    # Ensure 'analyst_name' is present even if it's missing
+    row['analyst_name'] = rating.get('analyst_name', '')
+    return tuple(row[column] for column in RATING_COLUMNS)
+
+def build_upsert_query(num_rows, update_columns):
+    """Build a multi-row INSERT ... ON DUPLICATE KEY UPDATE statement for num_rows ratings."""
+    row_placeholder = "(" + ", ".join(["%s"] * len(RATING_COLUMNS)) + ")"
+    updates = ", ".join(f"{column} = VALUES({column})" for column in update_columns)
+    return (f"INSERT INTO ratings ({', '.join(RATING_COLUMNS)}) "
+            f"VALUES {', '.join([row_placeholder] * num_rows)} "
+            f"ON DUPLICATE KEY UPDATE {updates}")
+
+def fetch_existing_ids(cursor, ids):
+    """Return the subset of ids that already exist in the ratings table."""
+    cursor.execute(f"SELECT id FROM ratings WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+    return {row['id'] if isinstance(row, dict) else row[0] for row in cursor.fetchall()}
+
+def upsert_rows_one_by_one(cursor, rows, update_columns, stats):
+    """Fallback for a failed batch: write each row on its own so a bad rating only skips itself."""
+    query = build_upsert_query(1, update_columns)
+    for row in rows:
+        try:
+            cursor.execute(query, row)
+        except mysql.connector.Error as err:
+            stats['failed'] += 1
+            print(f"Error inserting rating {row[0]} for {row[17]} at {row[8]}: {err}")
+            continue
+        # MySQL reports 1 affected row for an insert, 2 for a changed row and 0 for an identical one
+        if cursor.rowcount == 1:
+            stats['inserted'] += 1
+        elif cursor.rowcount == 2:
+            stats['updated'] += 1
+        else:
+            stats['unchanged'] += 1
+
+def upsert_ratings(cursor, ratings, update_columns=RATING_COLUMNS[1:], batch_size=BATCH_SIZE):
+    """
+    Upsert Benzinga ratings in multi-row batches.
+
+    Returns a dict with the number of inserted, updated, unchanged and failed ratings.
+    """
+    stats = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'failed': 0}
+
+    # Keep the last copy of each id so the counts below match what MySQL sees
+    rows_by_id = {}
+    for rating in ratings:
+        try:
+            row = normalize_rating(rating)
+        except Exception as e:
+            stats['failed'] += 1
+            print(f"Skipping malformed rating {rating!r}: {e}")
+            continue
+        rows_by_id[row[0]] = row
+    rows = list(rows_by_id.values())
+
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        try:
+            existing_ids = fetch_existing_ids(cursor, [row[0] for row in batch])
+            cursor.execute(build_upsert_query(len(batch), update_columns),
+                           [value for row in batch for value in row])
+        except mysql.connector.Error as err:
+            print(f"Batch of {len(batch)} ratings failed ({err}), retrying row by row")
+            upsert_rows_one_by_one(cursor, batch, update_columns, stats)
+            continue
+
+        inserted = len(batch) - len(existing_ids)
+        updated = (cursor.rowcount - inserted) // 2
+        stats['inserted'] += inserted
+        stats['updated'] += updated
+        stats['unchanged'] += len(existing_ids) - updated
+
+    return stats
@@ -2,29 +2,24 @@ import os
 import sys
 import requests
 import mysql.connector
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime  # Import the datetime module
+from db import get_connection
+from api_replay import REPLAYING
+from http_client import get_json
 
 # Retrieve API key from environment variables
 marketdata_api_key = os.getenv("MARKETDATA_API")
-if not marketdata_api_key:
+# Replay mode serves recorded or generated responses and needs no key
+if not marketdata_api_key and not REPLAYING:
     raise ValueError("No MarketData.app API key found in environment variables")
 
-# Retrieve MySQL password and host from environment variables
-mdp = os.getenv("MYSQL_MDP")
-if not mdp:
-    raise ValueError("No MySQL password found in environment variables")
-host = os.getenv("MYSQL_HOST")
-if not host:
-    raise ValueError("No Host found in environment variables")
-
-# Database connection configuration
-db_config = {
-    'user': 'doadmin',
-    'password': mdp,
-    'host': host,
-    'database': 'defaultdb',
-    'port': 25060
-}
+BULKQUOTES_URL = "https://api.marketdata.app/v1/stocks/bulkquotes/"
+# Symbols per bulkquotes request and number of requests in flight
+BULKQUOTES_BATCH_SIZE = int(os.getenv("BULKQUOTES_BATCH_SIZE", "100"))
+FETCH_WORKERS = int(os.getenv("MARKETDATA_FETCH_WORKERS", "4"))
+
+AUTH_HEADERS = {"Authorization": f"Bearer {marketdata_api_key}"}
 
 # List of S&P 500 tickers
 sp500_tickers = [
@@ -60,31 +55,38 @@ sp500_tickers = [
 
 ]
 
+def upsert_prices(cursor, price_data):
+    """
+    Store the day's closes with one conditional multi-row upsert: a stored close is only
+    overwritten when it is missing or zero. Returns the inserted / updated / skipped counts.
+    """
+    rows = list({(price['ticker'], price['date']): price['close'] for price in price_data}.items())
+    keys = [key for key, _ in rows]
+
+    # Pre-count the rows that already exist; the upsert's rowcount (1 per insert, 2 per update,
+    # 0 per untouched row) then tells updates from skips
+    cursor.execute(
+        "SELECT COUNT(*) FROM prices WHERE (ticker, date) IN (" + ", ".join(["(%s, %s)"] * len(keys)) + ")",
+        [value for key in keys for value in key])
+    existing = cursor.fetchone()[0]
+
+    cursor.execute(
+        "INSERT INTO prices (ticker, date, close) VALUES " + ", ".join(["(%s, %s, %s)"] * len(rows)) +
+        " ON DUPLICATE KEY UPDATE close = IF(close IS NULL OR close = 0, VALUES(close), close)",
+        [value for (ticker, date), close in rows for value in (ticker, date, close)])
+
+    inserted = len(rows) - existing
+    updated = (cursor.rowcount - inserted) // 2
+    return {'inserted': inserted, 'updated': updated, 'skipped': existing - updated}
+
 def insert_price_data(price_data):
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = get_connection()
         cursor = conn.cursor()
-        add_price = ("INSERT INTO prices (ticker, date, close) "
-                     "VALUES (%(ticker)s, %(date)s, %(close)s) "
-                     "ON DUPLICATE KEY UPDATE close = VALUES(close)")
-
-        for price in price_data:
-            ticker = price['ticker']
-            date = price['date']
-            close_price = price['close']
-
-            print(f"Processing {ticker} for date {date} with close price {close_price}")
-
-            cursor.execute("SELECT close FROM prices WHERE ticker = %s AND date = %s", (ticker, date))
-            existing_close_price = cursor.fetchone()
-
-            if existing_close_price is None or existing_close_price[0] == 0:
-                cursor.execute(add_price, price)
-                print(f"Inserted/Updated {ticker} on {date} with close price {close_price}")
-            else:
-                print(f"Skipped {ticker} on {date} as the close price is already non-zero in the database")
-
+        counts = upsert_prices(cursor, price_data)
         conn.commit()
+        print(f"Prices stored: {counts['inserted']} inserted, {counts['updated']} updated (close was missing or zero), "
+              f"{counts['skipped']} skipped (close already non-zero)")
         cursor.close()
         conn.close()
     except mysql.connector.Error as err:
@@ -92,35 +94,32 @@ def insert_price_data(price_data):
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
 
-def is_data_up_to_date():
-    """Check if today's data already exists in the database and ensure no zero values exist."""
+def get_missing_tickers(tickers):
+    """Return the tickers (SPX included) without a non-zero close for today; all of them if the check fails."""
+    wanted = list(tickers) + ['SPX']
     try:
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor(dictionary=True)
+        conn = get_connection()
+        cursor = conn.cursor()
         today_date = datetime.utcnow().strftime('%Y-%m-%d')
 
         cursor.execute("""
-            SELECT ticker, close
+            SELECT ticker
             FROM prices
-            WHERE date = %s
+            WHERE date = %s AND close > 0
         """, (today_date,))
 
-        rows = cursor.fetchall()
+        stored = {row[0] for row in cursor.fetchall()}
 
         cursor.close()
         conn.close()
 
-        if not rows or any(row['close'] == 0 for row in rows):
-            return False
-
-        return True
+        return [ticker for ticker in wanted if ticker not in stored]
     except mysql.connector.Error as err:
         print(f"Error: {err}")
-        return False
+        return wanted
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
-        return False
-
+        return wanted
 
 def fetch_sp500_index():
     """Fetch the latest S&P 500 index value."""
@@ -128,10 +127,7 @@ def fetch_sp500_index():
     base_url = f"https://api.marketdata.app/v1/indices/quotes/{index_symbol}/"
     
     try:
-        headers = {"Authorization": f"Bearer {marketdata_api_key}"}
-        response = requests.get(base_url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
+        data = get_json(base_url, headers=AUTH_HEADERS)
 
         if data.get("s") == "ok":
             last_price = data['last'][0]
@@ -156,48 +152,59 @@ def fetch_sp500_index():
         print(f"An error occurred: {e}")
 
 
+def fetch_quote_batch(symbols):
+    """Fetch one bulkquotes batch; returns the price dicts of the symbols that came back with a close."""
+    data = get_json(BULKQUOTES_URL, params={"symbols": ','.join(symbols)}, headers=AUTH_HEADERS)
+
+    price_data = []
+    if data.get("s") == "ok" and "symbol" in data:
+        for idx, ticker in enumerate(data.get("symbol", [])):
+            close_price = data['last'][idx]
+            if close_price is not None and close_price > 0:
+                timestamp = int(data['updated'][idx])
+                date = datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%d')
+                price_data.append({'ticker': ticker, 'date': date, 'close': close_price})
+    return price_data
+
+def fetch_quotes(tickers, batch_size=BULKQUOTES_BATCH_SIZE, max_workers=FETCH_WORKERS):
+    """
+    Fetch quotes in batches of batch_size symbols, max_workers batches at a time.
+
+    A failed batch (after http_client's retries) only loses its own symbols. Returns
+    (price_data, missing tickers).
+    """
+    batches = [tickers[start:start + batch_size] for start in range(0, len(tickers), batch_size)]
+    price_data = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(fetch_quote_batch, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                price_data.extend(future.result())
+            except Exception as e:
+                print(f"Error fetching quotes for {batch[0]}..{batch[-1]} ({len(batch)} symbols): {e}")
+
+    fetched = {price['ticker'] for price in price_data}
+    return price_data, [ticker for ticker in tickers if ticker not in fetched]
+
 def fetch_and_store_prices(tickers):
-    if is_data_up_to_date():
+    # Only the tickers without a close for today are fetched (all of them on the first run of the day)
+    missing = get_missing_tickers(tickers)
+    if not missing:
         print("Today's data is already up-to-date. No API call made.")
         return
 
-    base_url = "https://api.marketdata.app/v1/stocks/bulkquotes/"
-    symbols = ','.join(tickers)
-    price_data = []
-
-    try:
-        headers = {"Authorization": f"Bearer {marketdata_api_key}"}
-        params = {"symbols": symbols}
-        response = requests.get(base_url, headers=headers, params=params)
-        response.raise_for_status()
-        data = response.json()
-
-        if data.get("s") == "ok" and "symbol" in data:
-            for idx, ticker in enumerate(data.get("symbol", [])):
-                close_price = data['last'][idx]
-                if close_price is not None and close_price > 0:
-                    timestamp = int(data['updated'][idx])
-                    date = datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%d')
-
-                    price_data.append({
-                        'ticker': ticker,
-                        'date': date,
-                        'close': close_price
-                    })
-                    print(f"Prepared data for {ticker} on {date} with close price {close_price}")
-            print(f"Fetched and prepared data for {len(price_data)} tickers.")
-        else:
-            print(f"No valid data returned for tickers: {tickers}")
-    
-    except requests.exceptions.HTTPError as http_err:
-        print(f"HTTP error occurred for tickers {tickers}: {http_err}")
-    except Exception as e:
-        print(f"An error occurred: {e}")
+    stock_tickers = [ticker for ticker in missing if ticker != 'SPX']
+    price_data, still_missing = fetch_quotes(stock_tickers)
+    print(f"Fetched {len(price_data)} of {len(stock_tickers)} missing tickers.")
+    if still_missing:
+        print(f"Still missing {len(still_missing)} tickers: {', '.join(still_missing)}")
 
     # Fetch S&P 500 index and add it to the price data
-    sp500_data = fetch_sp500_index()
-    if sp500_data:
-        price_data.append(sp500_data)
+    if 'SPX' in missing:
+        sp500_data = fetch_sp500_index()
+        if sp500_data:
+            price_data.append(sp500_data)
 
     if price_data:
         insert_price_data(price_data)
@@ -206,10 +213,15 @@ def exit_program():
     print("Exiting the program...")
     sys.exit(0)
 
+def main(argv=None):
+    """Script entry point, also called by main.py's pipeline."""
+    try:
+        fetch_and_store_prices(sp500_tickers)
+        exit_program()
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        exit_program()
+
 # Script execution
-try:
-    fetch_and_store_prices(sp500_tickers)
-    exit_program()
-except Exception as e:
-    print(f"An error occurred: {e}")
-    exit_program()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The scripts live at the repository root; replay mode lets the ingestion modules be imported
+# without API keys (their network calls are never made by the tests)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("API_MODE", "replay")
@@ -0,0 +1,88 @@
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from analyst_success import (HORIZON_DAYS, MAX_PRICE_AGE_DAYS, MIN_RESOLVED_RATINGS, PointInTimeAnalystRates,
+                             RollingAnalystSuccess, judge_calls)
+from price_store import AsOfPriceIndex
+
+RATED = date(2023, 1, 2)
+RESOLVED = RATED + timedelta(days=HORIZON_DAYS)
+
+def price_index(prices):
+    """AsOfPriceIndex over [(ticker, date, close), ...]."""
+    tickers, dates, closes = zip(*prices)
+    return AsOfPriceIndex(tickers, np.array(dates, dtype='datetime64[D]'), closes)
+
+def calls_frame(calls):
+    calls = pd.DataFrame(calls, columns=['analyst_name', 'ticker', 'date', 'price_target'])
+    calls['date'] = pd.to_datetime(calls['date'])
+    return calls
+
+def test_judge_calls_direction_and_stale_closes():
+    stale = MAX_PRICE_AGE_DAYS + 1
+    index = price_index([
+        ('AAA', RATED, 100.0), ('AAA', RESOLVED, 120.0),
+        ('OLD', RATED - timedelta(days=stale), 50.0), ('OLD', RESOLVED, 60.0),  # entry close too old
+        ('GONE', RATED, 80.0), ('GONE', RESOLVED - timedelta(days=stale), 90.0),  # delisted before the exit
+        ('EDGE', RATED - timedelta(days=MAX_PRICE_AGE_DAYS), 10.0), ('EDGE', RESOLVED, 5.0),
+    ])
+    calls = calls_frame([
+        ('Ann', 'AAA', RATED, 150.0),   # target above, price went up: success
+        ('Bob', 'AAA', RATED, 90.0),    # target below, price went up: failure
+        ('Cid', 'AAA', RATED, 100.0),   # target equal to the entry close: no direction
+        ('Ann', 'OLD', RATED, 70.0),
+        ('Ann', 'GONE', RATED, 100.0),
+        ('Bob', 'EDGE', RATED, 8.0),    # closes exactly MAX_PRICE_AGE_DAYS old still count
+        ('Ann', 'NONE', RATED, 10.0),   # never priced
+    ])
+
+    judged = judge_calls(calls, index)
+    assert list(zip(judged['analyst_name'], judged['ticker'], judged['success'])) == [
+        ('Ann', 'AAA', True), ('Bob', 'AAA', False), ('Bob', 'EDGE', True)]
+    assert (judged['resolved_on'] == np.datetime64(RESOLVED, 'D')).all()
+
+def judged_calls(rows):
+    """Judged calls from (analyst_name, resolved_on, success) rows, ordered like judge_calls' output."""
+    frame = pd.DataFrame(rows, columns=['analyst_name', 'resolved_on', 'success'])
+    frame['resolved_on'] = pd.to_datetime(frame['resolved_on'])
+    return frame.sort_values('resolved_on')
+
+def expected_rate(resolved, successful):
+    return round(successful / resolved, 4) if resolved >= MIN_RESOLVED_RATINGS else None
+
+def test_rolling_counts_only_calls_resolved_by_each_week():
+    weeks = [date(2024, 1, 7), date(2024, 1, 14), date(2024, 1, 21)]
+    rows = ([('Ann', weeks[0], True)] * 3 + [('Ann', weeks[0] - timedelta(days=3), False)] * 2
+            + [('Ann', weeks[1], True), ('Bob', weeks[1] - timedelta(days=1), False)]
+            + [('Bob', weeks[2] + timedelta(days=1), True)])  # resolves after the last week
+    rolling = RollingAnalystSuccess(judged_calls(rows))
+
+    snapshots = []
+    for week in weeks:
+        rolling.advance_to(week)
+        snapshots.append({row[1]: row[2:] for row in rolling.snapshot(week)})
+    assert snapshots[0] == {'Ann': (5, 3, expected_rate(5, 3))}
+    assert snapshots[1] == snapshots[2] == {'Ann': (6, 4, expected_rate(6, 4)), 'Bob': (1, 0, expected_rate(1, 0))}
+
+def test_rolling_resumes_from_stored_counts():
+    rows = [('Ann', date(2024, 1, 5), True), ('Ann', date(2024, 1, 12), False), ('Bob', date(2024, 1, 12), True)]
+    full = RollingAnalystSuccess(judged_calls(rows))
+    full.advance_to(date(2024, 1, 14))
+
+    first = RollingAnalystSuccess(judged_calls(rows[:1]))
+    first.advance_to(date(2024, 1, 7))
+    resumed = RollingAnalystSuccess(judged_calls(rows[1:]), counts=first.counts)
+    resumed.advance_to(date(2024, 1, 14))
+    assert resumed.snapshot(date(2024, 1, 14)) == full.snapshot(date(2024, 1, 14))
+
+def test_rates_as_of_uses_the_last_week_known_at_the_date():
+    weeks = [date(2024, 1, 7), date(2024, 1, 14)]
+    rates = PointInTimeAnalystRates(weeks, [{'Ann': 0.6, 'Bob': 0.2, 'Cid': 0.5}, {'Ann': 0.7, 'Bob': 0.3}])
+
+    assert rates.rates_as_of(date(2024, 1, 6)) == ({}, None)
+    assert rates.week_as_of(date(2024, 1, 6)) is None
+    # Between two snapshots the previous week's rates and median apply, never the next week's
+    assert rates.rates_as_of(date(2024, 1, 13)) == ({'Ann': 0.6, 'Bob': 0.2, 'Cid': 0.5}, 0.5)
+    assert rates.week_as_of(date(2024, 1, 13)) == weeks[0]
+    assert rates.rates_as_of(date(2024, 1, 14)) == ({'Ann': 0.7, 'Bob': 0.3}, 0.5)
+    assert rates.rates_as_of(date(2024, 6, 1))[0] == {'Ann': 0.7, 'Bob': 0.3}
@@ -0,0 +1,9 @@
+from analysts import unresolved_names
+
+def test_unresolved_names_leave_out_returned_and_failed_names():
+    requested = ['Jane Doe', 'John Roe', 'Ann Lee', 'Unknown Analyst']
+    returned = [{'name_full': ' jane doe '}, {'name_full': 'Ann Lee'}]
+    assert unresolved_names(requested, returned, failed_names=['John Roe']) == ['Unknown Analyst']
+
+def test_every_name_is_unresolved_when_nothing_comes_back():
+    assert unresolved_names(['Jane Doe', 'John Roe'], [], failed_names=[]) == ['Jane Doe', 'John Roe']
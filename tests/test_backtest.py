@@ -0,0 +1,123 @@
+from datetime import date, timedelta
+import numpy as np
+from backtest import INITIAL_VALUE, STRATEGIES, load_last_basket, select_portfolio, simulate_strategies, write_baskets
+from price_store import AsOfPriceIndex, LastValidPriceIndex
+
+DATES = [date(2024, 1, 7) + timedelta(weeks=week) for week in range(5)]
+TICKERS = ['AAA', 'BBB', 'CCC']
+PRICES = np.array([[10.0, 20.0, 5.0], [12.0, 18.0, 6.0], [15.0, 18.0, 4.0], [9.0, 24.0, 5.0], [10.0, 30.0, 5.0]])
+
+class FakePortfolioCursor:
+    """
+    One in-memory portfolio table answering the statements of load_last_basket, write_baskets and
+    portfolio_tables.update_sell_fields. Rows are dicts keyed by column name.
+    """
+
+    COLUMNS = ['date', 'ranking', 'ticker', 'stock_price', 'quantity', 'total_value',
+               'date_sell', 'stock_price_sell', 'total_value_sell', 'evolution']
+
+    def __init__(self):
+        self.rows = []
+        self.sell_updates = []
+        self.result = []
+        self.rowcount = 0
+
+    def execute(self, query, params=()):
+        query = " ".join(query.split())
+        if query.startswith("SELECT MAX(date)"):
+            self.result = [(max((row['date'] for row in self.rows), default=None),)]
+        elif query.startswith("SELECT ticker, stock_price, quantity, total_value"):
+            held = sorted((row for row in self.rows if row['date'] == params[0]), key=lambda row: row['ranking'])
+            self.result = [(row['ticker'], row['stock_price'], row['quantity'], row['total_value']) for row in held]
+        elif query.startswith("DELETE FROM portfolio_sell_updates"):
+            self.sell_updates = []
+        elif query.startswith("UPDATE"):
+            updates = {(update[0], update[1]): update[2:] for update in self.sell_updates}
+            self.rowcount = 0
+            for row in self.rows:
+                if (row['date'], row['ticker']) in updates:
+                    row.update(zip(self.COLUMNS[6:], updates[(row['date'], row['ticker'])]))
+                    self.rowcount += 1
+        elif not query.startswith("CREATE TEMPORARY TABLE"):
+            raise AssertionError(f"Unexpected statement: {query}")
+
+    def executemany(self, query, rows):
+        if "portfolio_sell_updates" in query:
+            self.sell_updates.extend(rows)
+        else:
+            self.rows.extend(dict(zip(self.COLUMNS, row)) for row in rows)
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
+
+def last_valid_index():
+    return LastValidPriceIndex(AsOfPriceIndex(np.repeat([TICKERS], len(DATES), axis=0).ravel(),
+                                              np.repeat(np.array(DATES, dtype='datetime64[D]'), len(TICKERS)),
+                                              PRICES.ravel()).positive_only())
+
+def candidates(week, expected_returns):
+    """One week's ranked analysis_simulation rows for {ticker: expected return}, priced at PRICES."""
+    rows = [(ticker, expected_return, PRICES[week, TICKERS.index(ticker)])
+            for ticker, expected_return in expected_returns.items()]
+    return sorted(rows, key=lambda row: -row[1])
+
+def test_week_without_candidates_keeps_the_holdings():
+    strategy = {'top_n': 2, 'min_expected_return': None, 'weighting': 'fixed'}
+    snapshots = {DATES[0]: candidates(0, {'AAA': 20, 'BBB': 10}),
+                 DATES[3]: candidates(3, {'CCC': 15})}
+    baskets = simulate_strategies({'t': strategy}, DATES[:4], snapshots, last_valid_index())['t']
+
+    assert [basket['date'] for basket in baskets] == [DATES[0], DATES[3]]
+    held = baskets[0]
+    assert held['tickers'] == ['AAA', 'BBB']
+    # Sold again every week it is held, last on the day the next basket is bought, same quantities
+    assert held['date_sell'] == DATES[3]
+    assert np.allclose(held['quantities'], [5.0, 2.5])
+    assert np.allclose(held['sell_values'], [45.0, 60.0])
+    assert np.isclose(baskets[1]['values'].sum() + baskets[1]['cash'], 105.0)
+
+def test_equal_strategy_buys_only_above_the_floor():
+    strategy = STRATEGIES['portfolio_min']
+    assert strategy['min_expected_return'] == 20 and strategy['weighting'] == 'equal'
+    week = [('AAA', 35.0, 10.0), ('BBB', 20.0, 20.0), ('CCC', 19.9, 5.0), ('DDD', None, 7.0)]
+
+    tickers, prices = select_portfolio(week, strategy)
+    assert tickers == ['AAA', 'BBB']
+    baskets = simulate_strategies({'portfolio_min': strategy}, DATES[:1], {DATES[0]: week}, last_valid_index())
+    basket, = baskets['portfolio_min']
+    assert np.allclose(basket['values'], INITIAL_VALUE / 2) and basket['cash'] == 0.0
+
+def test_nothing_above_the_floor_buys_nothing():
+    strategy = STRATEGIES['portfolio_min']
+    snapshots = {DATES[0]: candidates(0, {'AAA': 19.0, 'BBB': 5.0})}
+    assert simulate_strategies({'portfolio_min': strategy}, DATES[:2], snapshots, last_valid_index()) == {'portfolio_min': []}
+
+def test_resumed_backtest_matches_a_single_run():
+    # Four slots for at most two stocks: the resumed run must also recover the cash kept aside
+    strategy = {'top_n': 4, 'min_expected_return': None, 'weighting': 'fixed'}
+    snapshots = {DATES[0]: candidates(0, {'AAA': 20, 'BBB': 10}),
+                 DATES[1]: candidates(1, {'BBB': 30, 'CCC': 5}),
+                 DATES[3]: candidates(3, {'AAA': 15, 'CCC': 25}),
+                 DATES[4]: candidates(4, {'BBB': 12})}
+
+    single = FakePortfolioCursor()
+    write_baskets(single, 't', simulate_strategies({'t': strategy}, DATES, snapshots, last_valid_index())['t'])
+
+    resumed = FakePortfolioCursor()
+    write_baskets(resumed, 't', simulate_strategies({'t': strategy}, DATES[:3], snapshots, last_valid_index())['t'])
+    held = load_last_basket(resumed, 't')
+    assert held['date'] == DATES[1] and held['tickers'] == ['BBB', 'CCC'] and held['stored']
+    baskets = simulate_strategies({'t': strategy}, DATES, snapshots, last_valid_index(), held={'t': held})['t']
+    assert baskets[0] is held and [basket['date'] for basket in baskets[1:]] == [DATES[3], DATES[4]]
+    write_baskets(resumed, 't', baskets)
+
+    assert len(resumed.rows) == len(single.rows)
+    for resumed_row, single_row in zip(resumed.rows, single.rows):
+        for column, value in single_row.items():
+            if isinstance(value, (str, date)) or value is None:
+                assert resumed_row[column] == value, column
+            else:
+                assert np.isclose(float(resumed_row[column]), float(value)), column
@@ -0,0 +1,46 @@
+from db import PreparedStatements
+
+class FakePreparedCursor:
+    """Counts prepares like mysql-connector's prepared cursor: only a new query object is prepared again."""
+
+    def __init__(self, log):
+        self.log = log
+        self.executed = None
+        self.rowcount = 0
+
+    def execute(self, query, params):
+        if query is not self.executed:
+            self.log.append(('prepare', query))
+            self.executed = query
+        self.rowcount = len(params)
+
+    def close(self):
+        self.log.append(('close', self.executed))
+
+class FakeConnection:
+    def __init__(self):
+        self.log = []
+
+    def cursor(self, prepared=False):
+        assert prepared
+        return FakePreparedCursor(self.log)
+
+def query(rows):
+    # Built anew on every call, like the batch upserts do
+    return "INSERT INTO prices VALUES " + ", ".join(["(%s)"] * rows)
+
+def test_statements_are_prepared_once_per_connection():
+    conn = FakeConnection()
+    statements = PreparedStatements(conn)
+    for rows in (3, 3, 1, 3, 1):
+        assert statements.execute(query(rows), [0] * rows).rowcount == rows
+    assert conn.log == [('prepare', query(3)), ('prepare', query(1))]
+
+def test_least_recently_used_statement_is_closed():
+    conn = FakeConnection()
+    statements = PreparedStatements(conn, max_size=2)
+    for rows in (1, 2, 1, 3):
+        statements.execute(query(rows), [0] * rows)
+    assert ('close', query(2)) in conn.log and ('close', query(1)) not in conn.log
+    statements.close()
+    assert conn.log[-2:] == [('close', query(1)), ('close', query(3))]
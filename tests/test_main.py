@@ -0,0 +1,48 @@
+import sys
+import threading
+import types
+import main
+
+def fake_stage(name, calls, barrier=None, exit_code=None):
+    module = types.ModuleType(name)
+
+    def stage_main(argv=None):
+        if barrier is not None:
+            barrier.wait(timeout=5)  # both independent stages must be running at once
+        calls.append((name, argv))
+        if exit_code is not None:
+            sys.exit(exit_code)
+
+    module.main = stage_main
+    return module
+
+def test_independent_stages_run_concurrently_with_their_own_argv(monkeypatch):
+    calls = []
+    barrier = threading.Barrier(2)
+    stages = {
+        'a': {'module': 'stage_a', 'after': []},
+        'b': {'module': 'stage_b', 'after': []},
+        'c': {'module': 'stage_c', 'after': ['a', 'b']},
+    }
+    monkeypatch.setattr(main, 'STAGES', stages)
+    monkeypatch.setitem(sys.modules, 'stage_a', fake_stage('stage_a', calls, barrier))
+    monkeypatch.setitem(sys.modules, 'stage_b', fake_stage('stage_b', calls, barrier, exit_code=0))
+    monkeypatch.setitem(sys.modules, 'stage_c', fake_stage('stage_c', calls))
+    main_module, argv = sys.modules['__main__'], list(sys.argv)
+
+    results = main.run_pipeline(['a', 'b', 'c'])
+    assert {name: status for name, (status, _) in results.items()} == {'a': 'ok', 'b': 'ok', 'c': 'ok'}
+    assert calls[-1][0] == 'stage_c'
+    assert all(stage_argv == [] for _, stage_argv in calls)
+    assert sys.modules['__main__'] is main_module and sys.argv == argv
+
+def test_failed_stage_skips_its_dependents(monkeypatch):
+    calls = []
+    monkeypatch.setattr(main, 'STAGES', {'a': {'module': 'stage_a', 'after': []},
+                                         'c': {'module': 'stage_c', 'after': ['a']}})
+    monkeypatch.setitem(sys.modules, 'stage_a', fake_stage('stage_a', calls, exit_code=1))
+    monkeypatch.setitem(sys.modules, 'stage_c', fake_stage('stage_c', calls))
+
+    results = main.run_pipeline(['a', 'c'])
+    assert results['a'][0] == 'failed' and results['c'][0] == 'skipped'
+    assert [name for name, _ in calls] == ['stage_a']
@@ -0,0 +1,53 @@
+from datetime import date, timedelta
+import numpy as np
+from backtest import INITIAL_VALUE, simulate_strategies
+from parameter_sweep import simulate_grid, sweep
+from price_store import AsOfPriceIndex, LastValidPriceIndex
+
+GRID = {'min_analysts': [3], 'max_stddev': [100], 'min_expected_return': [None], 'top_n': [4], 'weighting': ['fixed', 'equal']}
+
+def test_fixed_weighting_keeps_unfilled_slots_in_cash():
+    # Two eligible stocks out of four slots; the first doubles in week 2, the second is flat
+    expected_return = np.array([[20.0, 10.0, np.nan], [20.0, 10.0, np.nan], [20.0, 10.0, np.nan]])
+    num_analysts = np.array([[5, 5, 1]] * 3, dtype='float64')
+    stddev = np.array([[10, 10, 10]] * 3, dtype='float64')
+    prices = np.array([[10.0, 5.0, 1.0], [20.0, 5.0, 1.0], [20.0, 5.0, 1.0]])
+
+    results = sweep(GRID, expected_return, num_analysts, stddev, prices).set_index('weighting')
+    periods = 2
+    # fixed: 1/4 of the value in the doubling stock -> +25%; equal: 1/2 -> +50%
+    assert np.isclose(results.loc['fixed', 'cagr'], 1.25 ** (52 / periods) - 1)
+    assert np.isclose(results.loc['equal', 'cagr'], 1.5 ** (52 / periods) - 1)
+    assert (results['avg_holdings'] == 2).all()
+
+def test_sweep_equity_matches_the_backtest_engine():
+    dates = [date(2024, 1, 7) + timedelta(weeks=week) for week in range(6)]
+    tickers = ['AAA', 'BBB', 'CCC']
+    prices = np.array([[10.0, 20.0, 5.0], [12.0, 18.0, 6.0], [15.0, 18.0, 4.0],
+                       [9.0, 24.0, 5.0], [10.0, 30.0, 5.0], [11.0, 27.0, 6.0]])
+    # Expected returns per week; NaN = not a candidate. Week 3 has no candidate, so the week 2
+    # basket is held for two weeks; CCC never qualifies
+    expected_return = np.array([[20.0, 10.0, np.nan], [5.0, 15.0, np.nan], [30.0, np.nan, np.nan],
+                                [np.nan, np.nan, np.nan], [10.0, 25.0, np.nan], [15.0, 12.0, np.nan]])
+    num_analysts = np.where(np.isnan(expected_return), np.nan, 5.0)
+    stddev = np.where(np.isnan(expected_return), np.nan, 10.0)
+
+    index = AsOfPriceIndex(np.repeat([tickers], len(dates), axis=0).ravel(),
+                           np.repeat(np.array(dates, dtype='datetime64[D]'), len(tickers)), prices.ravel())
+    snapshots = {day: sorted([(ticker, expected_return[week, t], prices[week, t])
+                              for t, ticker in enumerate(tickers) if not np.isnan(expected_return[week, t])],
+                             key=lambda row: -row[1])
+                 for week, day in enumerate(dates)}
+
+    for weighting in ('fixed', 'equal'):
+        strategy = {'top_n': 4, 'min_expected_return': None, 'weighting': weighting}
+        baskets = simulate_strategies({'table': strategy}, dates, snapshots, LastValidPriceIndex(index.positive_only()))['table']
+        grid = {'min_analysts': [1], 'max_stddev': [100], 'min_expected_return': [None], 'top_n': [4],
+                'weighting': [weighting]}
+        (_, _, _, _, _, equity), = simulate_grid(grid, expected_return, num_analysts, stddev, prices)
+
+        # The backtest's value on each rebalancing date, stocks and cash, against the sweep's curve
+        for basket in baskets[1:]:
+            week = dates.index(basket['date'])
+            assert np.isclose((basket['values'].sum() + basket['cash']) / INITIAL_VALUE, equity[0, week - 1]), (weighting, week)
+        assert [basket['date'] for basket in baskets] == [dates[w] for w in (0, 1, 2, 4, 5)]
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+from price_store import AsOfPriceIndex, PriceStore
+
+def random_history(seed=0):
+    rng = np.random.default_rng(seed)
+    days = np.arange('2024-01-01', '2024-04-01', dtype='datetime64[D]')
+    tickers, dates, closes = [], [], []
+    for ticker in ['AAA', 'BBB', 'CCC', 'DDD']:
+        for day in days[rng.random(len(days)) < 0.4]:
+            tickers.append(ticker)
+            dates.append(day)
+            closes.append(round(rng.uniform(0, 100), 2))
+    return np.array(tickers), np.array(dates, dtype='datetime64[D]'), np.array(closes)
+
+def brute_force_close(tickers, dates, closes, ticker, date):
+    known = (tickers == ticker) & (dates <= date)
+    if not known.any():
+        return np.nan
+    return closes[known][np.argmax(dates[known])]
+
+def test_closes_at_matches_brute_force():
+    tickers, dates, closes = random_history()
+    index = AsOfPriceIndex(tickers, dates, closes)
+    rng = np.random.default_rng(1)
+    query_tickers = rng.choice(['AAA', 'BBB', 'CCC', 'DDD', 'ZZZ'], 500)
+    query_dates = np.datetime64('2023-12-20') + rng.integers(0, 120, 500).astype('timedelta64[D]')
+
+    expected = [brute_force_close(tickers, dates, closes, t, d) for t, d in zip(query_tickers, query_dates)]
+    assert np.allclose(index.closes_at(query_tickers, query_dates), expected, equal_nan=True)
+
+def test_lookup_matches_closes_at():
+    tickers, dates, closes = random_history(2)
+    index = AsOfPriceIndex(tickers, dates, closes)
+    found, found_closes, _ = index.lookup('2024-02-15')
+    assert np.allclose(found_closes, index.closes_at(found, np.full(len(found), np.datetime64('2024-02-15'))))
+
+def test_empty_index_and_store():
+    index = AsOfPriceIndex([], np.array([], dtype='datetime64[D]'), [])
+    assert np.isnan(index.closes_at(['AAA'], np.array(['2024-01-01'], dtype='datetime64[D]'))).all()
+    assert PriceStore.empty().closes_as_of(['2024-01-01']).shape == (1, 0)
+
+def test_store_as_of_uses_the_index():
+    tickers, dates, closes = random_history(3)
+    store = PriceStore.empty().merge(pd.DataFrame({'ticker': tickers, 'date': dates, 'close': closes}))
+    query_dates = np.array(['2023-12-31', '2024-01-15', '2024-03-31'], dtype='datetime64[D]')
+    frame = store.closes_as_of(query_dates)
+    for date in query_dates:
+        for ticker in store.tickers:
+            assert np.allclose(frame.loc[pd.Timestamp(date), ticker],
+                               brute_force_close(tickers, dates, closes, ticker, date), equal_nan=True)
+
+def test_closes_at_max_age_rejects_old_closes():
+    index = AsOfPriceIndex(['AAA', 'AAA'], np.array(['2024-01-01', '2024-01-10'], dtype='datetime64[D]'), [1.0, 2.0])
+    dates = np.array(['2024-01-05', '2024-01-12', '2024-02-01'], dtype='datetime64[D]')
+    assert np.allclose(index.closes_at(['AAA'] * 3, dates, max_age_days=7), [1.0, 2.0, np.nan], equal_nan=True)
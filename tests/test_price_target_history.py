@@ -0,0 +1,28 @@
+from datetime import date
+from price_target_history import chunk_date_range, plan_backfill_jobs
+
+def test_month_chunks_are_calendar_aligned():
+    assert chunk_date_range(date(2024, 1, 15), date(2024, 3, 10), 'month') == [
+        (date(2024, 1, 15), date(2024, 1, 31)),
+        (date(2024, 2, 1), date(2024, 2, 29)),
+        (date(2024, 3, 1), date(2024, 3, 10)),
+    ]
+
+def test_quarter_chunks_cross_the_year():
+    assert chunk_date_range(date(2023, 11, 1), date(2024, 4, 1), 'quarter') == [
+        (date(2023, 11, 1), date(2023, 12, 31)),
+        (date(2024, 1, 1), date(2024, 3, 31)),
+        (date(2024, 4, 1), date(2024, 4, 1)),
+    ]
+
+def test_single_day_range():
+    assert chunk_date_range(date(2024, 5, 31), date(2024, 5, 31), 'month') == [(date(2024, 5, 31), date(2024, 5, 31))]
+
+def test_completed_jobs_are_not_planned_again():
+    completed = {('AAPL', date(2024, 1, 1), date(2024, 1, 31))}
+    jobs = plan_backfill_jobs(['AAPL', 'MSFT'], date(2024, 1, 1), date(2024, 2, 29), 'month', completed)
+    assert jobs == [
+        ('AAPL', date(2024, 2, 1), date(2024, 2, 29)),
+        ('MSFT', date(2024, 1, 1), date(2024, 1, 31)),
+        ('MSFT', date(2024, 2, 1), date(2024, 2, 29)),
+    ]
@@ -0,0 +1,137 @@
+import math
+import sqlite3
+from datetime import date
+import pandas as pd
+import pytest
+from price_target_stats import IncrementalPriceTargetStats, compare_statistics, compute_price_target_statistics
+
+DAYS_RECENT = 30
+THRESHOLD = 0.5
+
+# (ticker, analyst_name, date, adjusted_pt_current)
+RATINGS = [
+    ('AAPL', 'Ann', date(2024, 1, 2), 180.0),
+    ('AAPL', 'Ann', date(2024, 2, 20), 200.0),   # supersedes Ann's January target
+    ('AAPL', 'Bob', date(2024, 1, 10), 150.0),
+    ('AAPL', 'Bob', date(2024, 1, 10), 155.0),   # two targets on Bob's latest date both count
+    ('AAPL', 'Cid', date(2024, 2, 25), None),    # no target: counted as an analyst, not in the averages
+    ('AAPL', 'Zed', date(2024, 2, 1), 500.0),    # not in analysts: dropped by the inner join
+    ('MSFT', 'Ann', date(2023, 11, 5), 390.0),
+    ('MSFT', 'Dup', date(2024, 2, 28), 420.0),   # two analysts rows share this name
+    ('MSFT', 'Bob', date(2024, 3, 20), 410.0),   # only visible from the last analysis date
+    ('TSLA', 'Zed', date(2024, 1, 5), 250.0),    # no rated analyst at all
+]
+ANALYSTS = [('Ann', 0.7), ('Bob', 0.4), ('Cid', 0.9), ('Dup', 0.6), ('Dup', 0.3)]
+ANALYSIS_DATES = [date(2024, 1, 5), date(2024, 2, 26), date(2024, 3, 1), date(2024, 3, 31)]
+
+class PopulationStddev:
+    """MySQL's STDDEV for sqlite: population standard deviation, NULL for an empty set."""
+
+    def __init__(self):
+        self.values = []
+
+    def step(self, value):
+        if value is not None:
+            self.values.append(value)
+
+    def finalize(self):
+        if not self.values:
+            return None
+        mean = sum(self.values) / len(self.values)
+        return math.sqrt(sum((v - mean) ** 2 for v in self.values) / len(self.values))
+
+# analysis_simulation.calculate_price_target_statistics' query in sqlite's dialect
+SQL = """
+    SELECT
+        r.ticker,
+        AVG(r.adjusted_pt_current),
+        STDDEV(r.adjusted_pt_current),
+        COUNT(DISTINCT r.analyst_name),
+        MAX(r.date),
+        AVG(julianday(:analysis_date) - julianday(r.date)),
+        COUNT(DISTINCT CASE WHEN r.date >= date(:analysis_date, :recent) THEN r.analyst_name END),
+        STDDEV(CASE WHEN r.date >= date(:analysis_date, :recent) THEN r.adjusted_pt_current END),
+        AVG(CASE WHEN r.date >= date(:analysis_date, :recent) THEN r.adjusted_pt_current END),
+        COUNT(DISTINCT CASE WHEN a.overall_success_rate > :threshold THEN r.analyst_name END),
+        STDDEV(CASE WHEN a.overall_success_rate > :threshold THEN r.adjusted_pt_current END),
+        AVG(CASE WHEN a.overall_success_rate > :threshold THEN r.adjusted_pt_current END),
+        COUNT(DISTINCT CASE WHEN r.date >= date(:analysis_date, :recent) AND a.overall_success_rate > :threshold THEN r.analyst_name END),
+        STDDEV(CASE WHEN r.date >= date(:analysis_date, :recent) AND a.overall_success_rate > :threshold THEN r.adjusted_pt_current END),
+        AVG(CASE WHEN r.date >= date(:analysis_date, :recent) AND a.overall_success_rate > :threshold THEN r.adjusted_pt_current END)
+    FROM (
+        SELECT ticker, analyst_name, MAX(date) AS latest_date
+        FROM ratings
+        WHERE date <= :analysis_date
+        GROUP BY ticker, analyst_name
+    ) AS latest_ratings
+    JOIN ratings AS r
+    ON latest_ratings.ticker = r.ticker
+    AND latest_ratings.analyst_name = r.analyst_name
+    AND latest_ratings.latest_date = r.date
+    JOIN analysts AS a ON r.analyst_name = a.name_full
+    GROUP BY r.ticker
+"""
+
+@pytest.fixture(scope="module")
+def sql_statistics():
+    """Statistics computed by the SQL query for every analysis date, keyed by date."""
+    db = sqlite3.connect(":memory:")
+    db.create_aggregate("STDDEV", 1, PopulationStddev)
+    db.execute("CREATE TABLE ratings (ticker TEXT, analyst_name TEXT, date TEXT, adjusted_pt_current REAL)")
+    db.execute("CREATE TABLE analysts (name_full TEXT, overall_success_rate REAL)")
+    db.executemany("INSERT INTO ratings VALUES (?, ?, ?, ?)",
+                   [(ticker, name, day.isoformat(), pt) for ticker, name, day, pt in RATINGS])
+    db.executemany("INSERT INTO analysts VALUES (?, ?)", ANALYSTS)
+
+    statistics = {}
+    for analysis_date in ANALYSIS_DATES:
+        rows = db.execute(SQL, {'analysis_date': analysis_date.isoformat(), 'recent': f"-{DAYS_RECENT} days",
+                                'threshold': THRESHOLD}).fetchall()
+        statistics[analysis_date] = [row[:4] + (date.fromisoformat(row[4]),) + row[5:] for row in rows]
+    db.close()
+    return statistics
+
+def incremental_statistics():
+    rates = {}
+    for name, rate in ANALYSTS:
+        rates.setdefault(name, []).append(rate)
+    engine = IncrementalPriceTargetStats(sorted(RATINGS, key=lambda rating: rating[2]), rates, DAYS_RECENT, THRESHOLD)
+    return {analysis_date: engine.advance_to(analysis_date) for analysis_date in ANALYSIS_DATES}
+
+def pandas_statistics():
+    ratings = pd.DataFrame(RATINGS, columns=['ticker', 'analyst_name', 'date', 'adjusted_pt_current'])
+    ratings['date'] = pd.to_datetime(ratings['date'])
+    ratings['adjusted_pt_current'] = ratings['adjusted_pt_current'].astype('float64')
+    analysts = pd.DataFrame(ANALYSTS, columns=['name_full', 'overall_success_rate'])
+    return {analysis_date: compute_price_target_statistics(ratings, analysts, analysis_date, DAYS_RECENT, THRESHOLD,
+                                                           as_of=True)
+            for analysis_date in ANALYSIS_DATES}
+
+def test_fixture_exercises_every_column(sql_statistics):
+    aapl = {row[0]: row for row in sql_statistics[date(2024, 2, 26)]}['AAPL']
+    assert aapl[3] == 3                     # Ann, Bob and Cid; Zed is not in analysts
+    assert aapl[9] == 2                     # Ann and Cid above the threshold
+    assert aapl[12] == 2                    # both rated within DAYS_RECENT
+    assert 'TSLA' not in {row[0] for row in sql_statistics[date(2024, 3, 31)]}
+
+@pytest.mark.parametrize("engine", [incremental_statistics, pandas_statistics])
+def test_engine_matches_sql(engine, sql_statistics):
+    statistics = engine()
+    for analysis_date in ANALYSIS_DATES:
+        assert compare_statistics(sql_statistics[analysis_date], statistics[analysis_date]) == [], analysis_date
+
+def test_incremental_matches_pandas():
+    incremental, vectorized = incremental_statistics(), pandas_statistics()
+    for analysis_date in ANALYSIS_DATES:
+        assert compare_statistics(vectorized[analysis_date], incremental[analysis_date]) == [], analysis_date
+
+def test_compare_statistics_reports_differences():
+    expected = incremental_statistics()[date(2024, 3, 31)]
+    altered = [row[:3] + (row[3] + 1,) + row[4:] if row[0] == 'MSFT' else row for row in expected]
+    assert compare_statistics(expected, altered) == ["MSFT: column num_analysts expected 3, got 4"]
+    assert compare_statistics(expected, [row for row in expected if row[0] != 'MSFT']) == ["MSFT: only in expected"]
+
+def test_ratings_after_the_analysis_date_are_ignored():
+    statistics = {row[0]: row for row in incremental_statistics()[date(2024, 3, 1)]}
+    assert statistics['MSFT'][3] == 2       # Ann and Dup; Bob's March rating is not published yet
+    assert statistics['MSFT'][4] == date(2024, 2, 28)
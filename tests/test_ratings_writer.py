@@ -0,0 +1,65 @@
+import re
+import mysql.connector
+from ratings_writer import RATING_COLUMNS, upsert_ratings
+
+class FakeRatingsCursor:
+    """
+    In-memory ratings table answering upsert_ratings' two statements with MySQL's semantics:
+    INSERT ... ON DUPLICATE KEY UPDATE reports 1 affected row per insert, 2 per changed row and
+    0 per identical row. A rating whose notes are 'reject' fails like a bad row would.
+    """
+
+    def __init__(self, rows=()):
+        self.table = {row['id']: row for row in rows}
+        self.rowcount = -1
+        self.result = []
+
+    def execute(self, query, params):
+        if query.startswith("SELECT id FROM ratings"):
+            self.result = [(rating_id,) for rating_id in params if rating_id in self.table]
+            return
+        update_columns = re.findall(r"(\w+) = VALUES\(\1\)", query)
+        rows = [dict(zip(RATING_COLUMNS, params[i:i + len(RATING_COLUMNS)]))
+                for i in range(0, len(params), len(RATING_COLUMNS))]
+        if any(row['notes'] == 'reject' for row in rows):
+            raise mysql.connector.Error("Data too long for column 'notes'")
+        self.rowcount = 0
+        for row in rows:
+            stored = self.table.get(row['id'])
+            if stored is None:
+                self.table[row['id']] = row
+                self.rowcount += 1
+            elif any(stored[column] != row[column] for column in update_columns):
+                stored.update({column: row[column] for column in update_columns})
+                self.rowcount += 2
+
+    def fetchall(self):
+        return self.result
+
+def rating(rating_id, pt, notes=''):
+    return {'id': rating_id, 'ticker': 'AAPL', 'date': '2024-01-02', 'analyst_name': 'Jane Doe',
+            'adjusted_pt_current': pt, 'notes': notes}
+
+def test_counts_inserted_updated_and_unchanged():
+    cursor = FakeRatingsCursor()
+    upsert_ratings(cursor, [rating('a', 100), rating('b', 110)])
+
+    stats = upsert_ratings(cursor, [rating('a', 100), rating('b', 120), rating('c', 130)])
+    assert stats == {'inserted': 1, 'updated': 1, 'unchanged': 1, 'failed': 0}
+    assert cursor.table['b']['adjusted_pt_current'] == 120.0
+
+def test_duplicate_ids_in_one_call_are_counted_once():
+    stats = upsert_ratings(FakeRatingsCursor(), [rating('a', 100), rating('a', 105)])
+    assert stats == {'inserted': 1, 'updated': 0, 'unchanged': 0, 'failed': 0}
+
+def test_failed_batch_falls_back_to_single_rows():
+    cursor = FakeRatingsCursor()
+    stats = upsert_ratings(cursor, [rating('a', 100), rating('b', 110, notes='reject'), rating('c', 120)], batch_size=10)
+    assert stats == {'inserted': 2, 'updated': 0, 'unchanged': 0, 'failed': 1}
+    assert set(cursor.table) == {'a', 'c'}
+
+def test_batches_split_the_rows():
+    cursor = FakeRatingsCursor()
+    stats = upsert_ratings(cursor, [rating(str(i), 100 + i) for i in range(7)], batch_size=3)
+    assert stats['inserted'] == 7
+    assert len(cursor.table) == 7
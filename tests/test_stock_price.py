@@ -0,0 +1,60 @@
+from stock_price import upsert_prices
+
+class FakePricesCursor:
+    """
+    In-memory prices table answering upsert_prices' two statements with MySQL's semantics: the
+    conditional ON DUPLICATE KEY UPDATE only replaces a NULL or zero close, and rowcount is 1 per
+    insert, 2 per changed row and 0 per row left as it was.
+    """
+
+    def __init__(self, closes=None):
+        self.closes = dict(closes or {})  # (ticker, date) -> close
+        self.rowcount = -1
+        self.result = []
+
+    def execute(self, query, params):
+        if query.startswith("SELECT COUNT(*) FROM prices"):
+            keys = list(zip(params[0::2], params[1::2]))
+            self.result = [(sum(key in self.closes for key in keys),)]
+            return
+        assert "close = IF(close IS NULL OR close = 0, VALUES(close), close)" in query
+        self.rowcount = 0
+        for ticker, date, close in zip(params[0::3], params[1::3], params[2::3]):
+            if (ticker, date) not in self.closes:
+                self.closes[(ticker, date)] = close
+                self.rowcount += 1
+                continue
+            stored = self.closes[(ticker, date)]
+            new = close if stored is None or stored == 0 else stored
+            if new != stored:
+                self.closes[(ticker, date)] = new
+                self.rowcount += 2
+
+    def fetchone(self):
+        return self.result[0]
+
+def price(ticker, close, date='2024-05-31'):
+    return {'ticker': ticker, 'date': date, 'close': close}
+
+def test_counts_inserted_updated_and_skipped():
+    cursor = FakePricesCursor({('AAPL', '2024-05-31'): 0, ('MSFT', '2024-05-31'): None,
+                               ('NVDA', '2024-05-31'): 1100.0, ('TSLA', '2024-05-31'): 0})
+    counts = upsert_prices(cursor, [price('AAPL', 192.0), price('MSFT', 415.0), price('NVDA', 1096.0),
+                                    price('TSLA', 0), price('AMZN', 176.0)])
+
+    assert counts == {'inserted': 1, 'updated': 2, 'skipped': 2}
+    assert cursor.closes[('AAPL', '2024-05-31')] == 192.0     # zero close replaced
+    assert cursor.closes[('MSFT', '2024-05-31')] == 415.0     # missing close replaced
+    assert cursor.closes[('NVDA', '2024-05-31')] == 1100.0    # non-zero close kept
+    assert cursor.closes[('AMZN', '2024-05-31')] == 176.0
+
+def test_rerun_skips_every_stored_close():
+    cursor = FakePricesCursor()
+    prices = [price('AAPL', 192.0), price('AAPL', 191.0, date='2024-05-30')]
+    assert upsert_prices(cursor, prices) == {'inserted': 2, 'updated': 0, 'skipped': 0}
+    assert upsert_prices(cursor, prices) == {'inserted': 0, 'updated': 0, 'skipped': 2}
+
+def test_duplicate_quotes_are_counted_once():
+    cursor = FakePricesCursor()
+    assert upsert_prices(cursor, [price('AAPL', 190.0), price('AAPL', 192.0)]) == {'inserted': 1, 'updated': 0, 'skipped': 0}
+    assert cursor.closes[('AAPL', '2024-05-31')] == 192.0
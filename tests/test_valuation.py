@@ -0,0 +1,24 @@
+from decimal import Decimal
+import numpy as np
+from valuation import buy_basket, sell_basket, to_array, to_decimals
+
+def test_buy_basket_splits_value_equally():
+    quantities, values = buy_basket(100.0, [10.0, 20.0, 50.0, 25.0])
+    assert np.allclose(values, 25.0)
+    assert np.allclose(quantities, [2.5, 1.25, 0.5, 1.0])
+
+def test_buy_basket_with_free_slots_leaves_cash_uninvested():
+    quantities, values = buy_basket(100.0, [10.0, 20.0], slots=10)
+    assert np.allclose(values, 10.0)
+    assert np.allclose(quantities, [1.0, 0.5])
+    assert values.sum() == 20.0
+
+def test_sell_basket_values_and_evolution():
+    sell_values, evolution = sell_basket([2.0, 0.5], [20.0, 10.0], [12.0, 18.0])
+    assert np.allclose(sell_values, [24.0, 9.0])
+    assert np.allclose(evolution, [4.0, -1.0])
+
+def test_round_trip_through_decimals():
+    prices = to_array([Decimal("10.25"), None, 3])
+    assert np.isnan(prices[1])
+    assert to_decimals(prices, 2) == [Decimal("10.25"), None, Decimal("3.00")]
@@ -0,0 +1,32 @@
+from decimal import Decimal
+import numpy as np
+
+# Decimal places used when float64 results are written back to MySQL
+PRICE_PLACES = 2
+QUANTITY_PLACES = 6
+VALUE_PLACES = 6
+
+def to_array(values):
+    """Prices, quantities or values (Decimal, float or None) as a float64 array, None -> NaN."""
+    return np.array([np.nan if value is None else float(value) for value in values], dtype='float64')
+
+def to_decimals(values, places):
+    """float64 array -> list of Decimal rounded to `places`, NaN -> None; only used at the DB boundary."""
+    return [None if np.isnan(value) else Decimal(f"{value:.{places}f}") for value in np.asarray(values, dtype='float64').tolist()]
+
+def buy_basket(portfolio_value, prices, slots=None):
+    """
+    Split portfolio_value over a basket bought at `prices`.
+
+    slots defaults to the basket size; a larger value leaves part of the value uninvested (the
+    historical top-10 behaviour when fewer stocks qualify). Returns (quantities, allocated values).
+    """
+    prices = np.asarray(prices, dtype='float64')
+    per_stock = portfolio_value / (slots or len(prices))
+    values = np.full(len(prices), per_stock)
+    return values / prices, values
+
+def sell_basket(quantities, cost_values, sell_prices):
+    """Value a held basket at `sell_prices`: returns (sell values, evolution = sell value - cost)."""
+    sell_values = np.asarray(quantities, dtype='float64') * np.asarray(sell_prices, dtype='float64')
+    return sell_values, sell_values - np.asarray(cost_values, dtype='float64')